@@ -11,16 +11,24 @@ This version:
 """
 
 import os
+import sys
 import time
 import random
 import io
+import numpy as np
 import psycopg2
 from contextlib import contextmanager
 
+# Binary COPY encoder shared with the database-benchmarking suite
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "..", "database-benchmarking"))
+from pg_binary_copy import encode_binary_copy
+
 # === CONFIGURATION ===
 
 NUM_ROWS   = 10_000_000
 COPY_BATCH = 50_000
+COPY_FORMAT = os.getenv("COPY_FORMAT", "text")  # "text" or "binary"
 
 PG_PRIMARY_DSN    = os.getenv(
     "PG_PRIMARY_DSN",
@@ -102,32 +110,52 @@ def setup_table(pg_conn, distributed=False):
     print(f"✔ {'Citus' if distributed else 'Postgres'} table set up")
 
 
-def bulk_insert(pg_conn, num_rows, batch_size=COPY_BATCH):
+def binary_batch(rng, n):
+    """
+    One batch as a binary COPY payload, generated and packed as NumPy arrays
+    instead of formatting every row as text.
+    """
+    now_us = int(time.time() * 1_000_000)
+    sid = rng.integers(1, 101, n).astype(np.int32)
+    ts  = now_us - (rng.random(n) * 365 * 24 * 3600 * 1_000_000).astype(np.int64)
+    val = rng.random(n) * 100.0
+    return io.BytesIO(encode_binary_copy([sid, ts, val], ["int4", "timestamptz", "float8"]))
+
+
+def bulk_insert(pg_conn, num_rows, batch_size=COPY_BATCH, copy_format=COPY_FORMAT):
     total = 0
     t0 = time.time()
     batches = (num_rows + batch_size - 1) // batch_size
+    rng = np.random.default_rng()
 
     for b in range(batches):
         this_batch = min(batch_size, num_rows - total)
-        buf = io.StringIO()
-        for _ in range(this_batch):
-            sid    = random.randint(1, 100)
-            ts     = time.time() - random.random() * 365 * 24 * 3600
-            ts_iso = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
-            val    = random.random() * 100.0
-            buf.write(f"{sid}\t{ts_iso}\t{val}\n")
-        buf.seek(0)
 
-        with pg_conn.cursor() as cur:
-            # `Copy from`` is the fastest way to insert large amounts of data in pg
-            # It reads direcly from a the in-memory buffer in one short, inserting all rows at once
-            cur.copy_from(buf, "sensor_data", columns=("sensor_id","timestamp","value"))
+        if copy_format == "binary":
+            with pg_conn.cursor() as cur:
+                cur.copy_expert(
+                    "COPY sensor_data (sensor_id, timestamp, value) FROM STDIN WITH (FORMAT binary)",
+                    binary_batch(rng, this_batch))
+        else:
+            buf = io.StringIO()
+            for _ in range(this_batch):
+                sid    = random.randint(1, 100)
+                ts     = time.time() - random.random() * 365 * 24 * 3600
+                ts_iso = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+                val    = random.random() * 100.0
+                buf.write(f"{sid}\t{ts_iso}\t{val}\n")
+            buf.seek(0)
+
+            with pg_conn.cursor() as cur:
+                # `Copy from`` is the fastest way to insert large amounts of data in pg
+                # It reads direcly from a the in-memory buffer in one short, inserting all rows at once
+                cur.copy_from(buf, "sensor_data", columns=("sensor_id","timestamp","value"))
 
         total += this_batch
         if (b+1) % 5 == 0 or b == batches-1:
             print(f"  Inserted {total}/{num_rows} rows in {time.time()-t0:.1f}s")
 
-    print(f"✔ Bulk insert of {total} rows done in {time.time()-t0:.1f}s")
+    print(f"✔ Bulk insert of {total} rows ({copy_format}) done in {time.time()-t0:.1f}s")
 
 
 def run_queries(pg_conn):
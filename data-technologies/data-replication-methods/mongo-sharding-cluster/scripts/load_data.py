@@ -1,23 +1,106 @@
+"""
+Loads 1M events into bench.events through mongos and reports where they landed.
+
+    PRESPLIT=16 GROUP_BY_SHARD=1 python load_data.py
+
+PRESPLIT=N drops and re-shards the collection, splits it into N chunks at
+evenly spaced hashed-userId boundaries and spreads them round-robin over the
+shards before loading, so the balancer has nothing to move. GROUP_BY_SHARD=1
+routes every document client-side: userId is hashed the way mongod hashes it,
+looked up in the chunk map from config.chunks and buffered per shard, so each
+insert_many targets a single shard instead of being split by mongos.
+
+After the load it prints docs and chunks per shard, the skew (largest shard
+over the mean) and the chunk migrations committed while loading.
+"""
+import hashlib
 import os, time, random, string
+import struct
+from bisect import bisect_right
+from collections import Counter
 from datetime import datetime, timedelta
+
+from bson import Int64, MinKey
 from pymongo import MongoClient, ASCENDING
 
-MONGO_URI = "mongodb://localhost:27017"
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB = "bench"
 COLL = "events"
-TOTAL = 1_000_000
-BATCH = 10_000
+NS = f"{DB}.{COLL}"
+SHARD_KEY = {"userId": "hashed", "createdAt": 1}
+TOTAL = int(os.getenv("TOTAL", 1_000_000))
+BATCH = int(os.getenv("BATCH", 10_000))
 USERS = 1_000
+PRESPLIT = int(os.getenv("PRESPLIT", 0))  # chunks to pre-split into, 0 = leave as is
+GROUP_BY_SHARD = os.getenv("GROUP_BY_SHARD", "0") == "1"
+ROUTES_REFRESH_S = 5.0  # re-read the chunk map, the balancer may have moved chunks
+
+
+def hashed(value):
+    """
+    mongod's hashed-index value for an integer: the first 8 bytes (little
+    endian) of md5(seed 0, canonical numeric type 10, value as int64).
+    """
+    digest = hashlib.md5(struct.pack("<iiq", 0, 10, value)).digest()
+    return struct.unpack("<q", digest[:8])[0]
+
+
+def collection_uuid(client):
+    return client.config.collections.find_one({"_id": NS})["uuid"]
+
+
+def chunks(client):
+    return list(client.config.chunks.find({"uuid": collection_uuid(client)}).sort("min", ASCENDING))
+
+
+def chunk_start(chunk):
+    start = chunk["min"]["userId"]
+    return -2**63 if isinstance(start, MinKey) else int(start)
+
+
+def presplit(client, n):
+    """Re-shard an empty bench.events and spread n hashed-range chunks over the shards."""
+    admin, coll = client.admin, client[DB][COLL]
+    coll.drop()
+    admin.command("shardCollection", NS, key=SHARD_KEY)
+    coll.create_index([("createdAt", 1)])
+    coll.create_index([("type", 1), ("createdAt", -1)])
+
+    t0 = time.time()
+    for i in range(1, n):
+        boundary = -2**63 + i * (2**64 // n)
+        admin.command("split", NS, middle={"userId": Int64(boundary), "createdAt": MinKey()})
+
+    shards = sorted(s["_id"] for s in client.config.shards.find())
+    moved = 0
+    for i, chunk in enumerate(chunks(client)):
+        target = shards[i % len(shards)]
+        if chunk["shard"] != target:
+            admin.command("moveChunk", NS, bounds=[chunk["min"], chunk["max"]], to=target)
+            moved += 1
+    print(f"Pre-split {NS} into {n} chunks over {len(shards)} shards "
+          f"({moved} moved) in {time.time()-t0:.1f}s")
+
+
+class ShardRouter:
+    """Maps a userId to the shard owning its hashed range, from config.chunks."""
 
-client = MongoClient(MONGO_URI)
-coll = client[DB][COLL]
+    def __init__(self, client):
+        self.client = client
+        self.user_hash = {u: hashed(u) for u in range(1, USERS + 1)}
+        self.refresh()
 
-print(f"Connecting to {MONGO_URI} ...")
-coll.database.command("ping")
-print("Connected. Inserting...")
+    def refresh(self):
+        table = chunks(self.client)
+        self.starts = [chunk_start(c) for c in table]
+        self.shards = [c["shard"] for c in table]
+        self.loaded_at = time.time()
+
+    def shard_for(self, user_id):
+        # Chunks can also be split on createdAt within one hash value; routing on
+        # the hash alone then picks the first of them, mongos still corrects it
+        return self.shards[bisect_right(self.starts, self.user_hash[user_id]) - 1]
 
-start = time.time()
-base = datetime.utcnow() - timedelta(days=30)
 
 def rand_user():
     return random.randint(1, USERS)
@@ -32,28 +115,91 @@ def rand_payload():
         "ok": random.choice([True, False])
     }
 
-inserted = 0
-while inserted < TOTAL:
-    batch = []
-    for _ in range(min(BATCH, TOTAL-inserted)):
-        ts = base + timedelta(seconds=random.randint(0, 30*24*3600))
+
+def load(coll, router=None):
+    """Insert TOTAL events, buffered per target shard when a router is given."""
+    start = time.time()
+    base = datetime.utcnow() - timedelta(days=30)
+    buffers = {}
+    sent_per_shard = Counter()
+    inserted = 0
+    reported = 0
+
+    def flush(key):
+        nonlocal inserted
+        batch = buffers.pop(key)
+        res = coll.insert_many(batch, ordered=False)
+        inserted += len(res.inserted_ids)
+        sent_per_shard[key] += len(batch)
+
+    for _ in range(TOTAL):
+        user = rand_user()
         doc = {
-            "userId": rand_user(),
-            "createdAt": ts,
+            "userId": user,
+            "createdAt": base + timedelta(seconds=random.randint(0, 30*24*3600)),
             "type": rand_type(),
             "payload": rand_payload()
         }
-        batch.append(doc)
-    res = coll.insert_many(batch, ordered=False)
-    inserted += len(res.inserted_ids)
-    if inserted % (BATCH*10) == 0:
-        elapsed = time.time() - start
-        rate = inserted/elapsed
-        print(f"Inserted {inserted}/{TOTAL} docs @ {rate:,.0f} docs/s")
-
-elapsed = time.time() - start
-print(f"Inserted {inserted} docs in {elapsed:.1f}s ({inserted/elapsed:,.0f} docs/s)")
-
-# Simple query to get the count of documents
-count = coll.count_documents({})
-print(f"Total documents in collection: {count}")
\ No newline at end of file
+        key = router.shard_for(user) if router else None
+        buffers.setdefault(key, []).append(doc)
+        if len(buffers[key]) >= BATCH:
+            flush(key)
+            if router and time.time() - router.loaded_at > ROUTES_REFRESH_S:
+                router.refresh()
+
+        if inserted - reported >= BATCH*10:
+            reported = inserted
+            print(f"Inserted {inserted}/{TOTAL} docs @ {inserted/(time.time()-start):,.0f} docs/s")
+
+    for key in list(buffers):
+        flush(key)
+
+    elapsed = time.time() - start
+    print(f"Inserted {inserted} docs in {elapsed:.1f}s ({inserted/elapsed:,.0f} docs/s)")
+    if router:
+        print("Sent per shard: " + ", ".join(f"{s}={n:,}" for s, n in sorted(sent_per_shard.items())))
+    return elapsed
+
+
+def report(client, since):
+    coll = client[DB][COLL]
+    docs = {s["shard"]: s["count"] for s in coll.aggregate([{"$collStats": {"count": {}}}])}
+    chunk_counts = Counter(c["shard"] for c in chunks(client))
+    migrations = client.config.changelog.count_documents(
+        {"what": "moveChunk.commit", "ns": NS, "time": {"$gte": since}})
+
+    total = sum(docs.values())
+    print(f"\n{'shard':12} {'docs':>12} {'share':>7} {'chunks':>7}")
+    for shard in sorted(set(docs) | set(chunk_counts)):
+        share = docs.get(shard, 0) / total if total else 0
+        print(f"{shard:12} {docs.get(shard, 0):12,} {share:7.1%} {chunk_counts[shard]:7}")
+    if docs:
+        mean = total / len(docs)
+        print(f"Skew (largest shard / mean): {max(docs.values()) / mean:.2f}")
+    print(f"Chunk migrations committed during the load: {migrations}")
+
+
+def main():
+    client = MongoClient(MONGO_URI)
+    coll = client[DB][COLL]
+
+    print(f"Connecting to {MONGO_URI} ...")
+    coll.database.command("ping")
+
+    if PRESPLIT:
+        presplit(client, PRESPLIT)
+    router = ShardRouter(client) if GROUP_BY_SHARD else None
+
+    # Taken after the pre-split so its own moveChunks are not counted
+    since = datetime.utcnow()
+    print(f"Connected. Inserting (presplit={PRESPLIT or 'off'}, group_by_shard={GROUP_BY_SHARD})...")
+    load(coll, router)
+    report(client, since)
+
+    # Simple query to get the count of documents
+    count = coll.count_documents({})
+    print(f"Total documents in collection: {count}")
+
+
+if __name__ == "__main__":
+    main()
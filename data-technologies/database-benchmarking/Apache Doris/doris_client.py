@@ -1,9 +1,48 @@
+import os
+import sys
+import time
 import pymysql
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from background_flusher import BackgroundFlusher
+
 
 class DorisClient:
-    def __init__(self, host='localhost', user='admin', password='', port=9030, batch_size=10000):
+    INSERT_READINGS = "INSERT INTO sensor_readings (id, sensor_id, reading_time, reading_value) VALUES (%s, %s, %s, %s)"
+    INSERT_READINGS_DENORMALIZED = (
+        "INSERT INTO sensor_readings (id, sensor_id, reading_time, reading_value, device_id) "
+        "VALUES (%s, %s, %s, %s, %s)")
+    DAILY_COLUMNS = ("device_id", "sensor_id", "day", "value_sum", "reading_count",
+                     "min_value", "max_value", "first_time", "last_time")
+    INSERT_DAILY = (
+        f"INSERT INTO sensor_readings_daily ({', '.join(DAILY_COLUMNS)}) "
+        f"VALUES ({', '.join(['%s'] * len(DAILY_COLUMNS))})")
+
+    # default:  DUPLICATE KEY(id), hashed by id; every query joins sensors for device_id
+    # bucketed: device_id denormalized, monthly range partitions on reading_time,
+    #           DUPLICATE KEY(sensor_id, reading_time) hashed by sensor_id
+    # rollup:   bucketed + sensor_readings_daily, an AGGREGATE KEY table folded on ingest
+    # mv:       bucketed + sensor_extremes, a synchronous materialized view of max/min per sensor
+    SCHEMA_VARIANTS = ("default", "bucketed", "rollup", "mv")
+
+    def __init__(self, host='localhost', user='admin', password='', port=9030, batch_size=10000,
+                 async_flush=False, flush_workers=1, flush_queue_size=2,
+                 schema="default", history_months=24, reset_schema=False):
+        """
+        schema: one of SCHEMA_VARIANTS.
+        history_months: monthly partitions created back from now (non-default variants).
+        reset_schema: drop existing tables first, so variants can be compared on one server.
+        """
+        if schema not in self.SCHEMA_VARIANTS:
+            raise ValueError(f"schema must be one of {self.SCHEMA_VARIANTS}, got {schema!r}")
+        self.schema = schema
+        self.denormalized = schema != "default"
+        self.history_months = history_months
+        self.reset_schema = reset_schema
+        self.reading_columns = ("id", "sensor_id", "reading_time", "reading_value") + (
+            ("device_id",) if self.denormalized else ())
+        self.conn_params = dict(host=host, user=user, password=password, port=port)
         self.conn = pymysql.connect(
             host=host,
             user=user,
@@ -16,11 +55,65 @@ class DorisClient:
         self.batch_size = batch_size
         self.reading_buffer = []  # buffer for batched reading inserts
 
+        # Opt-in: hand full buffers to writer threads instead of blocking on the insert
+        self._flusher = None
+        if async_flush:
+            self._flusher = BackgroundFlusher(
+                self._reading_writer, workers=flush_workers,
+                max_pending=flush_queue_size, name="doris-flusher")
+
+    def _reading_writer(self):
+        """Per-thread connection for the background flusher."""
+        conn = pymysql.connect(database="iot", autocommit=False, **self.conn_params)
+
+        def write(batch):
+            with conn.cursor() as cursor:
+                self._write_readings(cursor, batch)
+            conn.commit()
+
+        return write, conn.close
+
+    def _write_readings(self, cursor, batch):
+        if not self.denormalized:
+            cursor.executemany(self.INSERT_READINGS, batch)
+            return
+        cursor.executemany(self.INSERT_READINGS_DENORMALIZED, batch)
+        if self.schema == "rollup":
+            df = pd.DataFrame(batch, columns=["id", "sensor_id", "reading_time", "reading_value", "device_id"])
+            cursor.executemany(self.INSERT_DAILY, self.daily_rows(df))
+
+    @classmethod
+    def daily_rows(cls, df):
+        """daily_frame() as tuples for INSERT_DAILY."""
+        return list(cls.daily_frame(df).astype(object).itertuples(index=False, name=None))
+
+    @classmethod
+    def daily_frame(cls, df):
+        """
+        Fold readings (device_id, sensor_id, reading_time, reading_value) into
+        one sensor_readings_daily row per sensor and day (DAILY_COLUMNS); the
+        AGGREGATE KEY table merges them with the rows of other batches.
+        """
+        times = pd.to_datetime(df["reading_time"])
+        agg = (df.assign(day=times.dt.strftime("%Y-%m-%d"), reading_time=times)
+               .groupby(["device_id", "sensor_id", "day"])
+               .agg(value_sum=("reading_value", "sum"), reading_count=("reading_value", "size"),
+                    min_value=("reading_value", "min"), max_value=("reading_value", "max"),
+                    first_time=("reading_time", "min"), last_time=("reading_time", "max"))
+               .reset_index())
+        for col in ("first_time", "last_time"):
+            agg[col] = agg[col].dt.strftime("%Y-%m-%d %H:%M:%S")
+        return agg[list(cls.DAILY_COLUMNS)]
+
     def create_schema(self):
         # Create database
         self.cursor.execute("CREATE DATABASE IF NOT EXISTS iot;")
         self.cursor.execute("USE iot;")
 
+        if self.reset_schema:
+            for table in ("sensor_readings_daily", "sensor_readings", "alerts", "sensors", "devices"):
+                self.cursor.execute(f"DROP TABLE IF EXISTS {table} FORCE;")
+
         # Create tables
         self.cursor.execute("""
             CREATE TABLE IF NOT EXISTS devices (
@@ -45,17 +138,20 @@ class DorisClient:
             PROPERTIES ("replication_num" = "1");
         """)
 
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sensor_readings (
-                id VARCHAR(36),
-                sensor_id VARCHAR(36),
-                reading_time DATETIME,
-                reading_value DOUBLE
-            ) ENGINE=OLAP
-            DUPLICATE KEY(id)
-            DISTRIBUTED BY HASH(id) BUCKETS 6
-            PROPERTIES ("replication_num" = "1");
-        """)
+        if self.denormalized:
+            self._create_bucketed_readings()
+        else:
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sensor_readings (
+                    id VARCHAR(36),
+                    sensor_id VARCHAR(36),
+                    reading_time DATETIME,
+                    reading_value DOUBLE
+                ) ENGINE=OLAP
+                DUPLICATE KEY(id)
+                DISTRIBUTED BY HASH(id) BUCKETS 6
+                PROPERTIES ("replication_num" = "1");
+            """)
 
         self.cursor.execute("""
             CREATE TABLE IF NOT EXISTS alerts (
@@ -70,6 +166,78 @@ class DorisClient:
             PROPERTIES ("replication_num" = "1");
         """)
 
+    def _create_bucketed_readings(self):
+        # Sorted by sensor and time and colocated per sensor: the LAG() per sensor
+        # stays on one bucket, and time filters prune monthly partitions
+        self.cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS sensor_readings (
+                sensor_id VARCHAR(36),
+                reading_time DATETIME,
+                device_id VARCHAR(36),
+                id VARCHAR(36),
+                reading_value DOUBLE
+            ) ENGINE=OLAP
+            DUPLICATE KEY(sensor_id, reading_time)
+            PARTITION BY RANGE(reading_time) ()
+            DISTRIBUTED BY HASH(sensor_id) BUCKETS 6
+            PROPERTIES (
+                "replication_num" = "1",
+                "dynamic_partition.enable" = "true",
+                "dynamic_partition.time_unit" = "MONTH",
+                "dynamic_partition.start" = "-{int(self.history_months)}",
+                "dynamic_partition.end" = "1",
+                "dynamic_partition.prefix" = "p",
+                "dynamic_partition.buckets" = "6",
+                "dynamic_partition.create_history_partition" = "true",
+                "dynamic_partition.replication_num" = "1"
+            );
+        """)
+
+        if self.schema == "rollup":
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sensor_readings_daily (
+                    device_id VARCHAR(36),
+                    sensor_id VARCHAR(36),
+                    day DATE,
+                    value_sum DOUBLE SUM,
+                    reading_count BIGINT SUM,
+                    min_value DOUBLE MIN,
+                    max_value DOUBLE MAX,
+                    first_time DATETIME MIN,
+                    last_time DATETIME MAX
+                ) ENGINE=OLAP
+                AGGREGATE KEY(device_id, sensor_id, day)
+                DISTRIBUTED BY HASH(sensor_id) BUCKETS 6
+                PROPERTIES ("replication_num" = "1");
+            """)
+
+        if self.schema == "mv":
+            indexes = {row[0] for row in self.execute("DESC sensor_readings ALL;")}
+            if "sensor_extremes" not in indexes:
+                # Maintained on every load; the planner rewrites matching GROUP BYs to read it
+                self.cursor.execute("""
+                    CREATE MATERIALIZED VIEW sensor_extremes AS
+                    SELECT device_id, sensor_id, MAX(reading_value), MIN(reading_value)
+                    FROM sensor_readings
+                    GROUP BY device_id, sensor_id;
+                """)
+                self._wait_for_materialized_view()
+
+    def _wait_for_materialized_view(self, timeout=300):
+        """The view is built by an asynchronous ALTER job; wait for it before loading."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            self.cursor.execute(
+                "SHOW ALTER TABLE MATERIALIZED VIEW WHERE TableName = 'sensor_readings' ORDER BY CreateTime DESC LIMIT 1;")
+            row = self.cursor.fetchone()
+            state = row[[c[0] for c in self.cursor.description].index("State")] if row else None
+            if state == "FINISHED":
+                return
+            if state == "CANCELLED":
+                raise RuntimeError(f"building sensor_extremes failed: {row}")
+            time.sleep(1)
+        raise RuntimeError(f"sensor_extremes not built after {timeout}s")
+
     def insert_device(self, id, name, location, status):
         sql = "INSERT INTO devices (id, name, location, status) VALUES (%s, %s, %s, %s)"
         self.cursor.execute(sql, (id, name, location, status))
@@ -78,9 +246,12 @@ class DorisClient:
         sql = "INSERT INTO sensors (id, device_id, type) VALUES (%s, %s, %s)"
         self.cursor.execute(sql, (id, device_id, sensor_type))
 
-    def bulk_insert_reading(self, id, sensor_id, reading_time, reading_value):
-        self.reading_buffer.append(
-            (id, sensor_id, reading_time, reading_value))
+    def bulk_insert_reading(self, id, sensor_id, reading_time, reading_value, device_id=None):
+        """device_id is required by the denormalized (non-default) schemas."""
+        if self.denormalized:
+            self.reading_buffer.append((id, sensor_id, reading_time, reading_value, device_id))
+        else:
+            self.reading_buffer.append((id, sensor_id, reading_time, reading_value))
 
         if len(self.reading_buffer) >= self.batch_size:
             self.flush_readings()
@@ -89,13 +260,30 @@ class DorisClient:
         if not self.reading_buffer:
             return
 
-        sql = "INSERT INTO sensor_readings (id, sensor_id, reading_time, reading_value) VALUES (%s, %s, %s, %s)"
-        self.cursor.executemany(sql, self.reading_buffer)
+        if self._flusher:
+            # swap buffers so the producer keeps filling while the batch is written
+            batch, self.reading_buffer = self.reading_buffer, []
+            self._flusher.submit(batch)
+            return
+
+        self._write_readings(self.cursor, self.reading_buffer)
         self.conn.commit()  # Commit the batch insert
 
         # Clear buffer after flush
         self.reading_buffer.clear()
 
+    def force_flush(self):
+        """Flush remaining readings and wait for background writers to finish."""
+        self.flush_readings()
+        if self._flusher:
+            self._flusher.drain()
+
+    def close(self):
+        self.flush_readings()
+        if self._flusher:
+            self._flusher.close()
+        self.conn.close()
+
     def insert_alert(self, id, device_id, alert_time, alert_type, description):
         sql = "INSERT INTO alerts (id, device_id, alert_time, alert_type, description) VALUES (%s, %s, %s, %s, %s)"
         self.cursor.execute(
@@ -107,6 +295,20 @@ class DorisClient:
 
     # Example analytical query methods:
     def get_avg_reading_per_device_per_day(self):
+        if self.schema == "rollup":
+            return self.execute("""
+            SELECT device_id, day, SUM(value_sum) / SUM(reading_count) AS avg_value
+            FROM sensor_readings_daily
+            GROUP BY device_id, day
+            ORDER BY device_id, day;
+            """)
+        if self.denormalized:
+            return self.execute("""
+            SELECT device_id, DATE(reading_time) AS day, AVG(reading_value) AS avg_value
+            FROM sensor_readings
+            GROUP BY device_id, day
+            ORDER BY device_id, day;
+            """)
         query = """
         SELECT
             s.device_id,
@@ -120,6 +322,21 @@ class DorisClient:
         return self.execute(query)
 
     def get_sensor_extremes_per_device(self):
+        if self.schema == "rollup":
+            return self.execute("""
+            SELECT device_id, sensor_id, MAX(max_value) AS max_value, MIN(min_value) AS min_value
+            FROM sensor_readings_daily
+            GROUP BY device_id, sensor_id
+            ORDER BY device_id, sensor_id;
+            """)
+        if self.denormalized:
+            # With schema="mv" this is answered from sensor_extremes
+            return self.execute("""
+            SELECT device_id, sensor_id, MAX(reading_value) AS max_value, MIN(reading_value) AS min_value
+            FROM sensor_readings
+            GROUP BY device_id, sensor_id
+            ORDER BY device_id, sensor_id;
+            """)
         query = """
         SELECT
             s.device_id,
@@ -134,6 +351,15 @@ class DorisClient:
         return self.execute(query)
 
     def get_avg_time_between_readings(self):
+        if self.schema == "rollup":
+            # Mean of consecutive gaps = (last - first) / (count - 1)
+            return self.execute("""
+            SELECT sensor_id,
+                   TIMESTAMPDIFF(SECOND, MIN(first_time), MAX(last_time)) / (SUM(reading_count) - 1) AS avg_seconds
+            FROM sensor_readings_daily
+            GROUP BY sensor_id
+            HAVING SUM(reading_count) > 1;
+            """)
         query = """
         SELECT
             sensor_id,
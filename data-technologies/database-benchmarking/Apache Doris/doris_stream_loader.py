@@ -0,0 +1,231 @@
+"""
+Stream Load ingestion for the IoT readings.
+
+stream_test.py used to build each batch as one CSV string, copy it to bytes
+and PUT it synchronously. DorisStreamLoader instead:
+
+- encodes CSV straight from the generator's column arrays (UUIDs, timestamps
+  and values are formatted with NumPy), piece_rows lines at a time;
+- streams the request body from a generator (chunked transfer), gzipped on
+  the fly when gzip=True (compress_type: gz), so a batch is never held as a
+  whole CSV buffer;
+- keeps up to `concurrency` loads in flight on BackgroundFlusher writer
+  threads, each with its own HTTP session;
+- follows the FE's 307 redirect to a BE by hand (requests would drop the
+  credentials and cannot replay a generator body);
+- retries failed loads under the same label. Doris commits a label at most
+  once, so "Label Already Exists" on a retry means an earlier attempt
+  succeeded and the batch is not loaded twice.
+
+    loader = DorisStreamLoader(concurrency=4)
+    for chunk in generator.iter_readings(chunk_size=100_000):
+        loader.submit(chunk)
+    loader.close()
+    print(loader.get_stats())
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+import zlib
+from urllib.parse import urlsplit, urlunsplit
+
+import numpy as np
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from background_flusher import BackgroundFlusher
+from iot_data import uuid_strings
+
+
+def _csv_column(name, values):
+    """One column as an array of CSV field strings."""
+    values = np.asarray(values)
+    if name.endswith("id") and values.dtype == np.uint8:
+        return uuid_strings(values)
+    if name.endswith("_time") and values.dtype.kind in "iuM":
+        if values.dtype.kind != "M":
+            values = values.astype("datetime64[us]")
+        return np.char.replace(np.datetime_as_string(values.astype("datetime64[s]"), unit="s"), "T", " ")
+    return values.astype(str)
+
+
+class _Load:
+    """One stream load: its label (kept across retries) and the columns to encode."""
+
+    def __init__(self, label, columns, rows):
+        self.label = label
+        self.columns = columns
+        self.rows = rows
+
+    def __len__(self):
+        return self.rows
+
+
+class DorisStreamLoader:
+    """
+    columns: table columns, in order; submit() takes arrays under these names.
+    concurrency: loads in flight at once (writer threads and queue slots).
+    piece_rows: CSV lines encoded per body piece.
+    max_retries/retry_delay: attempts after the first, backoff doubled per try.
+    be_address: "host:port" to send loads to instead of the BE the FE
+    redirects to (e.g. when the FE hands out a container-internal address).
+    on_loaded: on_loaded(label, columns), called on the writer thread once a
+    load has succeeded, e.g. to load rows derived from the batch. If it
+    raises, drain() raises like for a failed load.
+    """
+    SUCCESS = ("Success", "Publish Timeout")  # Publish Timeout: committed, visible shortly
+
+    def __init__(self, fe_host="localhost", fe_http_port=8030, database="iot", table="sensor_readings",
+                 user="admin", password="", columns=("id", "sensor_id", "reading_time", "reading_value"),
+                 concurrency=4, gzip=True, piece_rows=10_000, max_retries=3, retry_delay=1.0,
+                 label_prefix="iot_readings", be_address=None, timeout=600, on_loaded=None):
+        self.url = f"http://{fe_host}:{fe_http_port}/api/{database}/{table}/_stream_load"
+        self.auth = (user, password)
+        self.columns = list(columns)
+        self.gzip = gzip
+        self.piece_rows = piece_rows
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.label_prefix = label_prefix
+        self.be_address = be_address
+        self.timeout = timeout
+        self.on_loaded = on_loaded
+        self._flusher = BackgroundFlusher(self._writer, workers=concurrency, max_pending=concurrency,
+                                          name="doris-stream-load")
+        self._lock = threading.Lock()
+        self._started = None
+        self._finished = None
+        self.latencies = []
+        self.stats = {"loads": 0, "rows": 0, "body_bytes": 0, "retries": 0, "deduplicated": 0}
+
+    def _writer(self):
+        """Per-thread HTTP session for the background flusher."""
+        session = requests.Session()
+        return (lambda load: self._load(session, load)), session.close
+
+    def _headers(self, label):
+        headers = {
+            "label": label,
+            "format": "csv",
+            "column_separator": ",",
+            "columns": ",".join(self.columns),
+        }
+        if self.gzip:
+            headers["compress_type"] = "gz"
+        return headers
+
+    def _body(self, load, sent):
+        """Yield the CSV body piece by piece, gzipped if enabled; sent[0] counts bytes on the wire."""
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31) if self.gzip else None
+        for start in range(0, load.rows, self.piece_rows):
+            fields = [_csv_column(name, load.columns[name][start:start + self.piece_rows])
+                      for name in self.columns]
+            piece = ("\n".join(map(",".join, zip(*fields))) + "\n").encode()
+            if gz:
+                piece = gz.compress(piece)
+            if piece:
+                sent[0] += len(piece)
+                yield piece
+        if gz:
+            tail = gz.flush()
+            sent[0] += len(tail)
+            yield tail
+
+    def _be_url(self, session, headers):
+        """Ask the FE which BE takes the load; the 307 comes back before any body is sent."""
+        resp = session.put(self.url, headers=dict(headers, **{"Content-Length": "0"}), auth=self.auth,
+                           allow_redirects=False, timeout=self.timeout)
+        if resp.status_code not in (301, 302, 307, 308):
+            return None, resp  # the FE answered itself (e.g. an auth error)
+        location = urlsplit(resp.headers["Location"])
+        if self.be_address:
+            location = location._replace(netloc=self.be_address)
+        return urlunsplit(location), None
+
+    def _attempt(self, session, load):
+        headers = self._headers(load.label)
+        url, resp = self._be_url(session, headers)
+        sent = [0]
+        if url is not None:
+            resp = session.put(url, data=self._body(load, sent), headers=headers, auth=self.auth,
+                               timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json(), sent[0]
+
+    def _load(self, session, load):
+        """Send one load, retrying under the same label. Raises once retries run out."""
+        start = time.perf_counter()
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            try:
+                result, sent = self._attempt(session, load)
+            except requests.RequestException as e:
+                result, sent = {"Status": "Fail", "Message": repr(e)}, 0
+            status = result.get("Status")
+            deduplicated = status == "Label Already Exists" and result.get("ExistingJobStatus") == "FINISHED"
+            if status in self.SUCCESS or deduplicated:
+                break
+            if result.get("ErrorURL") or attempt == self.max_retries:
+                # Rejected rows will be rejected again; see ErrorURL for which
+                raise RuntimeError(f"Stream load {load.label} failed: {result}")
+            print(f"Stream load {load.label} attempt {attempt + 1} failed ({status}: "
+                  f"{result.get('Message')}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            delay *= 2
+            with self._lock:
+                self.stats["retries"] += 1
+
+        with self._lock:
+            self.stats["loads"] += 1
+            self.stats["rows"] += load.rows
+            self.stats["body_bytes"] += sent
+            self.stats["deduplicated"] += deduplicated
+            self.latencies.append(time.perf_counter() - start)
+            self._finished = time.perf_counter()
+        if self.on_loaded:
+            self.on_loaded(load.label, load.columns)
+        return result
+
+    def _new_load(self, columns, label):
+        missing = [name for name in self.columns if name not in columns]
+        if missing:
+            raise ValueError(f"columns missing from the batch: {missing}")
+        label = label or f"{self.label_prefix}_{uuid.uuid4().hex}"
+        return _Load(label, columns, len(columns[self.columns[0]]))
+
+    def submit(self, columns, label=None):
+        """
+        Queue one batch (dict or DataFrame of column arrays) as its own load.
+        Blocks while `concurrency` loads are already waiting. Pass a stable
+        label to make resubmitting the same batch idempotent.
+        """
+        if self._started is None:
+            self._started = time.perf_counter()
+        self._flusher.submit(self._new_load(columns, label))
+
+    def load(self, columns, label=None):
+        """Send one batch synchronously on the calling thread; returns Doris's result."""
+        if self._started is None:
+            self._started = time.perf_counter()
+        with requests.Session() as session:
+            return self._load(session, self._new_load(columns, label))
+
+    def drain(self):
+        """Wait for every submitted load; raises if any of them failed."""
+        self._flusher.drain()
+
+    def close(self):
+        self._flusher.close()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = sorted(self.latencies)
+        elapsed = (self._finished - self._started) if self._finished else None
+        stats["rows_per_s"] = stats["rows"] / elapsed if elapsed else None
+        # None until a load has finished
+        stats["load_p50_s"] = latencies[len(latencies) // 2] if latencies else None
+        stats["load_p99_s"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else None
+        return stats
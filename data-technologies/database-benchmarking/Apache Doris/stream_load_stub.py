@@ -0,0 +1,157 @@
+"""
+Local stand-in for Doris's _stream_load endpoint, to exercise
+DorisStreamLoader without a cluster:
+
+    python stream_load_stub.py
+
+An FE port answers every load with a 307 to a BE port, which reads the
+chunked (optionally gzipped) CSV body, checks every line has one field per
+`columns` header entry and commits the label at most once. Some first
+attempts fail before committing, and some commit but drop the connection
+before answering, so the loader has to retry and the retry is answered with
+"Label Already Exists". The script loads a generated dataset through the
+stub and exits 1 unless every row was committed exactly once.
+"""
+import gzip
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from doris_stream_loader import DorisStreamLoader
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from iot_data import IoTDataGenerator
+
+
+class StreamLoadStub:
+    """
+    FE and BE on two local ports. fail_every/drop_every: the first attempt
+    of every n-th label fails, or commits and then drops the connection.
+    """
+
+    def __init__(self, fail_every=3, drop_every=5):
+        self.fail_every = fail_every
+        self.drop_every = drop_every
+        self.lock = threading.Lock()
+        self.committed = {}  # label -> rows
+        self.attempts = {}  # label -> BE requests seen
+        self.be = ThreadingHTTPServer(("127.0.0.1", 0), self._be_handler())
+        self.fe = ThreadingHTTPServer(("127.0.0.1", 0), self._fe_handler())
+
+    @property
+    def fe_port(self):
+        return self.fe.server_address[1]
+
+    def start(self):
+        for server in (self.fe, self.be):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for server in (self.fe, self.be):
+            server.shutdown()
+            server.server_close()
+
+    def _fe_handler(self):
+        stub = self
+
+        class FE(BaseHTTPRequestHandler):
+            def do_PUT(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self.send_response(307)
+                self.send_header("Location", f"http://127.0.0.1:{stub.be.server_address[1]}{self.path}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return FE
+
+    def _be_handler(self):
+        stub = self
+
+        class BE(BaseHTTPRequestHandler):
+            def _body(self):
+                if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+                    return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().split(b";")[0], 16)
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+                    if not size:
+                        return b"".join(chunks)
+
+            def _reply(self, result):
+                body = json.dumps(result).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_PUT(self):
+                if not self.headers.get("Authorization"):
+                    self.send_response(401)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                label = self.headers["label"]
+                body = self._body()
+                if self.headers.get("compress_type") == "gz":
+                    body = gzip.decompress(body)
+                fields = len(self.headers["columns"].split(","))
+                lines = body.decode().splitlines()
+                bad = [line for line in lines if len(line.split(",")) != fields]
+                if bad:
+                    self._reply({"Status": "Fail", "Message": f"malformed line {bad[0]!r}",
+                                 "ErrorURL": "http://stub/error_log"})
+                    return
+
+                with stub.lock:
+                    attempt = stub.attempts[label] = stub.attempts.get(label, 0) + 1
+                    nth = len(stub.attempts)
+                    if label in stub.committed:
+                        result = {"Status": "Label Already Exists", "ExistingJobStatus": "FINISHED"}
+                    elif attempt == 1 and nth % stub.fail_every == 0:
+                        result = {"Status": "Fail", "Message": "injected failure"}
+                    else:
+                        stub.committed[label] = len(lines)
+                        result = {"Status": "Success", "NumberLoadedRows": len(lines)}
+                if attempt == 1 and nth % stub.drop_every == 0 and result["Status"] == "Success":
+                    self.close_connection = True  # committed, but the client never hears back
+                    return
+                self._reply(result)
+
+            def log_message(self, *args):
+                pass
+
+        return BE
+
+
+def main():
+    generator = IoTDataGenerator(devices=5, sensors_per_device=4, readings_per_sensor=1500)
+    stub = StreamLoadStub().start()
+    try:
+        loader = DorisStreamLoader(fe_host="127.0.0.1", fe_http_port=stub.fe_port, concurrency=4,
+                                   piece_rows=500, retry_delay=0.01)
+        for chunk in generator.iter_readings(chunk_size=2000):
+            loader.submit(chunk)
+        loader.close()
+    finally:
+        stub.stop()
+
+    stats = loader.get_stats()
+    expected = generator.num_readings
+    committed = sum(stub.committed.values())
+    print(f"{committed}/{expected} rows committed under {len(stub.committed)} labels; loader stats: {stats}")
+    ok = committed == expected == stats["rows"] and stats["retries"] > 0 and stats["deduplicated"] > 0
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,60 +1,11 @@
-import io
-import csv
-import uuid
-import requests
+import os
+import sys
 import time
-from faker import Faker
 from doris_client import DorisClient
+from doris_stream_loader import DorisStreamLoader
 
-from datetime import datetime, timedelta
-import random
-import uuid
-import requests
-from requests.auth import HTTPBasicAuth
-
-def stream_load_readings_to_doris(rows,
-								  fe_host="localhost",
-								  fe_http_port=8030,
-								  database="iot",
-								  user="admin",
-								  password="",
-								  table="sensor_readings"):
-
-	# 1) Build CSV in memory
-	buf = io.StringIO()
-	writer = csv.writer(buf)
-
-	for (rid, sensor_id, ts, val) in rows:
-		# ensure timestamp is ISO-formatted string
-		ts_str = ts.isoformat(sep=' ')
-		writer.writerow([rid, sensor_id, ts_str, val])
-
-	payload = buf.getvalue().encode("utf-8")
-	buf.close()
-
-	url = f"http://{fe_host}:{fe_http_port}/api/{database}/{table}/_stream_load"
-
-	headers = {
-		"label":               "stream_load_" + uuid.uuid4().hex,
-		"format":              "CSV",
-		"strip_outer_array":   "true",
-			"Expect": "100-continue",  
-
-	}
-	
-	auth = HTTPBasicAuth(user, password)    
-
-	# 4) Send
-	print(f"Sending stream load to {url} with {len(rows)} rows")
-	resp = requests.put(url, data=payload, headers=headers, auth=auth)
-	resp.raise_for_status()
-	result = resp.json()
-	if result.get("Status", "").lower() != "success":
-		raise RuntimeError(f"Stream load failed: {result}")
-	return result
-
-fake = Faker()
-
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from iot_data import IoTDataGenerator, as_rows
 
 def timed(fn, *args, **kwargs):
 	start = time.perf_counter()
@@ -74,44 +25,30 @@ S = 10    # sensors per device
 R = 10000   # readings per sensor
 A = 5    # alerts per device
 
-now = datetime.utcnow()
+generator = IoTDataGenerator(devices=D, sensors_per_device=S,
+							 readings_per_sensor=R, alerts_per_device=A)
 
 
-my_buffer = []
 def insert():
 	start_time = time.perf_counter()
-	for i in range(1, D+1):
-		print(f"-> Device {i}/{D}")
-		name = f"dev{i}"
-		loc = fake.city()
-		st = random.choice(["online", "offline", "unknown"])
-
-		device_id = uuid.uuid4()
-		_, t = timed(doris_client.insert_device,
-					 str(device_id), name, loc, st)
-
-		for j in range(1, S+1):
-			print(f"\t-> Sensor {j}/{S}")
-			typ = random.choice(["temp", "hum", "press"])
-			sensor_id = uuid.uuid4()
 
-			_, t = timed(doris_client.insert_sensor,
-						 sensor_id, device_id, typ)
+	for row in as_rows(generator.devices(), ["id", "name", "location", "status"]):
+		doris_client.insert_device(*row)
 
-			for k in range(1, R+1):
-				tstamp = now - timedelta(days=random.randint(0, 10),
-										 minutes=k * random.random() * 5)
-				val = random.random() * 100
-				reading_id = uuid.uuid4()
+	for row in as_rows(generator.sensors(), ["id", "device_id", "type"]):
+		doris_client.insert_sensor(*row)
 
-				my_buffer.append((reading_id, sensor_id, tstamp, val))
+	# Each chunk is one gzipped, streamed stream load; up to 4 run at once
+	loader = DorisStreamLoader(concurrency=4)
+	for chunk in generator.iter_readings(chunk_size=doris_client.batch_size):
+		loader.submit(chunk)
+	loader.close()
 
-				if len(my_buffer) >= doris_client.batch_size:
-					stream_load_readings_to_doris(my_buffer)
-					my_buffer.clear()
+	stats = loader.get_stats()
+	print(f"Stream loaded {stats['rows']} readings in {time.perf_counter() - start_time:.2f}s "
+		  f"({stats['loads']} loads, {stats['retries']} retries)")
+	if stats["loads"]:
+		print(f"{stats['rows_per_s']:,.0f} rows/s, load latency "
+			  f"p50 {stats['load_p50_s']:.2f}s, p99 {stats['load_p99_s']:.2f}s")
 
-	# final flush
-	if my_buffer:
-		stream_load_readings_to_doris(my_buffer)
-		
-insert()
\ No newline at end of file
+insert()
@@ -1,12 +1,10 @@
+import os
+import sys
 import time
-from faker import Faker
 from doris_client import DorisClient
 
-from datetime import datetime, timedelta
-import random
-import uuid
-
-fake = Faker()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from iot_data import IoTDataGenerator, as_rows
 
 
 def timed(fn, *args, **kwargs):
@@ -27,46 +25,26 @@ S = 10    # sensors per device
 R = 10000   # readings per sensor
 A = 5    # alerts per device
 
-now = datetime.utcnow()
+generator = IoTDataGenerator(devices=D, sensors_per_device=S,
+                             readings_per_sensor=R, alerts_per_device=A)
 
 # latency store
 
 def insert():
     start_time = time.perf_counter()
-    for i in range(1, D+1):
-        print(f"-> Device {i}/{D}")
-        name = f"dev{i}"
-        loc = fake.city()
-        st = random.choice(["online", "offline", "unknown"])
-
-        device_id = uuid.uuid4()
-        _, t = timed(doris_client.insert_device,
-                     str(device_id), name, loc, st)
-
-        for j in range(1, S+1):
-            print(f"\t-> Sensor {j}/{S}")
-            typ = random.choice(["temp", "hum", "press"])
-            sensor_id = uuid.uuid4()
-
-            _, t = timed(doris_client.insert_sensor,
-                         sensor_id, device_id, typ)
-
-            for k in range(1, R+1):
-                tstamp = now - timedelta(days=random.randint(0, 10),
-                                         minutes=k * random.random() * 5)
-                val = random.random() * 100
-                reading_id = uuid.uuid4()
-
-                _, t = timed(doris_client.bulk_insert_reading, reading_id, sensor_id, tstamp, val)
-
-
-        for _ in range(A):
-            tstamp = now - timedelta(hours=random.random()*24)
-            atype = random.choice(["overheat", "disconnect", "low-battery"])
-            desc = fake.sentence(nb_words=6)
-            alert_id = uuid.uuid4()
-            doris_client.insert_alert(
-                alert_id, device_id, atype, tstamp, desc)
+
+    for row in as_rows(generator.devices(), ["id", "name", "location", "status"]):
+        doris_client.insert_device(*row)
+
+    for row in as_rows(generator.sensors(), ["id", "device_id", "type"]):
+        doris_client.insert_sensor(*row)
+
+    for chunk in generator.iter_readings(chunk_size=doris_client.batch_size):
+        for row in as_rows(chunk, ["id", "sensor_id", "reading_time", "reading_value"]):
+            doris_client.bulk_insert_reading(*row)
+
+    for row in as_rows(generator.alerts(), ["id", "device_id", "alert_time", "alert_type", "description"]):
+        doris_client.insert_alert(*row)
 
     doris_client.flush_readings()
     doris_client.conn.commit()
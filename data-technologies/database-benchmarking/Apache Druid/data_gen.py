@@ -1,9 +1,9 @@
 import os
-import uuid
-import random
-from datetime import datetime, timedelta
+import sys
 import pandas as pd
-from faker import Faker
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from iot_data import IoTDataGenerator, uuid_strings, to_datetime64
 
 # CONFIGURATION
 OUTPUT_DIR = "./data"
@@ -11,68 +11,54 @@ NUM_DEVICES  = 10     # Number of devices (configurable)
 SENSORS_PER  = 10      # Number of sensors per device
 READINGS_PER = 100000     # Number of readings per sensor
 ALERTS_PER   = 3      # Number of alerts per device
+CHUNK_SIZE   = 1_000_000  # Rows written per CSV append
 
-fake = Faker()
-now  = datetime.utcnow()
+generator = IoTDataGenerator(devices=NUM_DEVICES, sensors_per_device=SENSORS_PER,
+                             readings_per_sensor=READINGS_PER, alerts_per_device=ALERTS_PER)
 
 # Ensure output directory exists
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def write_csv(df: pd.DataFrame, name: str):
+def write_csv(df: pd.DataFrame, name: str, append=False):
     path = os.path.join(OUTPUT_DIR, f"{name}.csv")
-    df.to_csv(path, index=False)
+    df.to_csv(path, index=False, mode="a" if append else "w", header=not append)
     print(f"Wrote {len(df)} rows to {path}")
 
+def iso(epoch_us):
+    return pd.Series(to_datetime64(epoch_us)).dt.strftime("%Y-%m-%dT%H:%M:%S.%f")
+
 # 1) devices.csv
-devices = []
-for i in range(1, NUM_DEVICES + 1):
-    dev_id = str(uuid.uuid4())
-    devices.append({
-        "id":       dev_id,
-        "name":     f"dev{i}",
-        "location": fake.city(),
-        "status":   random.choice(["online", "offline", "unknown"])
-    })
-    df_devices = pd.DataFrame(devices)
-    write_csv(df_devices, "devices")
+devices = generator.devices()
+write_csv(pd.DataFrame({
+    "id":       uuid_strings(devices["id"]),
+    "name":     devices["name"],
+    "location": devices["location"],
+    "status":   devices["status"],
+}), "devices")
 
-    # 2) sensors.csv
-    sensors = []
-    for dev in devices:
-        for j in range(1, SENSORS_PER + 1):
-            sensors.append({
-                "id":        str(uuid.uuid4()),
-                "device_id": dev["id"],
-                "type":      random.choice(["temp", "hum", "press"])
-            })
-        df_sensors = pd.DataFrame(sensors)
-        write_csv(df_sensors, "sensors")
+# 2) sensors.csv
+sensors = generator.sensors()
+write_csv(pd.DataFrame({
+    "id":        uuid_strings(sensors["id"]),
+    "device_id": uuid_strings(sensors["device_id"]),
+    "type":      sensors["type"],
+}), "sensors")
 
 # 3) sensor_readings.csv
-readings = []
-for sensor in sensors:
-    for _ in range(READINGS_PER):
-        tstamp = now - timedelta(minutes=random.randint(0, 60*24))
-        readings.append({
-            "id":             str(uuid.uuid4()),
-            "sensor_id":      sensor["id"],
-            "reading_time":   tstamp.isoformat(),
-            "reading_value":  round(random.random() * 100, 2)
-        })
-df_readings = pd.DataFrame(readings)
-write_csv(df_readings, "sensor_readings")
+for n, chunk in enumerate(generator.iter_readings(chunk_size=CHUNK_SIZE)):
+    write_csv(pd.DataFrame({
+        "id":            uuid_strings(chunk["id"]),
+        "sensor_id":     uuid_strings(chunk["sensor_id"]),
+        "reading_time":  iso(chunk["reading_time"]),
+        "reading_value": chunk["reading_value"].round(2),
+    }), "sensor_readings", append=n > 0)
 
 # 4) alerts.csv
-alerts = []
-for dev in devices:
-    for _ in range(ALERTS_PER):
-        tstamp = now - timedelta(hours=random.random() * 24)
-        alerts.append({
-            "id":          str(uuid.uuid4()),
-            "device_id":   dev["id"],
-            "alert_time":  tstamp.isoformat(),
-            "alert_type":  random.choice(["overheat", "disconnect", "low-battery"]),
-            "description": fake.sentence(nb_words=6)
-        })
-df_alerts = pd.DataFrame(alerts)
-write_csv(df_alerts, "alerts")
+alerts = generator.alerts()
+write_csv(pd.DataFrame({
+    "id":          uuid_strings(alerts["id"]),
+    "device_id":   uuid_strings(alerts["device_id"]),
+    "alert_time":  iso(alerts["alert_time"]),
+    "alert_type":  alerts["alert_type"],
+    "description": alerts["description"],
+}), "alerts")
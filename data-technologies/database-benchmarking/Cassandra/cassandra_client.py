@@ -1,10 +1,51 @@
 import os
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+import pandas as pd
 from cassandra.cluster import Cluster
+from cassandra.concurrent import execute_concurrent, execute_concurrent_with_args
+from cassandra.query import BatchStatement, BatchType, SimpleStatement
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from stream_agg import StreamingAggregator
 
 class CassandraClient:
-    def __init__(self, hosts=["127.0.0.1"]):
+    INSERT_READING = "INSERT INTO iot.sensor_readings(id, sensor_id, reading_time, reading_value) VALUES(?,?,?,?)"
+    INSERT_READING_BY_DAY = """INSERT INTO iot.sensor_readings_by_day(sensor_id, day_bucket, reading_time, id, reading_value)
+        VALUES(?,?,?,?,?)"""
+    SCHEMA_MODES = ("default", "bucketed")
+
+    def __init__(self, hosts=["127.0.0.1"], concurrency=128, batch_by_partition=False, batch_size=50,
+                 schema_mode="default"):
+        """
+        concurrency: max requests in flight for insert_readings and the
+        per-partition reads of the bucketed queries.
+        batch_by_partition: send unlogged batches of rows sharing a partition
+        key (at most batch_size rows each) instead of one request per row.
+        schema_mode: "default" keys readings by id (one partition per reading);
+        "bucketed" keys them by (sensor_id, day_bucket) so the analytical
+        queries can be answered from per-sensor-day partitions.
+        """
+        if schema_mode not in self.SCHEMA_MODES:
+            raise ValueError(f"schema_mode must be one of {self.SCHEMA_MODES}")
         self.cluster = Cluster(hosts)
         self.session = self.cluster.connect()
+        self.schema_mode = schema_mode
+        self._known_buckets = set()
+        self.concurrency = concurrency
+        self.batch_by_partition = batch_by_partition
+        self.batch_size = batch_size
+        self._prepared = {}
+        self.ingest_stats = {"rows": 0, "requests": 0, "errors": 0, "seconds": 0.0, "last_error": None}
+
+    def prepare(self, cql):
+        # Prepared once per statement; the driver then only ships bound values
+        if cql not in self._prepared:
+            self._prepared[cql] = self.session.prepare(cql)
+        return self._prepared[cql]
 
     def create_schema(self):
         # Create keyspace (database)
@@ -34,6 +75,29 @@ class CassandraClient:
           PRIMARY KEY(id, alert_time)
         ) WITH CLUSTERING ORDER BY (alert_time DESC);""")
 
+        if self.schema_mode == "bucketed":
+            # One partition per sensor per UTC day. id is only a tiebreaker for
+            # readings that land on the same millisecond.
+            self.session.execute("""
+            CREATE TABLE IF NOT EXISTS sensor_readings_by_day (
+              sensor_id uuid, day_bucket date, reading_time timestamp, id uuid, reading_value double,
+              PRIMARY KEY((sensor_id, day_bucket), reading_time, id)
+            ) WITH CLUSTERING ORDER BY (reading_time DESC, id ASC);""")
+
+            self.session.execute("""
+            CREATE TABLE IF NOT EXISTS sensor_by_device (
+              device_id uuid, sensor_id uuid, sensor_type text,
+              PRIMARY KEY(device_id, sensor_id)
+            );""")
+
+            # Partitions can't be listed without a full scan, so the day
+            # buckets written for each sensor are tracked alongside
+            self.session.execute("""
+            CREATE TABLE IF NOT EXISTS sensor_day_buckets (
+              sensor_id uuid, day_bucket date,
+              PRIMARY KEY(sensor_id, day_bucket)
+            );""")
+
     def insert_device(self, id, name, location, status):
         self.session.execute(
             "INSERT INTO devices(id,name,location,status) VALUES(%s,%s,%s,%s)",
@@ -43,12 +107,205 @@ class CassandraClient:
         self.session.execute(
             "INSERT INTO sensors(id,device_id,type) VALUES(%s,%s,%s)",
             (id,device_id,type))
+        if self.schema_mode == "bucketed":
+            self.session.execute(
+                "INSERT INTO sensor_by_device(device_id,sensor_id,sensor_type) VALUES(%s,%s,%s)",
+                (device_id,id,type))
 
     def insert_reading(self, id, sensor_id, value, ts):
         self.session.execute(
             "INSERT INTO sensor_readings(id, sensor_id, reading_time, reading_value) VALUES(%s,%s,%s,%s)",
             (id, sensor_id, ts, value))
 
+    def insert_readings(self, rows):
+        """
+        Bulk insert readings with a prepared statement, keeping up to
+        `concurrency` async requests in flight.
+
+        rows: sequence of (id, sensor_id, reading_time, reading_value).
+        Returns this call's stats; totals are kept in self.ingest_stats.
+        """
+        if self.schema_mode == "default":
+            return self._insert_concurrent(rows, self.INSERT_READING, lambda row: row[0])
+
+        by_day = [(sensor_id, ts.date(), ts, id, value) for id, sensor_id, ts, value in rows]
+        new_buckets = {row[:2] for row in by_day} - self._known_buckets
+        if new_buckets:
+            execute_concurrent_with_args(
+                self.session, self.prepare("INSERT INTO iot.sensor_day_buckets(sensor_id, day_bucket) VALUES(?,?)"),
+                list(new_buckets), concurrency=self.concurrency)
+            self._known_buckets |= new_buckets
+        return self._insert_concurrent(by_day, self.INSERT_READING_BY_DAY, lambda row: row[:2])
+
+    def _insert_concurrent(self, rows, cql, partition_key):
+        """
+        partition_key maps a row to its partition key; only used to group
+        rows when batch_by_partition is set. Unlogged batches only pay off
+        when they stay within one partition, otherwise the coordinator has to
+        fan them out to other replicas.
+        """
+        stmt = self.prepare(cql)
+        start = time.perf_counter()
+        if self.batch_by_partition:
+            batches = list(self._partition_batches(stmt, rows, partition_key))
+            sizes = [n for _, n in batches]
+            results = execute_concurrent(self.session, [(batch, ()) for batch, _ in batches],
+                                         concurrency=self.concurrency, raise_on_first_error=False)
+        else:
+            sizes = [1] * len(rows)
+            results = execute_concurrent_with_args(self.session, stmt, rows, concurrency=self.concurrency,
+                                                   raise_on_first_error=False)
+        elapsed = time.perf_counter() - start
+
+        failed = [result for ok, result in results if not ok]
+        lost = sum(n for n, (ok, _) in zip(sizes, results) if not ok)  # a failed batch loses all its rows
+        stats = {"rows": len(rows) - lost, "requests": len(sizes), "errors": len(failed), "seconds": elapsed}
+        for key, value in stats.items():
+            self.ingest_stats[key] += value
+        if failed:
+            self.ingest_stats["last_error"] = repr(failed[-1])
+            print(f"{len(failed)} of {len(sizes)} reading inserts failed, e.g. {failed[-1]!r}")
+        return stats
+
+    def _partition_batches(self, stmt, rows, partition_key):
+        groups = defaultdict(list)
+        for row in rows:
+            groups[partition_key(row)].append(row)
+        for group in groups.values():
+            for i in range(0, len(group), self.batch_size):
+                batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+                part = group[i:i + self.batch_size]
+                for row in part:
+                    batch.add(stmt, row)
+                yield batch, len(part)
+
+    def get_ingest_stats(self):
+        stats = dict(self.ingest_stats)
+        stats["rows_per_s"] = stats["rows"] / stats["seconds"] if stats["seconds"] else None
+        return stats
+
+    # Analytical queries. CQL can't GROUP BY across partitions, so with
+    # schema_mode="bucketed" each query fans out one aggregate read per
+    # sensor-day partition and merges the partials client-side. The default
+    # schema has no usable partition key, so it falls back to a paged full
+    # scan through the streaming aggregator.
+    def _scan_aggregate(self, fetch_size=10_000):
+        sensors = {row.id: row.device_id for row in self.session.execute("SELECT id, device_id FROM iot.sensors")}
+        scan = self.session.execute(SimpleStatement(
+            "SELECT sensor_id, reading_time, reading_value FROM iot.sensor_readings", fetch_size=fetch_size))
+        return StreamingAggregator(sensors).consume(
+            scan, ["sensor_id", "reading_time", "reading_value"], chunk_size=fetch_size * 10)
+
+    def _read_partitions(self, cql, params):
+        """Run a prepared read once per parameter tuple, concurrently; returns one row list per tuple."""
+        results = execute_concurrent_with_args(self.session, self.prepare(cql), params,
+                                               concurrency=self.concurrency)
+        return [list(rows) for _, rows in results]
+
+    def _sensor_buckets(self, since=None):
+        """[(device_id, sensor_id, sensor_type, day_bucket), ...] for every stored partition."""
+        sensors = list(self.session.execute("SELECT device_id, sensor_id, sensor_type FROM iot.sensor_by_device"))
+        buckets = self._read_partitions(
+            "SELECT day_bucket FROM iot.sensor_day_buckets WHERE sensor_id = ?",
+            [(s.sensor_id,) for s in sensors])
+        return [(s.device_id, s.sensor_id, s.sensor_type, b.day_bucket.date())
+                for s, rows in zip(sensors, buckets) for b in rows
+                if since is None or b.day_bucket.date() >= since]
+
+    def _devices(self):
+        return {row.id: row for row in self.session.execute("SELECT id, name, status FROM iot.devices")}
+
+    def get_avg_reading_per_device_per_day(self, days=7):
+        since = datetime.utcnow().date() - timedelta(days=days)
+        if self.schema_mode == "default":
+            df = self._scan_aggregate().avg_reading_per_device_per_day(since=since)
+            devices = self._devices()
+            df.insert(1, "device_name", [devices[uuid.UUID(d)].name for d in df["device_id"]])
+            df.insert(2, "status", [devices[uuid.UUID(d)].status for d in df["device_id"]])
+            return df
+        partitions = self._sensor_buckets(since=since)
+        partials = self._read_partitions(
+            "SELECT sum(reading_value) AS s, count(reading_value) AS n FROM iot.sensor_readings_by_day "
+            "WHERE sensor_id = ? AND day_bucket = ?",
+            [(sensor_id, day) for _, sensor_id, _, day in partitions])
+
+        totals = defaultdict(lambda: [0.0, 0])
+        for (device_id, _, _, day), (row,) in zip(partitions, partials):
+            totals[device_id, day][0] += row.s
+            totals[device_id, day][1] += row.n
+
+        devices = self._devices()
+        return pd.DataFrame(
+            [(device_id, devices[device_id].name, devices[device_id].status, day, s / n)
+             for (device_id, day), (s, n) in sorted(totals.items()) if n],
+            columns=["device_id", "device_name", "status", "day", "avg_reading"])
+
+    def get_sensor_extremes_per_device(self):
+        if self.schema_mode == "default":
+            df = self._scan_aggregate().sensor_extremes_per_device()
+            devices = self._devices()
+            types = {row.id: row.type for row in self.session.execute("SELECT id, type FROM iot.sensors")}
+            df.insert(1, "device_name", [devices[uuid.UUID(d)].name for d in df["device_id"]])
+            df.insert(3, "sensor_type", [types[uuid.UUID(s)] for s in df["sensor_id"]])
+            return df
+
+        # Stage 1: max/min of every partition; keep the winning partition per device
+        partitions = self._sensor_buckets()
+        partials = self._read_partitions(
+            "SELECT max(reading_value) AS hi, min(reading_value) AS lo FROM iot.sensor_readings_by_day "
+            "WHERE sensor_id = ? AND day_bucket = ?",
+            [(sensor_id, day) for _, sensor_id, _, day in partitions])
+
+        best = {}
+        for partition, (row,) in zip(partitions, partials):
+            if row.hi is None:
+                continue
+            device_id = partition[0]
+            hi, lo = best.get(device_id, ((None, None), (None, None)))
+            if hi[0] is None or row.hi > hi[0]:
+                hi = (row.hi, partition)
+            if lo[0] is None or row.lo < lo[0]:
+                lo = (row.lo, partition)
+            best[device_id] = (hi, lo)
+
+        # Stage 2: fetch the winning readings, each a filtered read of a single partition
+        wanted = [(kind, value, partition) for hi, lo in best.values()
+                  for kind, (value, partition) in (("MAX", hi), ("MIN", lo))]
+        matches = self._read_partitions(
+            "SELECT reading_time, reading_value FROM iot.sensor_readings_by_day "
+            "WHERE sensor_id = ? AND day_bucket = ? AND reading_value = ? ALLOW FILTERING",
+            [(partition[1], partition[3], value) for _, value, partition in wanted])
+
+        devices = self._devices()
+        rows = [(device_id, devices[device_id].name, sensor_id, sensor_type, r.reading_value, r.reading_time, kind)
+                for (kind, _, (device_id, sensor_id, sensor_type, _)), found in zip(wanted, matches)
+                for r in found]
+        rows.sort(key=lambda r: (r[0], -r[4]))
+        return pd.DataFrame(rows, columns=["device_id", "device_name", "sensor_id", "sensor_type",
+                                           "reading_value", "reading_time", "extreme_type"])
+
+    def get_avg_time_between_readings(self):
+        # The mean gap between consecutive readings telescopes to (last - first) / (count - 1)
+        if self.schema_mode == "default":
+            return self._scan_aggregate().avg_time_between_readings()
+        partitions = self._sensor_buckets()
+        partials = self._read_partitions(
+            "SELECT min(reading_time) AS first, max(reading_time) AS last, count(*) AS n "
+            "FROM iot.sensor_readings_by_day WHERE sensor_id = ? AND day_bucket = ?",
+            [(sensor_id, day) for _, sensor_id, _, day in partitions])
+
+        spans = {}
+        for (_, sensor_id, _, _), (row,) in zip(partitions, partials):
+            if not row.n:
+                continue
+            first, last, n = spans.get(sensor_id, (row.first, row.last, 0))
+            spans[sensor_id] = (min(first, row.first), max(last, row.last), n + row.n)
+
+        return pd.DataFrame(
+            [(sensor_id, (last - first).total_seconds() / (n - 1))
+             for sensor_id, (first, last, n) in spans.items() if n > 1],
+            columns=["sensor_id", "avg_seconds"])
+
     def insert_alert(self, id, device_id, atype, ts, desc):
         self.session.execute(
             "INSERT INTO alerts(id, device_id, alert_time, alert_type, description) VALUES(%s,%s,%s,%s,%s)",
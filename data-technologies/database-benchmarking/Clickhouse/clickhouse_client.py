@@ -1,19 +1,99 @@
 import os
+import sys
+import time
 from clickhouse_driver import Client as CHClient
+import numpy as np
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from background_flusher import BackgroundFlusher
+
 class ClickHouseClient:
-    def __init__(self, host='localhost', batch_size=100):
-        user = "myuser"
-        password = "mypass"
+    READING_COLUMNS = ("id", "sensor_id", "device_id", "reading_value", "reading_time")
+    INSERT_READINGS = "INSERT INTO sensor_readings (id, sensor_id, device_id, reading_value, reading_time) VALUES"
+
+    # Per-sensor aggregate states kept next to every part of sensor_readings.
+    # Queries whose GROUP BY and aggregates are a subset of these are answered
+    # from the projection instead of the raw rows.
+    SENSOR_STATS_PROJECTION = """
+        SELECT
+            device_id,
+            sensor_id,
+            max(reading_value),
+            argMax(reading_time, reading_value),
+            min(reading_value),
+            argMin(reading_time, reading_value),
+            count(),
+            min(reading_time),
+            max(reading_time)
+        GROUP BY device_id, sensor_id
+    """
+
+    EXTREMES_STRATEGIES = ("window", "argmax")
+    GAP_STRATEGIES = ("window", "aggregate")
+
+    # Rollup family: (per, granularity) -> AggregatingMergeTree table, each fed
+    # by its own materialized view <table>_mv over sensor_readings
+    ROLLUPS = {
+        ("sensor", "hour"): "sensor_hourly_rollup",
+        ("sensor", "day"): "sensor_daily_rollup",
+        ("device", "hour"): "device_hourly_rollup",
+        ("device", "day"): "device_daily_rollup",
+    }
+    ROLLUP_KEYS = {"sensor": ("device_id", "sensor_id"), "device": ("device_id",)}
+    ROLLUP_BUCKETS = {"hour": "toStartOfHour(reading_time)", "day": "toStartOfDay(reading_time)"}
+    ROLLUP_COLUMNS = """
+        bucket DateTime,
+        avg_value AggregateFunction(avg, Float64),
+        min_value SimpleAggregateFunction(min, Float64),
+        max_value SimpleAggregateFunction(max, Float64),
+        quantiles_value AggregateFunction(quantiles(0.5, 0.9, 0.99), Float64),
+        reading_count SimpleAggregateFunction(sum, UInt64),
+        max_at AggregateFunction(argMax, Tuple(UUID, DateTime), Float64),
+        min_at AggregateFunction(argMin, Tuple(UUID, DateTime), Float64)
+    """
+    # Same order as ROLLUP_COLUMNS; max_at/min_at remember (sensor_id, reading_time) of the extreme
+    ROLLUP_STATES = """
+        {bucket} AS bucket,
+        avgState(reading_value) AS avg_value,
+        min(reading_value) AS min_value,
+        max(reading_value) AS max_value,
+        quantilesState(0.5, 0.9, 0.99)(reading_value) AS quantiles_value,
+        count() AS reading_count,
+        argMaxState((sensor_id, reading_time), reading_value) AS max_at,
+        argMinState((sensor_id, reading_time), reading_value) AS min_at
+    """
+    SOURCES = ("auto", "raw", "rollup")
+
+    def __init__(self, host='localhost', batch_size=100,
+                 async_flush=False, flush_workers=1, flush_queue_size=2, projections=True, rollups=True):
+        self.host = host
+        self.projections = projections
+        self.rollups = rollups
+        self._rollup_state = None  # cached _rollups()
+        self.rollup_stats = {"backfilled_partitions": 0, "backfill_s": 0.0}
+        self.user = "myuser"
+        self.password = "mypass"
         self.client = CHClient(
             host=host,
-            user=user,
-            password=password,
+            user=self.user,
+            password=self.password,
         )
         self.batch_size = batch_size
         self.readings_buffer = []  # Add buffer for batch inserts
 
+        # Opt-in: hand full buffers to writer threads instead of blocking on the insert
+        self._flusher = None
+        if async_flush:
+            self._flusher = BackgroundFlusher(
+                self._reading_writer, workers=flush_workers,
+                max_pending=flush_queue_size, name="clickhouse-flusher")
+
+    def _reading_writer(self):
+        """Per-thread connection for the background flusher."""
+        client = CHClient(host=self.host, user=self.user, password=self.password, database="iot")
+        return (lambda batch: client.execute(self.INSERT_READINGS, batch)), client.disconnect
+
     def create_schema(self):
         self.client.execute("CREATE DATABASE IF NOT EXISTS iot;")
         self.client.execute("USE iot;")
@@ -54,20 +134,21 @@ class ClickHouseClient:
         SETTINGS index_granularity = 8192;  # Default is fine
         """)
 
-        # Materialized view for device metrics
-        self.client.execute("""
-        CREATE MATERIALIZED VIEW IF NOT EXISTS device_daily_metrics
-        ENGINE = SummingMergeTree()
-        ORDER BY (device_id, day)
-        POPULATE AS
-        SELECT
-            device_id,
-            toDate(reading_time) AS day,
-            count() AS reading_count,
-            sum(reading_value) AS value_sum
-        FROM sensor_readings
-        GROUP BY device_id, day;
-        """)
+        if self.projections:
+            self.client.execute(
+                f"ALTER TABLE sensor_readings ADD PROJECTION IF NOT EXISTS sensor_stats ({self.SENSOR_STATS_PROJECTION})")
+
+        # Replaced by the rollup family below
+        self.client.execute("DROP VIEW IF EXISTS device_daily_metrics")
+        if self.rollups:
+            self.create_rollups()
+        else:
+            # Views left by an earlier run would still feed on every insert; create_rollups() rebuilds them
+            for table in self.ROLLUPS.values():
+                self.client.execute(f"DROP VIEW IF EXISTS {table}_mv")
+        if self.projections:
+            # After the rollup backfill, which stops merges (and so mutations) while it runs
+            self.materialize_projections()
 
         # Alerts table
         self.client.execute("""
@@ -117,17 +198,62 @@ class ClickHouseClient:
         if not self.readings_buffer:
             return
 
-        self.client.execute(
-            "INSERT INTO sensor_readings (id, sensor_id, device_id, reading_value, reading_time) VALUES",
-            self.readings_buffer
-        )
+        if self._flusher:
+            # swap buffers so the producer keeps filling while the batch is written
+            batch, self.readings_buffer = self.readings_buffer, []
+            self._flusher.submit(batch)
+            return
+
+        self.client.execute(self.INSERT_READINGS, self.readings_buffer)
         self.readings_buffer = []
 
+    def insert_readings_columnar(self, columns):
+        """
+        Insert a block of readings column-wise using the driver's NumPy mode,
+        so values and timestamps are serialized as whole arrays instead of
+        per-row tuples.
+
+        columns: a DataFrame, or a dict of id, sensor_id, device_id,
+        reading_value, reading_time. UUID columns hold str/uuid.UUID values;
+        reading_time may be datetime64 or int64 epoch microseconds.
+        """
+        settings = {"use_numpy": True}
+        if isinstance(columns, pd.DataFrame):
+            df = columns[list(self.READING_COLUMNS)]
+            if df["reading_time"].dtype.kind in "iu":
+                df = df.assign(reading_time=df["reading_time"].values.astype("datetime64[us]"))
+            return self.client.insert_dataframe(self.INSERT_READINGS, df, settings=settings)
+
+        data = []
+        for name in self.READING_COLUMNS:
+            col = columns[name]
+            if name == "reading_time":
+                col = np.asarray(col)
+                if col.dtype.kind in "iu":
+                    col = col.astype("datetime64[us]")
+                col = col.astype("datetime64[s]")
+            elif name == "reading_value":
+                col = np.asarray(col, dtype=np.float64)
+            else:
+                # UUIDs have no NumPy column type; the driver converts them in place
+                col = list(col)
+            data.append(col)
+        return self.client.execute(self.INSERT_READINGS, data, columnar=True, settings=settings)
+
     def force_flush(self):
         """Flush remaining records"""
         print("Forcing flush of remaining readings...: ",
               len(self.readings_buffer))
         self.flush_readings()
+        if self._flusher:
+            self._flusher.drain()
+
+    def close(self):
+        """Flush remaining records, stop background writers and disconnect"""
+        self.flush_readings()
+        if self._flusher:
+            self._flusher.close()
+        self.client.disconnect()
 
     def get_all_tables(self):
         """Get all tables in the ClickHouse database"""
@@ -139,44 +265,269 @@ class ClickHouseClient:
             return self.client.execute(query, params)
         return self.client.execute(query)
 
-    def clickhouse_to_df(self, query, params=None):
+    def materialize_projections(self):
+        """
+        Build the sensor_stats projection for parts written before it existed
+        (a mutation), so queries on them do not fall back to a full scan.
+        Does nothing when every active part already has it.
+        """
+        missing = self.client.execute(
+            """SELECT count() FROM system.parts
+            WHERE database = 'iot' AND table = 'sensor_readings' AND active
+              AND NOT has(projections, 'sensor_stats')""")[0][0]
+        if not missing:
+            return False
+        print(f"Materializing the sensor_stats projection on {missing} existing parts")
+        self.client.execute("ALTER TABLE iot.sensor_readings MATERIALIZE PROJECTION sensor_stats "
+                            "SETTINGS mutations_sync = 1")
+        return True
+
+    def _rollup_select(self, per, granularity, where=""):
+        keys = ", ".join(self.ROLLUP_KEYS[per])
+        states = self.ROLLUP_STATES.format(bucket=self.ROLLUP_BUCKETS[granularity])
+        return f"SELECT {keys}, {states} FROM sensor_readings {where} GROUP BY {keys}, bucket"
+
+    def create_rollups(self):
+        """
+        AggregatingMergeTree rollups per sensor and per device, hourly and
+        daily, keeping avg/quantiles/argMax/argMin states plus min, max and
+        count. Each is written by a materialized view TO the table, without
+        POPULATE (which misses rows inserted while it runs).
+
+        The views see every insert from their creation on, whatever its
+        reading_time. If sensor_readings already holds readings, merges are
+        stopped, its active parts are recorded in rollup_backfill_parts and
+        backfill_rollups() rolls up exactly those parts, so late readings
+        are never missed and no reading is counted twice. Run it before
+        ingesting: an insert racing the view creation may be missed or
+        counted twice.
+        """
+        tables = {r[0] for r in self.client.execute("SHOW TABLES FROM iot")}
+        if "rollup_backfill" in tables:
+            # Rollups from a version whose views filtered on a reading_time cutoff: rebuild them
+            for table in self.ROLLUPS.values():
+                self.client.execute(f"DROP VIEW IF EXISTS {table}_mv")
+                self.client.execute(f"DROP TABLE IF EXISTS {table}")
+            self.client.execute("DROP TABLE rollup_backfill")
+            tables = {r[0] for r in self.client.execute("SHOW TABLES FROM iot")}
+
+        self.client.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_backfill_parts (
+            partition_id String,  # '*' marks the whole backfill
+            parts Array(String),  # active parts of the partition when the views were created
+            done UInt8
+        ) ENGINE = ReplacingMergeTree(done)
+        ORDER BY partition_id;
+        """)
+        for (per, granularity), table in self.ROLLUPS.items():
+            keys = self.ROLLUP_KEYS[per]
+            self.client.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {", ".join(f"{key} UUID" for key in keys)},
+                {self.ROLLUP_COLUMNS}
+            ) ENGINE = AggregatingMergeTree()
+            PARTITION BY toYYYYMM(bucket)
+            ORDER BY ({", ".join(keys)}, bucket);
+            """)
+
+        if all(f"{table}_mv" in tables for table in self.ROLLUPS.values()):
+            self._rollup_state = None
+            self.backfill_rollups()  # no-op unless an earlier backfill was interrupted
+            return
+        backfill = self.client.execute("SELECT count() FROM sensor_readings")[0][0] > 0
+        if backfill:
+            # Keep the snapshot's parts intact until backfill_rollups() has read them
+            self.client.execute("SYSTEM STOP MERGES iot.sensor_readings")
+        # Without their views the rollups may be stale (e.g. a rollups=False run dropped them)
+        self.client.execute("TRUNCATE TABLE rollup_backfill_parts")
+        for table in self.ROLLUPS.values():
+            self.client.execute(f"TRUNCATE TABLE {table}")
+        for (per, granularity), table in self.ROLLUPS.items():
+            self.client.execute(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {table}_mv TO {table} AS "
+                                + self._rollup_select(per, granularity))
+        if backfill:
+            self.client.execute("""
+            INSERT INTO rollup_backfill_parts
+            SELECT partition_id, groupArray(name), 0 FROM system.parts
+            WHERE database = 'iot' AND table = 'sensor_readings' AND active
+            GROUP BY partition_id
+            """)
+            self.client.execute("INSERT INTO rollup_backfill_parts SELECT '*', [], 0")
+            print("sensor_readings is not empty: backfilling the rollups from its current parts")
+        self._rollup_state = None
+        self.backfill_rollups()
+
+    def backfill_rollups(self):
+        """
+        Insert the parts recorded by create_rollups() into every rollup, one
+        monthly partition at a time, then restart merges. Finished
+        partitions are recorded, so a rerun after an interruption skips
+        them. Returns True once done (immediately if there is nothing to do).
+        """
+        rows = self.client.execute("SELECT partition_id, parts, done FROM rollup_backfill_parts FINAL")
+        marker = [r for r in rows if r[0] == "*"]
+        if not marker or marker[0][2]:
+            return True
+
+        start = time.perf_counter()
+        for partition, parts, done in sorted(r for r in rows if r[0] != "*"):
+            if done:
+                continue
+            where = f"WHERE _partition_id = '{partition}' AND has(%(parts)s, _part)"
+            for (per, granularity), table in self.ROLLUPS.items():
+                self.client.execute(f"INSERT INTO {table} " + self._rollup_select(per, granularity, where),
+                                    {"parts": parts})
+            self.client.execute("INSERT INTO rollup_backfill_parts SELECT %(partition)s, %(parts)s, 1",
+                                {"partition": partition, "parts": parts})
+            self.rollup_stats["backfilled_partitions"] += 1
+            print(f"Backfilled rollups for partition {partition}")
+        self.client.execute("INSERT INTO rollup_backfill_parts SELECT '*', [], 1")
+        self.client.execute("SYSTEM START MERGES iot.sensor_readings")
+        self.rollup_stats["backfill_s"] += time.perf_counter() - start
+        self._rollup_state = None
+        return True
+
+    def _rollups(self):
+        """
+        True once the rollups hold every reading, False while backfilling,
+        None without rollups. With rollups=False the views an earlier run may
+        have left on the server are ignored, so "auto" reads the raw table.
+        """
+        if not self.rollups:
+            return None
+        if self._rollup_state is None:
+            exists = self.client.execute(
+                "SELECT count() FROM system.tables WHERE database = 'iot' AND name = 'device_daily_rollup_mv'")[0][0]
+            if not exists:
+                return None
+            marker = self.client.execute(
+                "SELECT done FROM iot.rollup_backfill_parts FINAL WHERE partition_id = '*'")
+            self._rollup_state = bool(marker[0][0]) if marker else True
+        return self._rollup_state
+
+    def _use_rollup(self, source):
+        """
+        source: "raw", "rollup" or "auto". Auto reads the rollups once they
+        hold every reading (their backfill, if any, has finished).
+        """
+        if source not in self.SOURCES:
+            raise ValueError(f"source must be one of {self.SOURCES}, got {source!r}")
+        if source == "raw":
+            return False
+        covered = bool(self._rollups())
+        if source == "rollup" and not covered:
+            raise ValueError("the rollups do not hold every reading yet; create the client with rollups=True "
+                             "and run backfill_rollups()")
+        return covered
+
+    def get_rollup_stats(self):
+        state = self._rollups()
+        return dict(self.rollup_stats, enabled=state is not None, backfilled=bool(state))
+
+    def clickhouse_to_df(self, query, params=None, settings=None):
         """
         Execute a query on a clickhouse_driver Client and return a DataFrame.
         """
         if params:
-            rows, cols = self.client.execute(query, params, with_column_types=True)
+            rows, cols = self.client.execute(query, params, with_column_types=True, settings=settings)
         else:
-            rows, cols = self.client.execute(query, with_column_types=True)
+            rows, cols = self.client.execute(query, with_column_types=True, settings=settings)
 
         column_names = [col[0] for col in cols]
 
         return pd.DataFrame(rows, columns=column_names)
 
     # New analytical methods
-    def get_avg_reading_per_device_per_day(self):
-        query = """
+    def get_avg_reading_per_device_per_day(self, source="auto"):
+        """Last 7 days; reads device_daily_rollup once it holds every reading (see _use_rollup)."""
+        query, settings = self._avg_reading_query(source)
+        return self.clickhouse_to_df(query, settings=settings)
+
+    def _avg_reading_query(self, source):
+        if self._use_rollup(source):
+            metrics = """
+            SELECT device_id, toDate(bucket) AS day, avgMerge(avg_value) AS avg_reading
+            FROM device_daily_rollup
+            WHERE bucket >= today() - 7
+            GROUP BY device_id, day
+            """
+        else:
+            metrics = """
+            SELECT device_id, toDate(reading_time) AS day, avg(reading_value) AS avg_reading
+            FROM sensor_readings
+            WHERE reading_time >= today() - 7
+            GROUP BY device_id, day
+            """
+        query = f"""
         SELECT
             d.id AS device_id,
             d.name AS device_name,
             d.status,
             metrics.day,
-            metrics.value_sum / metrics.reading_count AS avg_reading
+            metrics.avg_reading
         FROM devices d
-        JOIN (
-            SELECT
-                device_id,
-                day,
-                sum(value_sum) AS value_sum,
-                sum(reading_count) AS reading_count
-            FROM device_daily_metrics
-            WHERE day >= today() - 7
-            GROUP BY device_id, day
-        ) metrics ON d.id = metrics.device_id
+        JOIN ({metrics}) metrics ON d.id = metrics.device_id
         ORDER BY device_id, day
         """
+        return query, None
+
+    def get_reading_rollup(self, per="device", granularity="day", days=7, source="auto"):
+        """
+        avg, min, max, p50/p90/p99 and count per device or sensor per hour or
+        day over the last `days` days, merged from the matching rollup.
+        """
+        if (per, granularity) not in self.ROLLUPS:
+            raise ValueError(f"(per, granularity) must be one of {list(self.ROLLUPS)}")
+        keys = ", ".join(self.ROLLUP_KEYS[per])
+        if self._use_rollup(source):
+            inner = f"""
+            SELECT {keys}, bucket,
+                   avgMerge(avg_value) AS avg_value, min(min_value) AS min_value, max(max_value) AS max_value,
+                   quantilesMerge(0.5, 0.9, 0.99)(quantiles_value) AS q, sum(reading_count) AS reading_count
+            FROM {self.ROLLUPS[per, granularity]}
+            WHERE bucket >= today() - {int(days)}
+            GROUP BY {keys}, bucket
+            """
+        else:
+            inner = f"""
+            SELECT {keys}, {self.ROLLUP_BUCKETS[granularity]} AS bucket,
+                   avg(reading_value) AS avg_value, min(reading_value) AS min_value, max(reading_value) AS max_value,
+                   quantiles(0.5, 0.9, 0.99)(reading_value) AS q, count() AS reading_count
+            FROM sensor_readings
+            WHERE reading_time >= today() - {int(days)}
+            GROUP BY {keys}, bucket
+            """
+        query = f"""
+        SELECT {keys}, bucket, avg_value, min_value, max_value,
+               q[1] AS p50, q[2] AS p90, q[3] AS p99, reading_count
+        FROM ({inner})
+        ORDER BY {keys}, bucket
+        """
         return self.clickhouse_to_df(query)
 
-    def get_sensor_extremes_per_device(self):
+    @staticmethod
+    def _projection_settings(use_projection):
+        return None if use_projection else {"optimize_use_projections": 0}
+
+    def get_sensor_extremes_per_device(self, strategy="window", use_projection=True, source="auto"):
+        """
+        Merges the argMax/argMin states of device_daily_rollup when it holds
+        every reading (source="auto"); otherwise, or with source="raw":
+        strategy="window": RANK() over every reading per device (ties kept).
+        strategy="argmax": max/argMax and min/argMin per sensor (served by
+        the sensor_stats projection), then argMax/argMin per device.
+        use_projection=False disables projection reads for comparison.
+        """
+        query, settings = self._extremes_query(strategy, use_projection, source)
+        return self.clickhouse_to_df(query, settings=settings)
+
+    def _extremes_query(self, strategy, use_projection, source):
+        if strategy not in self.EXTREMES_STRATEGIES:
+            raise ValueError(f"strategy must be one of {self.EXTREMES_STRATEGIES}, got {strategy!r}")
+        if self._use_rollup(source):
+            return self.EXTREMES_ROLLUP, None
+        if strategy == "argmax":
+            return self.EXTREMES_ARGMAX, self._projection_settings(use_projection)
         query = """
         SELECT
             ranked.device_id,
@@ -212,9 +563,106 @@ class ClickHouseClient:
            OR ranked.min_rank = 1
         ORDER BY ranked.device_id ASC, ranked.reading_value DESC
         """
-        return self.clickhouse_to_df(query)
+        return query, None
 
-    def get_avg_time_between_readings(self):
+    EXTREMES_ARGMAX = """
+        WITH per_sensor AS (
+            SELECT
+                device_id,
+                sensor_id,
+                max(reading_value)                  AS max_value,
+                argMax(reading_time, reading_value) AS max_time,
+                min(reading_value)                  AS min_value,
+                argMin(reading_time, reading_value) AS min_time
+            FROM sensor_readings
+            GROUP BY device_id, sensor_id
+        ),
+        per_device AS (
+            SELECT device_id, 'MAX' AS extreme_type,
+                   argMax(sensor_id, max_value) AS sensor_id,
+                   max(max_value)               AS reading_value,
+                   argMax(max_time, max_value)  AS reading_time
+            FROM per_sensor GROUP BY device_id
+            UNION ALL
+            SELECT device_id, 'MIN' AS extreme_type,
+                   argMin(sensor_id, min_value) AS sensor_id,
+                   min(min_value)               AS reading_value,
+                   argMin(min_time, min_value)  AS reading_time
+            FROM per_sensor GROUP BY device_id
+        )
+        SELECT
+            e.device_id,
+            d.name AS device_name,
+            e.sensor_id,
+            s.type AS sensor_type,
+            e.reading_value,
+            e.reading_time,
+            e.extreme_type
+        FROM per_device AS e
+        INNER JOIN devices AS d ON d.id = e.device_id
+        INNER JOIN sensors AS s ON s.id = e.sensor_id
+        ORDER BY e.device_id ASC, e.reading_value DESC
+    """
+
+    # One row per device and day in the rollup; the merged states carry (sensor_id, reading_time)
+    EXTREMES_ROLLUP = """
+        WITH per_device AS (
+            SELECT
+                device_id,
+                max(max_value)      AS max_value,
+                argMaxMerge(max_at) AS max_at,
+                min(min_value)      AS min_value,
+                argMinMerge(min_at) AS min_at
+            FROM device_daily_rollup
+            GROUP BY device_id
+        ),
+        extremes AS (
+            SELECT device_id, 'MAX' AS extreme_type, max_at.1 AS sensor_id,
+                   max_value AS reading_value, max_at.2 AS reading_time
+            FROM per_device
+            UNION ALL
+            SELECT device_id, 'MIN' AS extreme_type, min_at.1 AS sensor_id,
+                   min_value AS reading_value, min_at.2 AS reading_time
+            FROM per_device
+        )
+        SELECT
+            e.device_id,
+            d.name AS device_name,
+            e.sensor_id,
+            s.type AS sensor_type,
+            e.reading_value,
+            e.reading_time,
+            e.extreme_type
+        FROM extremes AS e
+        INNER JOIN devices AS d ON d.id = e.device_id
+        INNER JOIN sensors AS s ON s.id = e.sensor_id
+        ORDER BY e.device_id ASC, e.reading_value DESC
+    """
+
+    # Mean of consecutive gaps = (last - first) / (count - 1), all three in the projection
+    GAPS_AGGREGATE = """
+        SELECT
+            sensor_id,
+            dateDiff('second', min(reading_time), max(reading_time)) / (count() - 1) AS avg_seconds
+        FROM sensor_readings
+        GROUP BY device_id, sensor_id
+        HAVING count() > 1
+    """
+
+    def get_avg_time_between_readings(self, strategy="window", use_projection=True):
+        """
+        strategy="window": lag() over every reading per sensor.
+        strategy="aggregate": (max - min) / (count - 1) per sensor, read from
+        the sensor_stats projection.
+        """
+        query, settings = self._gaps_query(strategy, use_projection)
+        return self.clickhouse_to_df(query, settings=settings)
+
+    def _gaps_query(self, strategy, use_projection):
+        if strategy not in self.GAP_STRATEGIES:
+            raise ValueError(f"strategy must be one of {self.GAP_STRATEGIES}, got {strategy!r}")
+        if strategy == "aggregate":
+            return self.GAPS_AGGREGATE, self._projection_settings(use_projection)
         query = """
         WITH
             -- Step 1: compute “prev_time” per sensor
@@ -243,4 +691,16 @@ class ClickHouseClient:
         FROM diffs
         GROUP BY sensor_id
         """
-        return self.clickhouse_to_df(query)
+        return query, None
+
+    def analytical_queries(self, source="auto"):
+        """
+        {name: (sql, settings)} for the three benchmark queries with their
+        default strategies, for running them through another client (e.g.
+        AsyncClickHouseHTTPClient.query_many).
+        """
+        return {
+            "avg_reading_per_device_per_day": self._avg_reading_query(source),
+            "sensor_extremes_per_device": self._extremes_query("window", True, source),
+            "avg_time_between_readings": self._gaps_query("window", True),
+        }
@@ -0,0 +1,358 @@
+"""
+Async ClickHouse client over the HTTP interface (port 8123).
+
+ClickHouseClient.clickhouse_to_df receives the whole result as a list of
+tuples over the native protocol and only then builds a DataFrame, so a large
+result is held twice. Here results are requested as
+RowBinaryWithNamesAndTypes (gzip-compressed on the wire) and decoded while
+the response streams in, one DataFrame per block_rows rows. Rows whose
+columns are all fixed width (numbers, dates, UUIDs) are decoded as one NumPy
+structured array per block; strings fall back to a per-row loop.
+
+One aiohttp session with a pool of pool_size connections serves every
+query, so several analytical queries can run at once:
+
+    async with AsyncClickHouseHTTPClient() as http:
+        results = await http.query_many(ClickHouseClient().analytical_queries())
+
+The decoder does not need a server: record_dir saves every response body,
+and decode_recorded() replays one through the same decoder. The client can
+also be pointed at any stub HTTP server with url.
+"""
+import asyncio
+import os
+import struct
+import sys
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from iot_data import uuid_strings
+
+# type -> (NumPy dtype, struct format); String has neither
+_FIXED = {
+    "UInt8": ("<u1", "<B"), "UInt16": ("<u2", "<H"), "UInt32": ("<u4", "<I"), "UInt64": ("<u8", "<Q"),
+    "Int8": ("<i1", "<b"), "Int16": ("<i2", "<h"), "Int32": ("<i4", "<i"), "Int64": ("<i8", "<q"),
+    "Float32": ("<f4", "<f"), "Float64": ("<f8", "<d"), "Bool": ("<u1", "<B"),
+    "Date": ("<u2", "<H"), "Date32": ("<i4", "<i"), "DateTime": ("<u4", "<I"), "DateTime64": ("<i8", "<q"),
+    "Enum8": ("<i1", "<b"), "Enum16": ("<i2", "<h"), "UUID": ("V16", None),
+}
+# ClickHouse sends a UUID as two little-endian UInt64 halves
+_UUID_ORDER = [7, 6, 5, 4, 3, 2, 1, 0, 15, 14, 13, 12, 11, 10, 9, 8]
+
+
+class _Short(Exception):
+    """Not enough bytes buffered yet; wait for the next chunk."""
+
+
+def _varint(buf, pos):
+    result = shift = 0
+    while True:
+        if pos >= len(buf):
+            raise _Short
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class _Column:
+    """Reads and converts one RowBinary column type."""
+
+    def __init__(self, type_name):
+        self.type_name = type_name
+        t = type_name
+        if t.startswith("LowCardinality("):
+            t = t[len("LowCardinality("):-1]
+        self.nullable = t.startswith("Nullable(")
+        if self.nullable:
+            t = t[len("Nullable("):-1]
+        self.kind = t.split("(", 1)[0]
+        self.precision = 0
+        self.struct = None
+        if self.kind == "DateTime64":
+            self.precision = int(t[len("DateTime64("):].split(",")[0].rstrip(")"))
+        if self.kind == "String":
+            self.dtype = None
+        elif self.kind == "FixedString":
+            self.dtype = np.dtype(f"S{int(t[len('FixedString('):-1])}")
+        elif self.kind in _FIXED:
+            dtype, fmt = _FIXED[self.kind]
+            self.dtype = np.dtype(dtype)
+            self.struct = struct.Struct(fmt) if fmt else None
+        else:
+            raise ValueError(f"unsupported column type {type_name!r}")
+
+    @property
+    def fixed(self):
+        """Same width in every row, so it fits a NumPy structured dtype."""
+        return self.dtype is not None and not self.nullable
+
+    def read(self, buf, pos):
+        if self.nullable:
+            if pos >= len(buf):
+                raise _Short
+            if buf[pos]:
+                return None, pos + 1
+            pos += 1
+        if self.dtype is None:
+            size, pos = _varint(buf, pos)
+        else:
+            size = self.dtype.itemsize
+        end = pos + size
+        if end > len(buf):
+            raise _Short
+        if self.dtype is None:
+            return bytes(buf[pos:end]).decode("utf-8", "replace"), end
+        if self.struct is not None:
+            return self.struct.unpack_from(buf, pos)[0], end
+        return bytes(buf[pos:end]), end
+
+    def convert(self, values):
+        """A typed array (fast path) or list of read() values -> column data."""
+        if isinstance(values, list):
+            if self.dtype is None:
+                return np.array(values, dtype=object)
+            if self.nullable and any(v is None for v in values):
+                return np.array(values, dtype=object)
+            values = np.array(values, dtype=self.dtype)
+        if self.kind == "UUID":
+            return uuid_strings(values.view(np.uint8).reshape(-1, 16)[:, _UUID_ORDER])
+        if self.kind == "DateTime":
+            return values.astype(np.int64).astype("datetime64[s]")
+        if self.kind in ("Date", "Date32"):
+            return values.astype(np.int64).astype("datetime64[D]")
+        if self.kind == "DateTime64":
+            return (values * 10 ** (9 - self.precision)).astype("datetime64[ns]")
+        if self.kind == "Bool":
+            return values.astype(bool)
+        return values
+
+
+class RowBinaryDecoder:
+    """
+    Incremental RowBinaryWithNamesAndTypes decoder. feed() it response bytes
+    as they arrive, in chunks of any size; it returns a DataFrame for every
+    block_rows complete rows. finish() returns the rest. DateTime columns
+    come back as naive UTC datetime64.
+    """
+
+    def __init__(self, block_rows=65536):
+        self.block_rows = block_rows
+        self.names = None
+        self.types = None
+        self.rows = 0
+        self._columns = None
+        self._record = None  # structured dtype when every column is fixed width
+        self._buf = bytearray()
+        self._pending = []
+        self._pending_rows = 0
+        self._frames = 0
+
+    def _header(self):
+        count, pos = _varint(self._buf, 0)
+        fields = []
+        for _ in range(2 * count):
+            size, pos = _varint(self._buf, pos)
+            if pos + size > len(self._buf):
+                raise _Short
+            fields.append(bytes(self._buf[pos:pos + size]).decode())
+            pos += size
+        self.names, self.types = fields[:count], fields[count:]
+        self._columns = [_Column(t) for t in self.types]
+        if all(c.fixed for c in self._columns):
+            self._record = np.dtype([(f"c{i}", c.dtype) for i, c in enumerate(self._columns)])
+        else:
+            self._pending = [[] for _ in self._columns]
+        return pos
+
+    def feed(self, data):
+        self._buf += data
+        frames = []
+        pos = 0
+        if self._columns is None:
+            try:
+                pos = self._header()
+            except _Short:
+                return frames
+        if self._record is not None:
+            pos = self._feed_fixed(pos, frames)
+        else:
+            pos = self._feed_rows(pos, frames)
+        del self._buf[:pos]
+        return frames
+
+    def _feed_fixed(self, pos, frames):
+        size = self._record.itemsize
+        while len(self._buf) - pos >= size:
+            n = min((len(self._buf) - pos) // size, self.block_rows - self._pending_rows)
+            self._pending.append(np.frombuffer(self._buf, self._record, count=n, offset=pos).copy())
+            self._pending_rows += n
+            pos += n * size
+            if self._pending_rows == self.block_rows:
+                frames.append(self._flush())
+        return pos
+
+    def _feed_rows(self, pos, frames):
+        buf, columns = self._buf, self._columns
+        while pos < len(buf):
+            row = []
+            end = pos
+            try:
+                for column in columns:
+                    value, end = column.read(buf, end)
+                    row.append(value)
+            except _Short:
+                break
+            pos = end
+            for values, value in zip(self._pending, row):
+                values.append(value)
+            self._pending_rows += 1
+            if self._pending_rows == self.block_rows:
+                frames.append(self._flush())
+        return pos
+
+    def _flush(self):
+        if self._record is not None:
+            rec = np.concatenate(self._pending) if self._pending else np.empty(0, self._record)
+            data = {name: c.convert(np.ascontiguousarray(rec[f"c{i}"]))
+                    for i, (name, c) in enumerate(zip(self.names, self._columns))}
+            self._pending = []
+        else:
+            data = {name: c.convert(values) for name, c, values in zip(self.names, self._columns, self._pending)}
+            self._pending = [[] for _ in self._columns]
+        self.rows += self._pending_rows
+        self._pending_rows = 0
+        self._frames += 1
+        return pd.DataFrame(data)
+
+    def finish(self):
+        """
+        The last, partial block (or an empty frame with the column names if
+        there were no rows). Leftover bytes mean the body was cut short or
+        the server appended an error after streaming had started. Fixed-width
+        rows can swallow such an error as data; where that matters, run the
+        query with settings={"wait_end_of_query": 1} so errors come back as
+        an HTTP status (the server then buffers the result).
+        """
+        if self._buf:
+            raise RuntimeError("incomplete RowBinary result, trailing bytes: "
+                               + bytes(self._buf[-1000:]).decode("utf-8", "replace").strip())
+        if self._columns is None:
+            return None
+        if self._pending_rows or not self._frames:
+            return self._flush()
+        return None
+
+
+def decode_recorded(path, block_rows=65536, read_size=1 << 16):
+    """Yield the DataFrames of a response body saved with record_dir, as iter_frames did."""
+    decoder = RowBinaryDecoder(block_rows)
+    with open(path, "rb") as f:
+        while data := f.read(read_size):
+            yield from decoder.feed(data)
+    frame = decoder.finish()
+    if frame is not None:
+        yield frame
+
+
+class AsyncClickHouseHTTPClient:
+    """
+    pool_size: connections kept open, i.e. queries running at once.
+    compression: ask for gzip responses (enable_http_compression=1).
+    block_rows: rows per streamed DataFrame.
+    record_dir: save each named query's decompressed body as <name>.rowbinary.
+    """
+    FORMAT = "RowBinaryWithNamesAndTypes"
+
+    def __init__(self, url="http://localhost:8123", user="myuser", password="mypass", database="iot",
+                 pool_size=4, compression=True, block_rows=65536, read_size=1 << 16, record_dir=None):
+        self.url = url
+        self.user = user
+        self.password = password
+        self.database = database
+        self.pool_size = pool_size
+        self.compression = compression
+        self.block_rows = block_rows
+        self.read_size = read_size
+        self.record_dir = record_dir
+        self._session = None
+        self.stats = {"queries": 0, "frames": 0, "rows": 0, "body_bytes": 0}
+
+    def _get_session(self):
+        # Created on first use so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                headers={"X-ClickHouse-User": self.user, "X-ClickHouse-Key": self.password})
+        return self._session
+
+    async def iter_frames(self, query, settings=None, name=None):
+        """Run one query and yield its result as DataFrames of block_rows rows while it streams."""
+        params = {"database": self.database, "default_format": self.FORMAT, **(settings or {})}
+        headers = {"Accept-Encoding": "gzip" if self.compression else "identity"}
+        if self.compression:
+            params["enable_http_compression"] = 1
+        decoder = RowBinaryDecoder(self.block_rows)
+        record = None
+        if self.record_dir and name:
+            record = open(os.path.join(self.record_dir, f"{name}.rowbinary"), "wb")
+        try:
+            async with self._get_session().post(self.url, params=params, headers=headers,
+                                                data=query.strip().rstrip(";").encode()) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"ClickHouse HTTP {resp.status}: {(await resp.text()).strip()}")
+                self.stats["queries"] += 1
+                # aiohttp has already undone the gzip here
+                async for data in resp.content.iter_chunked(self.read_size):
+                    self.stats["body_bytes"] += len(data)
+                    if record:
+                        record.write(data)
+                    for frame in decoder.feed(data):
+                        yield self._counted(frame)
+        finally:
+            if record:
+                record.close()
+        frame = decoder.finish()
+        if frame is not None:
+            yield self._counted(frame)
+
+    def _counted(self, frame):
+        self.stats["frames"] += 1
+        self.stats["rows"] += len(frame)
+        return frame
+
+    async def query_df(self, query, settings=None, name=None):
+        """The whole result as one DataFrame, built from the streamed blocks."""
+        frames = [frame async for frame in self.iter_frames(query, settings, name)]
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    async def query_many(self, queries):
+        """
+        Run {name: sql or (sql, settings)} concurrently over the pool (at
+        most pool_size at a time); returns {name: DataFrame}.
+        """
+        jobs = []
+        for name, query in queries.items():
+            sql, settings = query if isinstance(query, tuple) else (query, None)
+            jobs.append(self.query_df(sql, settings, name))
+        return dict(zip(queries, await asyncio.gather(*jobs)))
+
+    def get_stats(self):
+        return dict(self.stats)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,155 @@
+"""
+Replay check for RowBinaryDecoder, no server needed:
+
+    python replay_recorded.py          # decode fixtures/*.rowbinary and compare
+    python replay_recorded.py --write  # rewrite the fixtures from EXPECTED
+
+Each fixture is a RowBinaryWithNamesAndTypes response body, the bytes
+record_dir saves. readings.rowbinary has only fixed-width columns (UUID,
+DateTime, Float64), so it goes through the structured-array path;
+extremes.rowbinary adds String columns and goes through the per-row path.
+Every fixture is replayed with several read and block sizes, so rows and
+values split across chunks are covered. The exit status is 1 on any
+difference.
+
+--write encodes the rows with struct, independently of the decoder, in
+ClickHouse's layout: LEB128 lengths, little-endian numbers, DateTime as
+UInt32 seconds, UUID as its two UInt64 halves (high half first). To check
+against a real server instead, save a body with
+AsyncClickHouseHTTPClient(record_dir=...) and replay it the same way.
+"""
+import os
+import struct
+import sys
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from clickhouse_http_client import decode_recorded
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+EXPECTED = {
+    "readings": (
+        [("id", "UUID"), ("sensor_id", "UUID"), ("reading_time", "DateTime"), ("reading_value", "Float64")],
+        [
+            ("0b7e7dde-3f4a-4c2e-9d1f-5a6b7c8d9e0f", "4e3a2b1c-0d9e-4f8a-b7c6-d5e4f3a2b1c0",
+             "2025-06-01 00:00:00", 21.5),
+            ("f0e1d2c3-b4a5-4968-8776-655443322110", "4e3a2b1c-0d9e-4f8a-b7c6-d5e4f3a2b1c0",
+             "2025-06-01 00:05:00", -3.25),
+            ("00000000-0000-4000-8000-000000000001", "ffffffff-ffff-4fff-bfff-ffffffffffff",
+             "1970-01-01 00:00:01", 0.0),
+            ("123e4567-e89b-42d3-a456-426614174000", "ffffffff-ffff-4fff-bfff-ffffffffffff",
+             "2106-02-07 06:28:15", 1e300),
+            ("9a8b7c6d-5e4f-4a3b-8c2d-1e0f9a8b7c6d", "4e3a2b1c-0d9e-4f8a-b7c6-d5e4f3a2b1c0",
+             "2024-12-31 23:59:59", 98.765432101234),
+        ],
+    ),
+    "extremes": (
+        [("device_id", "UUID"), ("device_name", "String"), ("sensor_id", "UUID"),
+         ("reading_value", "Float64"), ("reading_time", "DateTime"), ("extreme_type", "LowCardinality(String)")],
+        [
+            ("5f1d7a3e-2b4c-4d6e-8f0a-1b2c3d4e5f60", "Gerät Nord", "4e3a2b1c-0d9e-4f8a-b7c6-d5e4f3a2b1c0",
+             99.9, "2025-05-30 12:00:00", "MAX"),
+            ("5f1d7a3e-2b4c-4d6e-8f0a-1b2c3d4e5f60", "Gerät Nord", "ffffffff-ffff-4fff-bfff-ffffffffffff",
+             -40.0, "2025-05-28 03:15:30", "MIN"),
+            ("6a2e8b4f-3c5d-4e7f-9a1b-2c3d4e5f6071", "", "00000000-0000-4000-8000-000000000001",
+             0.5, "2025-06-01 00:00:00", "MAX"),
+        ],
+    ),
+}
+
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _string(s):
+    data = s.encode()
+    return _varint(len(data)) + data
+
+
+def encode(columns, rows):
+    """RowBinaryWithNamesAndTypes body for the given (name, type) columns and rows."""
+    body = _varint(len(columns))
+    body += b"".join(_string(name) for name, _ in columns)
+    body += b"".join(_string(type_name) for _, type_name in columns)
+    for row in rows:
+        for (_, type_name), value in zip(columns, row):
+            if type_name == "UUID":
+                n = uuid.UUID(value).int
+                body += struct.pack("<QQ", n >> 64, n & (2 ** 64 - 1))
+            elif type_name == "DateTime":
+                ts = datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+                body += struct.pack("<I", int(ts.timestamp()))
+            elif type_name == "Float64":
+                body += struct.pack("<d", value)
+            else:
+                body += _string(value)
+    return body
+
+
+def expected_frame(columns, rows):
+    df = pd.DataFrame(rows, columns=[name for name, _ in columns])
+    for name, type_name in columns:
+        if type_name == "DateTime":
+            df[name] = pd.to_datetime(df[name])
+    return df
+
+
+def check(name, read_size, block_rows):
+    columns, rows = EXPECTED[name]
+    frames = list(decode_recorded(os.path.join(FIXTURES, f"{name}.rowbinary"), block_rows, read_size))
+    got = pd.concat(frames, ignore_index=True)
+    want = expected_frame(columns, rows)
+    problems = []
+    if list(got.columns) != list(want.columns):
+        problems.append(f"columns {list(got.columns)}")
+    elif len(got) != len(want):
+        problems.append(f"{len(got)} rows")
+    else:
+        for col, type_name in columns:
+            a, b = got[col].to_numpy(), want[col].to_numpy()
+            same = np.array_equal(a.astype("datetime64[s]"), b.astype("datetime64[s]")) \
+                if type_name == "DateTime" else (a == b).all()
+            if not same:
+                problems.append(f"{col}: {list(a)} != {list(b)}")
+    expected_frames = -(-len(rows) // block_rows)
+    if len(frames) != expected_frames:
+        problems.append(f"{len(frames)} frames, expected {expected_frames}")
+    return problems
+
+
+def main(argv):
+    if "--write" in argv:
+        os.makedirs(FIXTURES, exist_ok=True)
+        for name, (columns, rows) in EXPECTED.items():
+            with open(os.path.join(FIXTURES, f"{name}.rowbinary"), "wb") as f:
+                f.write(encode(columns, rows))
+            print(f"Wrote fixtures/{name}.rowbinary")
+        return 0
+
+    failed = 0
+    for name in EXPECTED:
+        for read_size in (1, 7, 1 << 16):
+            for block_rows in (1, 2, 65536):
+                problems = check(name, read_size, block_rows)
+                failed += bool(problems)
+                if problems:
+                    print(f"{name} read_size={read_size} block_rows={block_rows}: " + "; ".join(problems))
+    print("FAILED" if failed else f"OK: {len(EXPECTED)} fixtures decoded identically at every read/block size")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,12 +1,10 @@
+import os
+import sys
 import time
-from faker import Faker
 from clickhouse_client import ClickHouseClient
 
-from datetime import datetime, timedelta
-import random
-import uuid
-
-fake = Faker()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from iot_data import IoTDataGenerator, as_rows, uuid_strings
 
 
 def timed(fn, *args, **kwargs):
@@ -28,47 +26,33 @@ S = 10    # sensors per device
 R = 100000   # readings per sensor
 A = 5    # alerts per device
 
-now = datetime.utcnow()
+generator = IoTDataGenerator(devices=D, sensors_per_device=S,
+                             readings_per_sensor=R, alerts_per_device=A)
 
 # latency store
 
 def insert():
     clickhouse_client.force_flush()
     start_time = time.perf_counter()
-    for i in range(1, D+1):
-        print(f"-> Device {i}/{D}")
-        name = f"dev{i}"
-        loc = fake.city()
-        st = random.choice(["online", "offline", "unknown"])
-
-        device_id = uuid.uuid4()
-        _, t = timed(clickhouse_client.insert_device,
-                     str(device_id), name, loc, st)
-
-        for j in range(1, S+1):
-            print(f"\t-> Sensor {j}/{S}")
-            typ = random.choice(["temp", "hum", "press"])
-            sensor_id = uuid.uuid4()
-
-            _, t = timed(clickhouse_client.insert_sensor,
-                         sensor_id, device_id, typ)
-
-            for k in range(1, R+1):
-                tstamp = now - timedelta(days=random.randint(0, 10),
-                                         minutes=k * random.random() * 5)
-                val = random.random() * 100
-                reading_id = uuid.uuid4()
-
-                _, t = timed(clickhouse_client.insert_reading,
-                             reading_id, sensor_id, device_id, val, tstamp)
-
-        for _ in range(A):
-            tstamp = now - timedelta(hours=random.random()*24)
-            atype = random.choice(["overheat", "disconnect", "low-battery"])
-            desc = fake.sentence(nb_words=6)
-            alert_id = uuid.uuid4()
-            clickhouse_client.insert_alert(
-                alert_id, device_id, atype, tstamp, desc)
+
+    for row in as_rows(generator.devices(), ["id", "name", "location", "status"]):
+        clickhouse_client.insert_device(*row)
+
+    for row in as_rows(generator.sensors(), ["id", "device_id", "type"]):
+        clickhouse_client.insert_sensor(*row)
+
+    for chunk in generator.iter_readings(chunk_size=clickhouse_client.batch_size):
+        print(f"Inserting {len(chunk['id'])} readings to ClickHouse (columnar)")
+        clickhouse_client.insert_readings_columnar({
+            "id": uuid_strings(chunk["id"]),
+            "sensor_id": uuid_strings(chunk["sensor_id"]),
+            "device_id": uuid_strings(chunk["device_id"]),
+            "reading_value": chunk["reading_value"],
+            "reading_time": chunk["reading_time"],
+        })
+
+    for row in as_rows(generator.alerts(), ["id", "device_id", "alert_type", "alert_time", "description"]):
+        clickhouse_client.insert_alert(*row)
 
     clickhouse_client.force_flush()
     end_time = time.perf_counter()
@@ -105,4 +89,4 @@ def execute_queries():
 
 insert()
 get_counts()
-execute_queries()
\ No newline at end of file
+execute_queries()
@@ -1,12 +1,72 @@
 # influx_client.py
+import json
+import os
+import sys
 import time
-from datetime import datetime, timezone
-from influxdb_client import InfluxDBClient, Point, WritePrecision
-from influxdb_client.client.write_api import SYNCHRONOUS
+from datetime import datetime, timedelta, timezone
+from influxdb_client import InfluxDBClient, Point, TaskCreateRequest, WritePrecision
+from influxdb_client.client.write_api import SYNCHRONOUS, WriteOptions, WriteType
+import numpy as np
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from background_flusher import BackgroundFlusher
+from retry_queue import RetryQueue
+from stream_agg import StreamingAggregator, canonical_id
+
+# Line-protocol escaping for tag values
+ESCAPE_TAG = str.maketrans({"\\": "\\\\", ",": "\\,", "=": "\\=", " ": "\\ "})
+
+
+def _id_keys(col):
+    """Hashable per-row ids: 16-byte voids for (n, 16) uint8 arrays, else str values."""
+    if isinstance(col, np.ndarray) and col.ndim == 2:
+        return np.ascontiguousarray(col, dtype=np.uint8).view("V16").ravel()
+    return np.asarray([str(v) for v in col])
+
+
+def _rfc3339(ts):
+    return ts.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _floor(ts, step):
+    """Round an aware UTC datetime down to a multiple of step since the epoch."""
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return epoch + ((ts - epoch) // step) * step
+
 
 class InfluxDBClient2:
+    """
+    Readings are written either one Point per insert_reading() call, or as
+    pre-rendered line protocol from whole column blocks with
+    insert_readings_lines() (see README.md). gzip compresses write bodies.
+    write_mode="batching" hands each flushed batch to the library's
+    background batching writer instead of waiting for the HTTP write.
+
+    In sync mode failed batches go to a RetryQueue (retry_queue.py): at most
+    retry_max_batches stay in memory, older ones spill to spill_path
+    (None, the default, drops them) and are replayed once writes succeed
+    again. The spill file records url, org and readings_bucket, and a file
+    left for a different bucket is refused rather than replayed into this one.
+
+    downsample=True adds hourly and daily rollup buckets fed by Influx tasks.
+    The query methods then read the coarsest rollup whose interval is within
+    the requested precision (how far the window start may be rounded down).
+    """
+
+    # (every, bucket suffix), coarsest first
+    ROLLUPS = (("1d", "daily"), ("1h", "hourly"))
+    ROLLUP_STEPS = {"1d": timedelta(days=1), "1h": timedelta(hours=1)}
+    PRECISIONS = {"raw": timedelta(0), "1h": timedelta(hours=1), "1d": timedelta(days=1)}
+    # Fields of a rollup row. min/max/first/last are selectors, so their
+    # _time is the time of the selected reading rather than the window start.
+    ROLLUP_FIELDS = ("mean", "count", "min", "max", "first", "last")
+    # Dimension tables in the meta bucket: measurement -> (id tag, other columns)
+    META_TABLES = {"devices": ("device_id", ["name", "location", "status"]),
+                   "sensors": ("sensor_id", ["device_id", "type"])}
+
+    WRITE_MODES = ("sync", "batching")
+
     def __init__(
         self,
         url="http://localhost:8086",
@@ -16,15 +76,36 @@ class InfluxDBClient2:
         meta_bucket="iot_meta",
         alerts_bucket="iot_alerts",
         batch_size=1000,
+        async_flush=False,
+        flush_workers=1,
+        flush_queue_size=2,
+        gzip=False,
+        write_mode="sync",
+        retry_max_batches=8,
+        spill_path=None,
+        retry_drain_s=60.0,
+        downsample=False,
+        meta_refresh_s=300.0,
     ):
+        if write_mode not in self.WRITE_MODES:
+            raise ValueError(f"write_mode must be one of {self.WRITE_MODES}, got {write_mode!r}")
         self.url = url
         self.token = token
         self.org = org
         self.readings_bucket = readings_bucket
         self.meta_bucket = meta_bucket
         self.alerts_bucket = alerts_bucket
+        self.downsample = downsample
+        self.rollup_buckets = {every: f"{readings_bucket}_{suffix}" for every, suffix in self.ROLLUPS}
+        self.gzip = gzip
+        self.write_mode = write_mode
 
-        self.client = InfluxDBClient(url=self.url, token=self.token, org=self.org)
+        # Client-side copy of the devices/sensors tables; queries join in pandas
+        self.meta_refresh_s = meta_refresh_s
+        self._meta, self._meta_synced = {}, {}
+        self._meta_checked, self._meta_dirty = 0.0, False
+
+        self.client = InfluxDBClient(url=self.url, token=self.token, org=self.org, enable_gzip=gzip)
         self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
         self.query_api = self.client.query_api()
         self.buckets_api = self.client.buckets_api()
@@ -32,6 +113,62 @@ class InfluxDBClient2:
         # internal buffer for batch writes
         self.batch_size = batch_size
         self.readings_buffer = []
+        self._line_prefixes = {}  # sensor id -> b"sensor_readings,<tags> value="
+        self.write_stats = {"points": 0, "batches": 0, "errors": 0, "write_s": 0.0, "lines": 0, "render_s": 0.0}
+        self._write_errors = []
+        self.readings_write_api = self._readings_write_api()
+        self.retry_drain_s = retry_drain_s
+        self._retry = RetryQueue(self._write_payload, max_batches=retry_max_batches,
+                                 spill_path=spill_path, spill_target=f"{url} {org} {readings_bucket}",
+                                 name="influx-retry")
+
+        # Opt-in: hand full buffers to writer threads instead of blocking on the write
+        self._flusher = None
+        if async_flush:
+            self._flusher = BackgroundFlusher(
+                self._reading_writer,
+                workers=flush_workers,
+                max_pending=flush_queue_size,
+                name="influx-flusher",
+            )
+
+    def _readings_write_api(self):
+        if self.write_mode == "sync":
+            return self.write_api
+        # Each flushed batch is already one request body, so the batching
+        # writer sends every item on its own, from its background thread
+        return self.client.write_api(
+            write_options=WriteOptions(write_type=WriteType.batching, batch_size=1),
+            success_callback=self._on_batch_written,
+            error_callback=self._on_batch_failed,
+        )
+
+    def _on_batch_written(self, conf, data):
+        self.write_stats["batches"] += 1
+
+    def _on_batch_failed(self, conf, data, exception):
+        self.write_stats["errors"] += 1
+        self._write_errors.append(exception)
+
+    def _write_payload(self, payload):
+        self.readings_write_api.write(
+            bucket=self.readings_bucket, org=self.org, record=payload, write_precision=WritePrecision.NS)
+
+    @staticmethod
+    def _payload(batch):
+        """One line-protocol body for a buffer of Points and/or pre-rendered lines."""
+        return b"\n".join(r if isinstance(r, bytes) else r.to_line_protocol().encode() for r in batch)
+
+    def _reading_writer(self):
+        """Per-thread client for the background flusher."""
+        client = InfluxDBClient(url=self.url, token=self.token, org=self.org, enable_gzip=self.gzip)
+        write_api = client.write_api(write_options=SYNCHRONOUS)
+
+        def write(batch):
+            write_api.write(bucket=self.readings_bucket, org=self.org,
+                            record=self._payload(batch), write_precision=WritePrecision.NS)
+
+        return write, client.close
 
     # -----------------------
     # Buckets / schema
@@ -46,26 +183,191 @@ class InfluxDBClient2:
         Create three buckets: meta_bucket, readings_bucket, alerts_bucket.
         retention_days = 0 => infinite retention
         """
+        self._ensure_bucket(self.readings_bucket, retention_days_readings)
+        self._ensure_bucket(self.meta_bucket, retention_days_meta)
+        self._ensure_bucket(self.alerts_bucket, retention_days_alerts)
+        if self.downsample:
+            self.create_downsampling()
+
+    def _ensure_bucket(self, name, retention_days):
+        b = self.buckets_api.find_bucket_by_name(name)
+        if b is None:
+            retention_rules = None
+            if retention_days and retention_days > 0:
+                retention_rules = [
+                    {
+                        "type": "expire",
+                        "everySeconds": int(retention_days * 24 * 3600),
+                    }
+                ]
+            self.buckets_api.create_bucket(
+                bucket_name=name, org=self.org, retention_rules=retention_rules
+            )
+            print(f"Created bucket: {name}")
 
-        def ensure(name, retention_days):
-            b = self.buckets_api.find_bucket_by_name(name)
-            if b is None:
-                retention_rules = None
-                if retention_days and retention_days > 0:
-                    retention_rules = [
-                        {
-                            "type": "expire",
-                            "everySeconds": int(retention_days * 24 * 3600),
-                        }
-                    ]
-                self.buckets_api.create_bucket(
-                    bucket_name=name, org=self.org, retention_rules=retention_rules
-                )
-                print(f"Created bucket: {name}")
-
-        ensure(self.readings_bucket, retention_days_readings)
-        ensure(self.meta_bucket, retention_days_meta)
-        ensure(self.alerts_bucket, retention_days_alerts)
+    # -----------------------
+    # Downsampling (rollup buckets + tasks)
+    # -----------------------
+    def _rollup_flux(self, every, start, stop):
+        """
+        Flux summarizing raw readings into one row per sensor, window and
+        field (ROLLUP_FIELDS), keeping the sensor_id/device_id tags.
+        """
+        data = f"""from(bucket: "{self.readings_bucket}")
+            |> range(start: {start}, stop: {stop})
+            |> filter(fn: (r) => r._measurement == "sensor_readings" and r._field == "value")"""
+        streams = []
+        for field in ("mean", "count"):
+            streams.append(f"""{data}
+            |> aggregateWindow(every: {every}, fn: {field}, timeSrc: "_start", createEmpty: false)
+            |> set(key: "_field", value: "{field}")""")
+        for field in ("min", "max", "first", "last"):
+            streams.append(f"""{data}
+            |> window(every: {every})
+            |> {field}()
+            |> set(key: "_field", value: "{field}")""")
+        return "union(tables: [\n" + ",\n".join(streams) + "])"
+
+    def create_downsampling(self, retention_days=0):
+        """
+        Create the hourly and daily rollup buckets and one task per bucket
+        that summarizes the last interval of raw readings when it closes.
+        Existing tasks of the same name are replaced.
+        """
+        tasks_api = self.client.tasks_api()
+        for every, bucket in self.rollup_buckets.items():
+            self._ensure_bucket(bucket, retention_days)
+            name = f"downsample_{bucket}"
+            for task in tasks_api.find_tasks(name=name, org=self.org):
+                tasks_api.delete_task(task.id)
+            flux = (f'option task = {{name: "{name}", every: {every}}}\n\n'
+                    + self._rollup_flux(every, "-task.every", "now()")
+                    + f'\n    |> to(bucket: "{bucket}", org: "{self.org}")')
+            tasks_api.create_task(task_create_request=TaskCreateRequest(
+                flux=flux, org=self.org, status="active",
+                description=f"Rollup of {self.readings_bucket} every {every}"))
+            print(f"Created task {name}")
+
+    def backfill_downsampling(self, start=None, step_days=30):
+        """
+        Write rollups for readings that are already loaded (tasks only see
+        new intervals), up to the last closed interval, step_days at a time.
+        start defaults to the earliest raw reading.
+        """
+        if start is None:
+            df = self.execute_flux_to_df(f"""
+                from(bucket: "{self.readings_bucket}")
+                |> range(start: 1970-01-01T00:00:00Z)
+                |> filter(fn: (r) => r._measurement == "sensor_readings" and r._field == "value")
+                |> first()
+                |> group()
+                |> min(column: "_time")
+                |> keep(columns: ["_time"])
+                """)
+            if df.empty:
+                return
+            start = df["_time"].iloc[0].to_pydatetime()
+        now = datetime.now(timezone.utc)
+        for every, bucket in self.rollup_buckets.items():
+            step = self.ROLLUP_STEPS[every]
+            lo, stop = _floor(start, step), _floor(now, step)
+            while lo < stop:
+                hi = min(lo + timedelta(days=step_days), stop)
+                self.query_api.query(
+                    self._rollup_flux(every, _rfc3339(lo), _rfc3339(hi))
+                    + f'\n    |> to(bucket: "{bucket}", org: "{self.org}")', org=self.org)
+                lo = hi
+            print(f"Backfilled {bucket} up to {_rfc3339(stop)}")
+
+    def _route(self, source, precision):
+        """Rollup interval to read ("1d"/"1h"), or None for the raw readings."""
+        if source == "raw" or not self.downsample:
+            return None
+        if source in self.rollup_buckets:
+            return source
+        if source != "auto":
+            raise ValueError(f"source must be 'auto', 'raw' or one of {list(self.rollup_buckets)}, got {source!r}")
+        allowed = self.PRECISIONS[precision]
+        for every, _ in self.ROLLUPS:
+            if self.ROLLUP_STEPS[every] <= allowed:
+                return every
+        return None
+
+    def _rollup_rows(self, every, days, fields, start=None):
+        """
+        Rollup rows (_time, sensor_id, device_id, _field, _value) for the
+        last `days`, window start rounded down to the rollup interval (or
+        from `start`, an aware datetime on an interval boundary). Closed
+        intervals come from the rollup bucket, the open one is summarized from
+        the raw readings on the fly.
+        """
+        step = self.ROLLUP_STEPS[every]
+        now = datetime.now(timezone.utc)
+        start, boundary = start or _floor(now - timedelta(days=days), step), _floor(now, step)
+        field_filter = " or ".join(f'r._field == "{f}"' for f in fields)
+        flux = f"""
+        stored = from(bucket: "{self.rollup_buckets[every]}")
+            |> range(start: {_rfc3339(start)}, stop: {_rfc3339(boundary)})
+            |> filter(fn: (r) => r._measurement == "sensor_readings")
+        fresh = {self._rollup_flux(every, _rfc3339(boundary), "now()")}
+
+        union(tables: [stored, fresh])
+            |> filter(fn: (r) => {field_filter})
+            |> keep(columns: ["_time", "sensor_id", "device_id", "_field", "_value"])
+        """
+        df = self.execute_flux_to_df(flux)
+        if not df.empty:
+            df["_value"] = df["_value"].astype(float)
+        return df
+
+    # -----------------------
+    # Metadata cache
+    # -----------------------
+    def refresh_metadata(self, full=False):
+        """
+        Pull devices/sensors written since the last refresh into the cache
+        (the whole history on the first call, or with full=True). Rows are
+        keyed by id, so a re-written device replaces its cached row.
+        """
+        for measurement, (key, fields) in self.META_TABLES.items():
+            since = None if full else self._meta_synced.get(measurement)
+            flux = f"""
+            from(bucket: "{self.meta_bucket}")
+            |> range(start: {_rfc3339(since) if since is not None else "1970-01-01T00:00:00Z"})
+            |> filter(fn: (r) => r._measurement == "{measurement}")
+            |> last()
+            |> pivot(rowKey:["_time"], columnKey:["_field"], valueColumn: "_value")
+            |> keep(columns: {json.dumps([key, "_time"] + fields)})
+            """
+            fresh = self.execute_flux_to_df(flux).reindex(columns=[key, "_time"] + fields)
+            cached = self._meta.get(measurement)
+            if cached is not None and not full:
+                fresh = pd.concat([cached, fresh], ignore_index=True)
+            self._meta[measurement] = fresh.drop_duplicates(key, keep="last").reset_index(drop=True)
+            if len(fresh):
+                self._meta_synced[measurement] = fresh["_time"].max().to_pydatetime()
+        self._meta_checked = time.monotonic()
+
+    def _dimension(self, measurement, columns):
+        """Cached devices/sensors table; refreshed incrementally when stale or after local writes."""
+        if (measurement not in self._meta or self._meta_dirty
+                or time.monotonic() - self._meta_checked > self.meta_refresh_s):
+            self.refresh_metadata()
+            self._meta_dirty = False
+        return self._meta[measurement][columns]
+
+    def _with_devices(self, df, columns):
+        devices = self._dimension("devices", ["device_id", "name", "status"])
+        return df.merge(devices.rename(columns={"name": "device_name"}), on="device_id")[columns]
+
+    def _enrich_extremes(self, extremes):
+        """device_id, sensor_id, reading_value, reading_time, extreme -> the full extremes result."""
+        sensors = self._dimension("sensors", ["sensor_id", "type"]).rename(columns={"type": "sensor_type"})
+        columns = ["device_id", "device_name", "sensor_id", "sensor_type", "reading_value", "reading_time", "extreme"]
+        if extremes.empty:
+            return pd.DataFrame(columns=columns)
+        return (self._with_devices(extremes.merge(sensors, on="sensor_id"), columns)
+                .sort_values(["device_id", "reading_value"], ascending=False, ignore_index=True))
 
     # -----------------------
     # Insert metadata
@@ -84,6 +386,7 @@ class InfluxDBClient2:
         if location:
             p = p.field("location", location)
         self.write_api.write(bucket=self.meta_bucket, org=self.org, record=p)
+        self._meta_dirty = True
 
     def insert_sensor(self, id, device_id, sensor_type):
         p = (
@@ -93,6 +396,7 @@ class InfluxDBClient2:
             .field("type", sensor_type)
         )
         self.write_api.write(bucket=self.meta_bucket, org=self.org, record=p)
+        self._meta_dirty = True
 
     # -----------------------
     # Readings (buffered)
@@ -121,24 +425,110 @@ class InfluxDBClient2:
         if len(self.readings_buffer) >= self.batch_size:
             self.flush_readings()
 
+    @staticmethod
+    def _line_prefix(sensor_id, device_id):
+        # Tags in key order, as Influx would sort them anyway
+        sensor_tag = canonical_id(sensor_id).translate(ESCAPE_TAG)
+        device_tag = canonical_id(device_id).translate(ESCAPE_TAG)
+        return f"sensor_readings,device_id={device_tag},sensor_id={sensor_tag} value=".encode()
+
+    def insert_readings_lines(self, columns):
+        """
+        Buffer a block of readings as pre-rendered line-protocol lines.
+
+        columns: dict of sensor_id, device_id, reading_value, reading_time.
+        Ids are (n, 16) uint8 arrays or str/uuid.UUID values; reading_time
+        is int64 epoch microseconds or datetime64. The escaped
+        measurement+tags prefix is built once per sensor and cached, so each
+        line only formats the value and an integer nanosecond timestamp.
+        """
+        start = time.perf_counter()
+        uniques, first, inverse = np.unique(
+            _id_keys(columns["sensor_id"]), return_index=True, return_inverse=True)
+        prefixes = []
+        for key, i in zip(uniques.tolist(), first.tolist()):
+            prefix = self._line_prefixes.get(key)
+            if prefix is None:
+                device = _id_keys(columns["device_id"][i:i + 1])[0].tolist()
+                prefix = self._line_prefixes[key] = self._line_prefix(key, device)
+            prefixes.append(prefix)
+
+        times = np.asarray(columns["reading_time"])
+        if times.dtype.kind == "M":
+            ns = times.astype("datetime64[ns]").view(np.int64)
+        else:
+            ns = times.astype(np.int64) * 1000
+        values = np.asarray(columns["reading_value"], dtype=np.float64)
+        lines = [b"%s%r %d" % row for row in zip(
+            [prefixes[i] for i in inverse.ravel().tolist()], values.tolist(), ns.tolist())]
+        self.write_stats["lines"] += len(lines)
+        self.write_stats["render_s"] += time.perf_counter() - start
+
+        i = 0
+        while i < len(lines):
+            # Top the buffer up to batch_size so batches match the per-Point path
+            room = self.batch_size - len(self.readings_buffer)
+            if room <= 0:
+                room = self.batch_size
+            self.readings_buffer.extend(lines[i:i + room])
+            i += room
+            if len(self.readings_buffer) >= self.batch_size:
+                self.flush_readings()
+
     def flush_readings(self):
         if not self.readings_buffer:
             return
-        try:
-            self.write_api.write(
-                bucket=self.readings_bucket, org=self.org, record=self.readings_buffer
-            )
-            print(
-                f"Flushed {len(self.readings_buffer)} readings to bucket {self.readings_bucket}"
-            )
-            self.readings_buffer = []
-        except Exception as e:
-            print("Error writing readings batch:", e)
-            # keep buffer for retry
+        if self._flusher:
+            # swap buffers so the producer keeps filling while the batch is written
+            batch, self.readings_buffer = self.readings_buffer, []
+            self._flusher.submit(batch)
+            return
+        # The buffer is emptied either way; a failed batch waits in the retry queue
+        batch, self.readings_buffer = self.readings_buffer, []
+        start = time.perf_counter()
+        payload = self._payload(batch)
+        if self.write_mode == "batching":
+            self._write_payload(payload)  # queued; the batching writer retries on its own
+            written = True
+        else:
+            written = self._retry.submit(payload, len(batch))
+            if written:
+                self.write_stats["batches"] += 1
+        self.write_stats["write_s"] += time.perf_counter() - start
+        self.write_stats["points"] += len(batch)
+        if written:
+            print(f"Flushed {len(batch)} readings to bucket {self.readings_bucket}")
 
     def force_flush(self):
         print("Forcing flush of remaining readings:", len(self.readings_buffer))
         self.flush_readings()
+        if self._flusher:
+            self._flusher.drain()
+        if not self._retry.drain(timeout=self.retry_drain_s):
+            stats = self._retry.get_stats()
+            print(f"Readings still unwritten after {self.retry_drain_s:.0f}s: {stats['pending_batches']} "
+                  f"batches in memory, {stats['spill_bytes']} bytes spilled ({stats['last_error']})")
+        if self.write_mode == "batching":
+            # The batching writer's flush() is a no-op; closing it waits for queued batches
+            self.readings_write_api.close()
+            self.readings_write_api = self._readings_write_api()
+            if self._write_errors:
+                errors, self._write_errors = self._write_errors, []
+                raise RuntimeError(f"{len(errors)} batched reading write(s) failed") from errors[0]
+
+    def get_write_stats(self):
+        stats = dict(self.write_stats, write_mode=self.write_mode, gzip=self.gzip, retry=self._retry.get_stats())
+        stats["render_lines_per_s"] = stats["lines"] / stats["render_s"] if stats["render_s"] else None
+        return stats
+
+    def close(self):
+        self.flush_readings()
+        self._retry.drain(timeout=self.retry_drain_s)
+        if self._flusher:
+            self._flusher.close()
+        if self.readings_write_api is not self.write_api:
+            self.readings_write_api.close()
+        self.client.close()
 
     # -----------------------
     # Alerts
@@ -222,32 +612,48 @@ class InfluxDBClient2:
     # -----------------------
     # Analytical queries (Flux) — DB does the work
     # -----------------------
-    def get_avg_reading_per_device_per_day(self, days=7):
+    # With downsample=True, source="auto" reads the coarsest rollup within
+    # `precision` ("raw", "1h" or "1d"), source="raw" the raw readings and
+    # source="1h"/"1d" that rollup. Rollup rows are aggregated in pandas.
+    def get_avg_reading_per_device_per_day(self, days=7, source="auto", precision="1d"):
+        # Whole UTC days, each labelled with its midnight, on every path
+        since = _floor(datetime.now(timezone.utc) - timedelta(days=days), timedelta(days=1))
+        every = self._route(source, precision)
+        if every:
+            return self._avg_per_day_rollup(every, days, since)
         flux = f"""
-        readings_daily = from(bucket: "{self.readings_bucket}")
-        |> range(start: -{days}d)
+        from(bucket: "{self.readings_bucket}")
+        |> range(start: {_rfc3339(since)})
         |> filter(fn: (r) => r._measurement == "sensor_readings" and r._field == "value")
         |> group(columns: ["device_id"])
-        |> aggregateWindow(every: 1d, fn: mean, createEmpty: false)
+        |> aggregateWindow(every: 1d, fn: mean, createEmpty: false, timeSrc: "_start")
         |> keep(columns: ["_time", "device_id", "_value"])
         |> rename(columns: {{_time: "day", _value: "avg_reading"}})
-
-        devices = from(bucket: "{self.meta_bucket}")
-        |> range(start: 1970-01-01T00:00:00Z)
-        |> filter(fn: (r) => r._measurement == "devices")
-        |> last()
-        |> pivot(rowKey:["_time"], columnKey:["_field"], valueColumn: "_value")
-        |> keep(columns: ["device_id", "name", "status"])
-
-        join(tables: {{r: readings_daily, d: devices}}, on: ["device_id"])
-        |> keep(columns: ["device_id", "name", "status", "day", "avg_reading"])
-        |> rename(columns: {{name: "device_name"}})
-        |> sort(columns: ["device_id", "day"])
         """
-        return self.execute_flux_to_df(flux)
-
-
-    def get_sensor_extremes_per_device(self, days=30):
+        daily = self.execute_flux_to_df(flux)
+        columns = ["device_id", "device_name", "status", "day", "avg_reading"]
+        if daily.empty:
+            return pd.DataFrame(columns=columns)
+        return self._with_devices(daily, columns).sort_values(["device_id", "day"], ignore_index=True)
+
+
+    def _avg_per_day_rollup(self, every, days, since):
+        rows = self._rollup_rows(every, days, ["mean", "count"], start=since)
+        columns = ["device_id", "device_name", "status", "day", "avg_reading"]
+        if rows.empty:
+            return pd.DataFrame(columns=columns)
+        wide = rows.pivot_table(index=["_time", "sensor_id", "device_id"], columns="_field",
+                                values="_value").reset_index()
+        wide["sum"] = wide["mean"] * wide["count"]
+        wide["day"] = wide["_time"].dt.floor("D")
+        daily = wide.groupby(["device_id", "day"], as_index=False)[["sum", "count"]].sum()
+        daily["avg_reading"] = daily["sum"] / daily["count"]
+        return self._with_devices(daily, columns).sort_values(["device_id", "day"], ignore_index=True)
+
+    def get_sensor_extremes_per_device(self, days=30, source="auto", precision="1h"):
+        every = self._route(source, precision)
+        if every:
+            return self._extremes_rollup(every, days)
         flux = f"""
     readings = from(bucket: "{self.readings_bucket}")
     |> range(start: -{days}d)
@@ -266,53 +672,83 @@ class InfluxDBClient2:
     |> rename(columns: {{_time: "reading_time", _value: "reading_value"}})
     |> keep(columns: ["device_id", "sensor_id", "reading_value", "reading_time"])
 
-    sensors = from(bucket: "{self.meta_bucket}")
-    |> range(start: 1970-01-01T00:00:00Z)
-    |> filter(fn: (r) => r._measurement == "sensors")
-    |> last()
-    |> pivot(rowKey:["_time"], columnKey:["_field"], valueColumn: "_value")
-    |> keep(columns: ["sensor_id", "device_id", "type"])
-
-    devices = from(bucket: "{self.meta_bucket}")
-    |> range(start: 1970-01-01T00:00:00Z)
-    |> filter(fn: (r) => r._measurement == "devices")
-    |> last()
-    |> pivot(rowKey:["_time"], columnKey:["_field"], valueColumn: "_value")
-    |> keep(columns: ["device_id", "name"])
-
-    max_join = join(tables: {{r: max_per_device, s: sensors}}, on: ["sensor_id"])
-    max_join_final = join(tables: {{m: max_join, d: devices}}, on: ["device_id"])
-    |> set(key: "extreme", value: "MAX")
-    |> keep(columns: ["device_id", "name", "sensor_id", "type", "reading_value", "reading_time", "extreme"])
-    |> rename(columns: {{name: "device_name", type: "sensor_type"}})
-
-    min_join = join(tables: {{r: min_per_device, s: sensors}}, on: ["sensor_id"])
-    min_join_final = join(tables: {{m: min_join, d: devices}}, on: ["device_id"])
-    |> set(key: "extreme", value: "MIN")
-    |> keep(columns: ["device_id", "name", "sensor_id", "type", "reading_value", "reading_time", "extreme"])
-    |> rename(columns: {{name: "device_name", type: "sensor_type"}})
-
-    union(tables: [max_join_final, min_join_final])
-    |> sort(columns: ["device_id", "reading_value"], desc: true)
+    union(tables: [
+        max_per_device |> set(key: "extreme", value: "MAX"),
+        min_per_device |> set(key: "extreme", value: "MIN"),
+    ])
     """
-        return self.execute_flux_to_df(flux)
+        return self._enrich_extremes(self.execute_flux_to_df(flux))
+
 
 
 
+    def _extremes_rollup(self, every, days):
+        rows = self._rollup_rows(every, days, ["max", "min"])
+        if rows.empty:
+            return self._enrich_extremes(rows)
+        # min/max rollup rows carry the time of the selected reading
+        maxes = rows[rows["_field"] == "max"]
+        mins = rows[rows["_field"] == "min"]
+        extremes = pd.concat([
+            maxes.loc[maxes.groupby("device_id")["_value"].idxmax()].assign(extreme="MAX"),
+            mins.loc[mins.groupby("device_id")["_value"].idxmin()].assign(extreme="MIN"),
+        ]).rename(columns={"_value": "reading_value", "_time": "reading_time"})
+        return self._enrich_extremes(extremes[["device_id", "sensor_id", "reading_value", "reading_time", "extreme"]])
+
+    def stream_readings(self, days=30):
+        """Raw readings as a stream of DataFrames (sensor_id, device_id, reading_time, reading_value)."""
+        flux = f"""
+            from(bucket: "{self.readings_bucket}")
+            |> range(start: -{days}d)
+            |> filter(fn: (r) => r._measurement == "sensor_readings" and r._field == "value")
+            |> keep(columns: ["_time", "sensor_id", "device_id", "_value"])
+            """
+        for df in self.query_api.query_data_frame_stream(flux, org=self.org):
+            yield df.rename(columns={"_time": "reading_time", "_value": "reading_value"})
+
+    def get_sensor_extremes_per_device_streaming(self, days=30):
+        """
+        Same result as get_sensor_extremes_per_device, but the per-device
+        max/min is reduced client-side while the raw readings stream in,
+        instead of the top()/bottom() + join pipeline in Flux.
+        """
+        return StreamingAggregator().consume(self.stream_readings(days)).sensor_extremes_per_device()
 
-    def get_avg_time_between_readings(self, days=30):
+    def get_avg_time_between_readings(self, days=30, source="auto", precision="1d"):
         """
         Average time between readings per sensor (seconds) — uses elapsed() on grouped sensor_id.
+        From rollups: (last - first) / (count - 1), the same mean of consecutive gaps,
+        exact at any rollup interval. Both paths start at UTC midnight `days` ago.
         """
+        since = _floor(datetime.now(timezone.utc) - timedelta(days=days), timedelta(days=1))
+        every = self._route(source, precision)
+        if every:
+            return self._gaps_rollup(every, days, since)
         flux = f"""
             from(bucket: "{self.readings_bucket}")
-            |> range(start: -{days}d)
+            |> range(start: {_rfc3339(since)})
             |> filter(fn: (r) => r._measurement == "sensor_readings" and r._field == "value")
-            |> sort(columns: ["_time"])
             |> group(columns: ["sensor_id"])
+            |> sort(columns: ["_time"])
             |> elapsed(unit: 1s)
-            |> mean(column: "_value")
-            |> rename(columns: {{_value: "avg_seconds_between_readings"}})
+            |> mean(column: "elapsed")
+            |> rename(columns: {{elapsed: "avg_seconds_between_readings"}})
             |> keep(columns: ["sensor_id", "avg_seconds_between_readings"])
             """
         return self.execute_flux_to_df(flux)
+
+    def _gaps_rollup(self, every, days, since):
+        rows = self._rollup_rows(every, days, ["count", "first", "last"], start=since)
+        columns = ["sensor_id", "avg_seconds_between_readings"]
+        if rows.empty:
+            return pd.DataFrame(columns=columns)
+        by_field = rows.groupby("_field")
+        per_sensor = pd.DataFrame({
+            "count": by_field.get_group("count").groupby("sensor_id")["_value"].sum(),
+            "first": by_field.get_group("first").groupby("sensor_id")["_time"].min(),
+            "last": by_field.get_group("last").groupby("sensor_id")["_time"].max(),
+        })
+        per_sensor = per_sensor[per_sensor["count"] > 1]
+        per_sensor["avg_seconds_between_readings"] = (
+            (per_sensor["last"] - per_sensor["first"]).dt.total_seconds() / (per_sensor["count"] - 1))
+        return per_sensor.reset_index()[columns].sort_values("sensor_id", ignore_index=True)
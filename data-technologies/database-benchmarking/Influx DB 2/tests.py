@@ -1,17 +1,15 @@
 # test_influx.py
+import os
+import sys
 import time
-from faker import Faker
 from influx_db_client import InfluxDBClient2
 
-from datetime import datetime, timezone, timedelta
-import random
-import uuid
-
 import warnings
 from influxdb_client.client.warnings import MissingPivotFunction
 warnings.simplefilter("ignore", MissingPivotFunction)
 
-fake = Faker()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from iot_data import IoTDataGenerator, as_rows
 
 
 def timed(fn, *args, **kwargs):
@@ -34,52 +32,26 @@ S = 10  # sensors per device
 R = 100000  # readings per sensor
 A = 5  # alerts per device
 
-now = datetime.now(timezone.utc)
+generator = IoTDataGenerator(devices=D, sensors_per_device=S,
+                             readings_per_sensor=R, alerts_per_device=A)
 
 
 def insert():
     influx.force_flush()
     start_time = time.perf_counter()
-    for i in range(1, D + 1):
-        print(f"-> Device {i}/{D}")
-        name = f"dev{i}"
-        loc = fake.city()
-        st = random.choice(["online", "offline", "unknown"])
-
-        device_id = uuid.uuid4()
-        _, t = timed(influx.insert_device, str(device_id), name, loc, st)
-
-        for j in range(1, S + 1):
-            print(f"\t-> Sensor {j}/{S}")
-            typ = random.choice(["temp", "hum", "press"])
-            sensor_id = uuid.uuid4()
-
-            _, t = timed(influx.insert_sensor, str(sensor_id), str(device_id), typ)
-
-            for k in range(1, R + 1):
-                # timestamp distribution similar to your ClickHouse script
-                tstamp = now - timedelta(
-                    days=random.randint(0, 10), minutes=k * random.random() * 5
-                )
-                val = random.random() * 100
-                reading_id = uuid.uuid4()
-
-                # batch insert
-                _, t = timed(
-                    influx.insert_reading,
-                    str(reading_id),
-                    str(sensor_id),
-                    str(device_id),
-                    val,
-                    tstamp,
-                )
-
-        for _ in range(A):
-            tstamp = now - timedelta(hours=random.random() * 24)
-            atype = random.choice(["overheat", "disconnect", "low-battery"])
-            desc = fake.sentence(nb_words=6)
-            alert_id = uuid.uuid4()
-            influx.insert_alert(str(alert_id), str(device_id), atype, tstamp, desc)
+
+    for row in as_rows(generator.devices(), ["id", "name", "location", "status"]):
+        influx.insert_device(*row)
+
+    for row in as_rows(generator.sensors(), ["id", "device_id", "type"]):
+        influx.insert_sensor(*row)
+
+    # batch insert, rendered straight to line protocol from the column arrays
+    for chunk in generator.iter_readings(chunk_size=influx.batch_size):
+        influx.insert_readings_lines(chunk)
+
+    for row in as_rows(generator.alerts(), ["id", "device_id", "alert_type", "alert_time", "description"]):
+        influx.insert_alert(*row)
 
     influx.force_flush()
     end_time = time.perf_counter()
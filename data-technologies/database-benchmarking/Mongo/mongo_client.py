@@ -1,20 +1,50 @@
 import os
-from pymongo import MongoClient, InsertOne
+from collections import defaultdict
+from pymongo import MongoClient, InsertOne, UpdateOne
 from faker import Faker
 from datetime import datetime, timedelta
 
 class MongoDBClient:
-    def __init__(self, uri="mongodb://localhost:27017/", db="iot"):
+    SCHEMA_MODES = ("default", "timeseries")
+
+    def __init__(self, uri="mongodb://localhost:27017/", db="iot", schema_mode="default", buckets=False):
+        """
+        schema_mode: "default" stores readings as plain documents that have to
+        be joined to sensors and devices; "timeseries" stores them in a native
+        time-series collection with meta {sensor_id, device_id}, so no query
+        needs a $lookup per reading.
+        buckets: also maintain sensor_readings_hourly, one pre-aggregated
+        document per sensor-hour, which the queries then read from.
+        """
+        if schema_mode not in self.SCHEMA_MODES:
+            raise ValueError(f"schema_mode must be one of {self.SCHEMA_MODES}")
         self.client = MongoClient(uri, uuidRepresentation="standard")
         self.db = self.client[db]
+        self.schema_mode = schema_mode
+        self.buckets = buckets
+        self.readings = self.db.sensor_readings_ts if schema_mode == "timeseries" else self.db.sensor_readings
+        self.hourly = self.db.sensor_readings_hourly
 
     def create_schema(self):
         # Mongo is schemaless; ensure indexes
         self.db.devices.create_index("id", unique=True)
         self.db.sensors.create_index("id", unique=True)
-        self.db.sensor_readings.create_index([("sensor_id", 1), ("reading_time", 1)])
         self.db.alerts.create_index("device_id")
 
+        if self.schema_mode == "default":
+            self.db.sensor_readings.create_index([("sensor_id", 1), ("reading_time", 1)])
+        elif "sensor_readings_ts" not in self.db.list_collection_names():
+            # Readings of one sensor are stored together in internal buckets keyed by meta
+            self.db.create_collection("sensor_readings_ts", timeseries={
+                "timeField": "reading_time",
+                "metaField": "meta",
+                "granularity": "minutes",
+            })
+            self.readings.create_index([("meta.sensor_id", 1), ("reading_time", 1)])
+
+        if self.buckets:
+            self.hourly.create_index([("device_id", 1), ("_id.hour", 1)])
+
     def insert_device(self, id, name, location, status):
         return self.db.devices.insert_one({
             "id": id,
@@ -30,13 +60,14 @@ class MongoDBClient:
             "type": type_
         }).inserted_id
 
-    def insert_reading(self, id, sensor_id, value, ts):
-        return self.db.sensor_readings.insert_one({
+    def insert_reading(self, id, sensor_id, value, ts, device_id=None):
+        return self.insert_reading_bulk([{
             "id": id,
             "sensor_id": sensor_id,
+            "device_id": device_id,
             "reading_value": value,
             "reading_time": ts
-        })
+        }])
 
     def insert_alert(self, id, device_id, atype, ts, desc):
         return self.db.alerts.insert_one({
@@ -77,9 +108,21 @@ class MongoDBClient:
     def insert_reading_bulk(self, readings):
         """
         readings: list of dicts with keys id, sensor_id, reading_value, reading_time
+        (plus device_id for the timeseries mode and the hourly buckets)
         """
         if not readings:
             return None
+        if (self.buckets or self.schema_mode == "timeseries") and any(r.get("device_id") is None for r in readings):
+            raise ValueError("device_id is required with buckets=True or schema_mode='timeseries'")
+        if self.buckets:
+            self._update_hourly(readings)
+        if self.schema_mode == "timeseries":
+            return self.readings.insert_many([{
+                "meta": {"sensor_id": r["sensor_id"], "device_id": r["device_id"]},
+                "reading_time": r["reading_time"],
+                "reading_value": r["reading_value"],
+                "id": r["id"]
+            } for r in readings], ordered=False)
         ops = [InsertOne({
             "id": r["id"],
             "sensor_id": r["sensor_id"],
@@ -88,6 +131,30 @@ class MongoDBClient:
         }) for r in readings]
         return self.db.sensor_readings.bulk_write(ops, ordered=False)
 
+    def _update_hourly(self, readings):
+        """
+        Bucket pattern: fold the batch into per sensor-hour partials first, then
+        upsert one document per bucket with $inc/$min/$max.
+        """
+        acc = defaultdict(lambda: {"count": 0, "sum": 0.0, "min": None, "max": None, "first": None, "last": None})
+        for r in readings:
+            t, v = r["reading_time"], r["reading_value"]
+            b = acc[r["sensor_id"], r["device_id"], t.replace(minute=0, second=0, microsecond=0)]
+            b["count"] += 1
+            b["sum"] += v
+            b["min"] = v if b["min"] is None else min(b["min"], v)
+            b["max"] = v if b["max"] is None else max(b["max"], v)
+            b["first"] = t if b["first"] is None else min(b["first"], t)
+            b["last"] = t if b["last"] is None else max(b["last"], t)
+        ops = [UpdateOne(
+            {"_id": {"sensor_id": sensor_id, "hour": hour}},
+            {"$set": {"device_id": device_id},
+             "$inc": {"count": b["count"], "sum": b["sum"]},
+             "$min": {"min": b["min"], "first": b["first"]},
+             "$max": {"max": b["max"], "last": b["last"]}},
+            upsert=True) for (sensor_id, device_id, hour), b in acc.items()]
+        return self.hourly.bulk_write(ops, ordered=False)
+
     def insert_alert_bulk(self, alerts):
         """
         alerts: list of dicts with keys id, device_id, alert_type, alert_time, description
@@ -114,13 +181,206 @@ class MongoDBClient:
         collection = self.db[collection_name]
         return list(collection.find(query.get("filter", {}), query.get("projection", None)))
 
-    def get_avg_reading_per_device_per_day(self):
+    # Query helpers for the timeseries mode and the hourly buckets, where
+    # device_id is stored with every reading/bucket so nothing is joined
+    # until the result is down to a handful of documents.
+    _UNPIVOT_EXTREMES = [
+        {"$project": {"extremes": [
+            {"$mergeObjects": ["$max", {"rank_type": "MAX"}]},
+            {"$mergeObjects": ["$min", {"rank_type": "MIN"}]},
+        ]}},
+        {"$unwind": "$extremes"},
+        {"$replaceWith": {"$mergeObjects": [{"device_id": "$_id"}, "$extremes"]}},
+    ]
+
+    def _use_buckets(self, source):
+        """
+        source: "raw", "buckets" or "auto" (buckets when this client maintains
+        them; a sensor_readings_hourly left by an earlier run may be stale).
+        """
+        if source not in ("auto", "raw", "buckets"):
+            raise ValueError("source must be 'auto', 'raw' or 'buckets'")
+        if source == "auto":
+            return self.buckets
+        return source == "buckets"
+
+    @staticmethod
+    def _since(days):
+        """UTC midnight `days` days ago, so whole days are compared."""
+        return datetime.combine(datetime.utcnow().date() - timedelta(days=days), datetime.min.time())
+
+    @staticmethod
+    def _daily_avg_tail():
+        return [
+            {"$lookup": {"from": "devices", "localField": "_id.device_id", "foreignField": "id", "as": "device"}},
+            {"$unwind": "$device"},
+            {"$project": {
+                "_id": 0,
+                "device_id": "$_id.device_id",
+                "device_name": "$device.name",
+                "status": "$device.status",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$_id.day"}},
+                "avg_reading": 1
+            }},
+            {"$sort": {"device_id": 1, "day": 1}}
+        ]
+
+    @staticmethod
+    def _extremes_tail():
+        return [
+            {"$lookup": {"from": "devices", "localField": "device_id", "foreignField": "id", "as": "device"}},
+            {"$lookup": {"from": "sensors", "localField": "sensor_id", "foreignField": "id", "as": "sensor"}},
+            {"$unwind": "$device"},
+            {"$unwind": "$sensor"},
+            {"$project": {
+                "_id": 0,
+                "device_id": 1,
+                "device_name": "$device.name",
+                "sensor_id": 1,
+                "sensor_type": "$sensor.type",
+                "reading_value": 1,
+                "reading_time": 1,
+                "rank_type": 1
+            }},
+            {"$sort": {"device_id": 1, "reading_value": -1}}
+        ]
+
+    def _avg_per_day_buckets(self, days):
+        pipeline = [
+            {"$match": {"_id.hour": {"$gte": self._since(days)}}},
+            {"$group": {
+                "_id": {"device_id": "$device_id", "day": {"$dateTrunc": {"date": "$_id.hour", "unit": "day"}}},
+                "sum": {"$sum": "$sum"},
+                "count": {"$sum": "$count"}
+            }},
+            {"$addFields": {"avg_reading": {"$divide": ["$sum", "$count"]}}},
+            *self._daily_avg_tail()
+        ]
+        return list(self.hourly.aggregate(pipeline))
+
+    def _avg_per_day_timeseries(self, days):
+        pipeline = [
+            {"$match": {"reading_time": {"$gte": self._since(days)}}},
+            {"$group": {
+                "_id": {"device_id": "$meta.device_id",
+                        "day": {"$dateTrunc": {"date": "$reading_time", "unit": "day"}}},
+                "avg_reading": {"$avg": "$reading_value"}
+            }},
+            *self._daily_avg_tail()
+        ]
+        return list(self.readings.aggregate(pipeline))
+
+    def _extremes_buckets(self):
+        # Stage 1: winning sensor-hour per device from the buckets
+        winners = list(self.hourly.aggregate([
+            {"$group": {
+                "_id": "$device_id",
+                "max": {"$top": {"sortBy": {"max": -1},
+                                 "output": {"sensor_id": "$_id.sensor_id", "hour": "$_id.hour", "value": "$max"}}},
+                "min": {"$bottom": {"sortBy": {"min": -1},
+                                    "output": {"sensor_id": "$_id.sensor_id", "hour": "$_id.hour", "value": "$min"}}}
+            }},
+            *self._UNPIVOT_EXTREMES
+        ]))
+        # Stage 2: the reading itself, an indexed one-hour range read of that sensor
+        sensor_field = "meta.sensor_id" if self.schema_mode == "timeseries" else "sensor_id"
+        devices = {d["id"]: d["name"] for d in self.db.devices.find({}, {"id": 1, "name": 1})}
+        sensors = {s["id"]: s["type"] for s in self.db.sensors.find({}, {"id": 1, "type": 1})}
+        results = []
+        for w in winners:
+            reading = self.readings.find_one({
+                sensor_field: w["sensor_id"],
+                "reading_time": {"$gte": w["hour"], "$lt": w["hour"] + timedelta(hours=1)},
+                "reading_value": w["value"]
+            })
+            results.append({
+                "device_id": w["device_id"],
+                "device_name": devices.get(w["device_id"]),
+                "sensor_id": w["sensor_id"],
+                "sensor_type": sensors.get(w["sensor_id"]),
+                "reading_value": w["value"],
+                "reading_time": reading["reading_time"] if reading else None,
+                "rank_type": w["rank_type"]
+            })
+        results.sort(key=lambda r: (r["device_id"], -r["reading_value"]))
+        return results
+
+    def _extremes_timeseries(self):
+        output = {"sensor_id": "$meta.sensor_id", "reading_value": "$reading_value", "reading_time": "$reading_time"}
+        pipeline = [
+            {"$group": {
+                "_id": "$meta.device_id",
+                "max": {"$top": {"sortBy": {"reading_value": -1}, "output": output}},
+                "min": {"$bottom": {"sortBy": {"reading_value": -1}, "output": output}}
+            }},
+            *self._UNPIVOT_EXTREMES,
+            *self._extremes_tail()
+        ]
+        return list(self.readings.aggregate(pipeline))
+
+    def _extremes_grouped(self):
+        reading = {"reading_value": "$reading_value", "reading_time": "$reading_time"}
+        per_device = {"sensor_id": "$_id", "sensor_type": "$sensor.type",
+                      "reading_value": "$max.reading_value", "reading_time": "$max.reading_time"}
+        pipeline = [
+            # One pass over the readings: max/min per sensor, no joins yet
+            {"$group": {
+                "_id": "$sensor_id",
+                "max": {"$top": {"sortBy": {"reading_value": -1}, "output": reading}},
+                "min": {"$bottom": {"sortBy": {"reading_value": -1}, "output": reading}}
+            }},
+            # Only (#sensors) documents from here on
+            {"$lookup": {"from": "sensors", "localField": "_id", "foreignField": "id", "as": "sensor"}},
+            {"$unwind": "$sensor"},
+            {"$group": {
+                "_id": "$sensor.device_id",
+                "max": {"$top": {"sortBy": {"max.reading_value": -1}, "output": per_device}},
+                "min": {"$bottom": {"sortBy": {"min.reading_value": -1}, "output": {
+                    **per_device, "reading_value": "$min.reading_value", "reading_time": "$min.reading_time"}}}
+            }},
+            *self._UNPIVOT_EXTREMES,
+            {"$lookup": {"from": "devices", "localField": "device_id", "foreignField": "id", "as": "device"}},
+            {"$unwind": "$device"},
+            {"$project": {
+                "_id": 0,
+                "device_id": 1,
+                "device_name": "$device.name",
+                "sensor_id": 1,
+                "sensor_type": 1,
+                "reading_value": 1,
+                "reading_time": 1,
+                "rank_type": 1
+            }},
+            {"$sort": {"device_id": 1, "reading_value": -1}}
+        ]
+        return list(self.db.sensor_readings.aggregate(pipeline))
+
+    def _gaps_pipeline(self, sensor, first, last, count):
+        # Mean gap between consecutive readings = (last - first) / (count - 1); no window function needed
+        return [
+            {"$group": {"_id": sensor, "first": {"$min": first}, "last": {"$max": last}, "count": {"$sum": count}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$project": {
+                "_id": 0,
+                "sensor_id": "$_id",
+                "avg_seconds_between_readings": {"$divide": [
+                    {"$subtract": ["$last", "$first"]},
+                    {"$multiply": [{"$subtract": ["$count", 1]}, 1000]}
+                ]}
+            }},
+            {"$sort": {"sensor_id": 1}}
+        ]
+
+    def get_avg_reading_per_device_per_day(self, source="auto"):
         """Average reading per device per day for last 7 days with device status"""
-        seven_days_ago = datetime.now() - timedelta(days=7)
+        if self._use_buckets(source):
+            return self._avg_per_day_buckets(days=7)
+        if self.schema_mode == "timeseries":
+            return self._avg_per_day_timeseries(days=7)
 
         pipeline = [
-            # Match readings from last 7 days
-            {"$match": {"reading_time": {"$gte": seven_days_ago}}},
+            # Match readings from the last 7 whole UTC days, like the other paths
+            {"$match": {"reading_time": {"$gte": self._since(7)}}},
 
             # Join with sensors collection
             {"$lookup": {
@@ -172,8 +432,23 @@ class MongoDBClient:
 
         return list(self.db.sensor_readings.aggregate(pipeline))
 
-    def get_sensor_extremes_per_device(self):
-        """Sensor with max and min reading per device (optimized)"""
+    def get_sensor_extremes_per_device(self, source="auto", strategy="union"):
+        """
+        Sensor with max and min reading per device (optimized)
+
+        strategy (default schema, raw readings): "union" joins every reading
+        to its sensor and device, sorts and unions a max and a min pass;
+        "group" reduces the readings alone to one max/min per sensor in a
+        single $group and joins only those.
+        """
+        if strategy not in ("union", "group"):
+            raise ValueError("strategy must be 'union' or 'group'")
+        if self._use_buckets(source):
+            return self._extremes_buckets()
+        if self.schema_mode == "timeseries":
+            return self._extremes_timeseries()
+        if strategy == "group":
+            return self._extremes_grouped()
 
         # Base lookups & unwinds
         lookups = [
@@ -238,8 +513,14 @@ class MongoDBClient:
         return list(self.db.sensor_readings.aggregate(pipeline))
 
 
-    def get_avg_time_between_readings(self):
+    def get_avg_time_between_readings(self, source="auto"):
         """Average time between readings per sensor"""
+        if self._use_buckets(source):
+            return list(self.hourly.aggregate(self._gaps_pipeline("$_id.sensor_id", "$first", "$last", "$count")))
+        if self.schema_mode == "timeseries":
+            return list(self.readings.aggregate(
+                self._gaps_pipeline("$meta.sensor_id", "$reading_time", "$reading_time", 1)))
+
         pipeline = [
             # Sort by sensor and timestamp
             {"$sort": {"sensor_id": 1, "reading_time": 1}},
@@ -0,0 +1,220 @@
+"""
+Parallel loader for the IoT readings.
+
+tests.py inserts from one thread in batches of 100, building an InsertOne per
+document. Here the sensors are split across worker processes, each with its
+own MongoClient and its own slice of the seeded dataset (see
+IoTDataGenerator.iter_readings(sensors=...)), so generation, BSON encoding
+and network I/O all run in parallel. Documents are encoded once with
+a vectorized BSON encoder (readings have a fixed-width layout) and wrapped in
+RawBSONDocument, which insert_many sends as-is without re-encoding, in large
+unordered batches under a configurable write concern.
+
+    python parallel_loader.py --workers 8 --readings 100000 --batch-size 20000 --w 1
+    python parallel_loader.py --workers 8 --w 0 --schema-mode timeseries
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import struct
+import sys
+import time
+import uuid
+
+import numpy as np
+from bson.raw_bson import RawBSONDocument
+from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
+
+from mongo_client import MongoDBClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from iot_data import IoTDataGenerator, as_rows
+
+UUID_SUBTYPE = 4  # what uuidRepresentation="standard" stores
+
+
+# Every reading document has the same fixed-width layout, so a whole batch is
+# encoded as one NumPy structured array (constant bytes for type tags, keys and
+# sizes; value slots for the data) and sliced into RawBSONDocuments. Parts are
+# bytes constants or (field, dtype) value slots.
+def _element(kind, key, field):
+    name = key.encode() + b"\0"
+    if kind == "uuid":
+        return [b"\x05" + name + struct.pack("<iB", 16, UUID_SUBTYPE), (field, ("u1", (16,)))]
+    if kind == "double":
+        return [b"\x01" + name, (field, "<f8")]
+    if kind == "datetime":
+        return [b"\x09" + name, (field, "<i8")]
+    raise ValueError(kind)
+
+
+def _part_size(part):
+    return len(part) if isinstance(part, bytes) else np.dtype(part[1]).itemsize
+
+
+def _document(parts):
+    """int32 total size, elements, terminating NUL."""
+    size = 4 + sum(_part_size(p) for p in parts) + 1
+    return [struct.pack("<i", size), *parts, b"\0"]
+
+
+LAYOUTS = {
+    "default": _document(
+        _element("uuid", "id", "id") + _element("uuid", "sensor_id", "sensor_id")
+        + _element("double", "reading_value", "reading_value")
+        + _element("datetime", "reading_time", "reading_time")),
+    "timeseries": _document(
+        [b"\x03meta\0", *_document(_element("uuid", "sensor_id", "sensor_id")
+                                    + _element("uuid", "device_id", "device_id"))]
+        + _element("datetime", "reading_time", "reading_time")
+        + _element("double", "reading_value", "reading_value")
+        + _element("uuid", "id", "id")),
+}
+
+
+def encode_batch(chunk, schema_mode):
+    """Generator chunk -> RawBSONDocuments, without building a dict per reading."""
+    layout = LAYOUTS[schema_mode]
+    dtype = np.dtype([(f"c{i}", f"V{len(p)}") if isinstance(p, bytes) else p for i, p in enumerate(layout)])
+    n = len(chunk["reading_value"])
+    rec = np.empty(n, dtype=dtype)
+    for i, part in enumerate(layout):
+        if isinstance(part, bytes):
+            rec[f"c{i}"] = np.void(part)
+    rec["id"] = chunk["id"]
+    rec["sensor_id"] = chunk["sensor_id"]
+    if "device_id" in dtype.names:
+        rec["device_id"] = chunk["device_id"]
+    rec["reading_value"] = chunk["reading_value"]
+    rec["reading_time"] = chunk["reading_time"] // 1000  # BSON dates are epoch milliseconds
+
+    buf, size = rec.tobytes(), dtype.itemsize
+    return [RawBSONDocument(buf[i:i + size]) for i in range(0, n * size, size)]
+
+
+def worker(index, sensors, config, progress):
+    client = MongoClient(config["uri"], uuidRepresentation="standard")
+    concern = WriteConcern(w=config["w"], j=config["journal"] if config["w"] != 0 else None)
+    collection = "sensor_readings_ts" if config["schema_mode"] == "timeseries" else "sensor_readings"
+    coll = client[config["db"]].get_collection(collection, write_concern=concern)
+
+    generator = IoTDataGenerator(
+        devices=config["devices"], sensors_per_device=config["sensors"],
+        readings_per_sensor=config["readings"], seed=config["seed"], now=config["now_us"])
+    done, encode_s, insert_s = 0, 0.0, 0.0
+    try:
+        for chunk in generator.iter_readings(chunk_size=config["batch_size"], sensors=sensors):
+            start = time.perf_counter()
+            docs = encode_batch(chunk, config["schema_mode"])
+            encode_s += time.perf_counter() - start
+
+            start = time.perf_counter()
+            coll.insert_many(docs, ordered=False)
+            insert_s += time.perf_counter() - start
+            done += len(docs)
+            progress.put((index, done, None))
+        progress.put((index, done, {"encode_s": encode_s, "insert_s": insert_s}))
+    except Exception as e:
+        progress.put((index, done, {"error": repr(e)}))
+    finally:
+        client.close()
+
+
+def load(config, workers, report_every=2.0):
+    """Load all readings with `workers` processes; returns the summary dict."""
+    num_sensors = config["devices"] * config["sensors"]
+    slices = [list(range(w, num_sensors, workers)) for w in range(workers)]
+    ctx = multiprocessing.get_context("spawn")
+    progress = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(i, s, config, progress), name=f"loader-{i}")
+             for i, s in enumerate(slices) if s]
+
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+
+    counts = [0] * len(procs)
+    results = {}
+    last_report = start
+    while len(results) < len(procs):
+        try:
+            index, done, final = progress.get(timeout=report_every)
+            counts[index] = done
+            if final is not None:
+                results[index] = final
+        except queue.Empty:
+            if not any(p.is_alive() for p in procs):
+                break
+        now = time.perf_counter()
+        if now - last_report >= report_every:
+            elapsed = now - start
+            per_worker = " ".join(f"w{i}:{c / elapsed:,.0f}" for i, c in enumerate(counts))
+            print(f"[{elapsed:6.1f}s] {sum(counts):,} docs  {sum(counts) / elapsed:,.0f} docs/s  ({per_worker})")
+            last_report = now
+
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+    summary = {
+        "docs": sum(counts),
+        "seconds": elapsed,
+        "docs_per_s": sum(counts) / elapsed if elapsed else None,
+        "workers": [{"worker": i, "docs": counts[i], **results.get(i, {"error": "exited without result"})}
+                    for i in range(len(procs))],
+    }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--db", default="iot")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--sensors", type=int, default=10, help="sensors per device")
+    parser.add_argument("--readings", type=int, default=100_000, help="readings per sensor")
+    parser.add_argument("--alerts", type=int, default=5, help="alerts per device")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=10_000, help="documents per insert_many")
+    parser.add_argument("--w", default="1", help="write concern: 0, 1, 2, ... or majority")
+    parser.add_argument("--journal", action="store_true", help="wait for the journal (j=true)")
+    parser.add_argument("--schema-mode", choices=MongoDBClient.SCHEMA_MODES, default="default")
+    parser.add_argument("--drop", action="store_true", help="drop the readings collection first")
+    args = parser.parse_args(argv)
+
+    generator = IoTDataGenerator(devices=args.devices, sensors_per_device=args.sensors,
+                                 readings_per_sensor=args.readings, alerts_per_device=args.alerts, seed=args.seed)
+    mongo = MongoDBClient(args.uri, args.db, schema_mode=args.schema_mode)
+    if args.drop:
+        mongo.readings.drop()
+    mongo.create_schema()
+
+    def docs(block, columns):
+        return [dict(zip(columns, row)) for row in as_rows(block, columns, uuid.UUID)]
+
+    # Metadata is tiny; load it here so workers only deal with readings
+    mongo.insert_device_bulk(docs(generator.devices(), ["id", "name", "location", "status"]))
+    mongo.insert_sensor_bulk(docs(generator.sensors(), ["id", "device_id", "type"]))
+    mongo.insert_alert_bulk(docs(generator.alerts(), ["id", "device_id", "alert_type", "alert_time", "description"]))
+    mongo.client.close()
+
+    config = {
+        "uri": args.uri, "db": args.db, "devices": args.devices, "sensors": args.sensors,
+        "readings": args.readings, "seed": args.seed, "now_us": generator.now_us,
+        "batch_size": args.batch_size, "schema_mode": args.schema_mode,
+        "w": int(args.w) if args.w.isdigit() else args.w, "journal": args.journal,
+    }
+    print(f"Loading {generator.num_readings:,} readings with {args.workers} workers "
+          f"(batch {args.batch_size:,}, w={config['w']}, j={args.journal})")
+    summary = load(config, args.workers)
+
+    for w in summary["workers"]:
+        detail = w.get("error") or f"encode {w['encode_s']:.1f}s, insert {w['insert_s']:.1f}s"
+        print(f"  worker {w['worker']}: {w['docs']:,} docs ({detail})")
+    print(f"Inserted {summary['docs']:,} docs in {summary['seconds']:.1f}s ({summary['docs_per_s']:,.0f} docs/s)")
+
+
+if __name__ == "__main__":
+    main()
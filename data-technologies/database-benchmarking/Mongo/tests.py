@@ -1,12 +1,11 @@
+import os
+import sys
 import time
-from faker import Faker
-from mongo_client import MongoDBClient
-
-from datetime import datetime, timedelta
-import random
 import uuid
+from mongo_client import MongoDBClient
 
-fake = Faker()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from iot_data import IoTDataGenerator, as_rows
 
 def timed(fn, *args, **kwargs):
     start = time.perf_counter()
@@ -25,91 +24,26 @@ S = 10    # sensors per device
 R = 100000   # readings per sensor
 A = 5    # alerts per device
 
-now = datetime.utcnow()
+generator = IoTDataGenerator(devices=D, sensors_per_device=S,
+                             readings_per_sensor=R, alerts_per_device=A)
 
 BATCH_SIZE = 100
 
-def flush_and_clear(buffer, flush_fn):
-    if buffer:
-        flush_fn(buffer)
-        buffer.clear()
+def as_docs(block, columns):
+    return [dict(zip(columns, row)) for row in as_rows(block, columns, uuid.UUID)]
 
 def insert():
     print("Beginning to insert data...")
     start = time.perf_counter()
 
-    device_docs = []
-    sensor_docs = []
-    reading_docs = []
-    alert_docs = []
-
-    for i in range(1, D + 1):
-        print(f"-> Device {i}/{D}")
-        name = f"dev{i}"
-        loc = fake.city()
-        st = random.choice(["online", "offline", "unknown"])
-
-        device_id = uuid.uuid4()
-        device_docs.append({
-            "id": device_id,
-            "name": name,
-            "location": loc,
-            "status": st
-        })
-        if len(device_docs) >= BATCH_SIZE:
-            mongo_client.insert_device_bulk(device_docs)
-            device_docs.clear()
-
-        for j in range(1, S + 1):
-            print(f"\t-> Sensor {j}/{S}")
-            typ = random.choice(["temp", "hum", "press"])
-            sensor_id = uuid.uuid4()
-
-            sensor_docs.append({
-                "id": sensor_id,
-                "device_id": device_id,
-                "type": typ
-            })
-            if len(sensor_docs) >= BATCH_SIZE:
-                mongo_client.insert_sensor_bulk(sensor_docs)
-                sensor_docs.clear()
-
-            for k in range(1, R + 1):
-                tstamp = now - timedelta(days=random.randint(0, 15),
-                                         minutes=k * random.random() * 5)
-                val = random.random() * 100
-                reading_id = uuid.uuid4()
-                reading_docs.append({
-                    "id": reading_id,
-                    "sensor_id": sensor_id,
-                    "reading_value": val,
-                    "reading_time": tstamp
-                })
-                if len(reading_docs) >= BATCH_SIZE:
-                    mongo_client.insert_reading_bulk(reading_docs)
-                    reading_docs.clear()
-
-        for _ in range(A):
-            tstamp = now - timedelta(hours=random.random() * 24)
-            atype = random.choice(["overheat", "disconnect", "low-battery"])
-            desc = fake.sentence(nb_words=6)
-            alert_id = uuid.uuid4()
-            alert_docs.append({
-                "id": alert_id,
-                "device_id": device_id,
-                "alert_type": atype,
-                "alert_time": tstamp,
-                "description": desc
-            })
-            if len(alert_docs) >= BATCH_SIZE:
-                mongo_client.insert_alert_bulk(alert_docs)
-                alert_docs.clear()
-
-    # flush
-    flush_and_clear(device_docs, mongo_client.insert_device_bulk)
-    flush_and_clear(sensor_docs, mongo_client.insert_sensor_bulk)
-    flush_and_clear(reading_docs, mongo_client.insert_reading_bulk)
-    flush_and_clear(alert_docs, mongo_client.insert_alert_bulk)
+    mongo_client.insert_device_bulk(as_docs(generator.devices(), ["id", "name", "location", "status"]))
+    mongo_client.insert_sensor_bulk(as_docs(generator.sensors(), ["id", "device_id", "type"]))
+
+    for chunk in generator.iter_readings(chunk_size=BATCH_SIZE):
+        mongo_client.insert_reading_bulk(as_docs(chunk, ["id", "sensor_id", "reading_value", "reading_time"]))
+
+    mongo_client.insert_alert_bulk(
+        as_docs(generator.alerts(), ["id", "device_id", "alert_type", "alert_time", "description"]))
 
     end = time.perf_counter()
     print(f"Data insertion completed in {end - start:.2f} seconds.")
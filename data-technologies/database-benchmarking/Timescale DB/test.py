@@ -1,13 +1,12 @@
+import os
+import sys
 import time
-from faker import Faker
-from timescale_client import TimescaleClient
-
-from datetime import datetime, timedelta
-import random
 import uuid
+from timescale_client import TimescaleClient
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from iot_data import IoTDataGenerator, as_rows
 
-fake = Faker()
 
 def timed(fn, *args, **kwargs):
     start = time.perf_counter()
@@ -25,7 +24,8 @@ S = 10    # sensors per device
 R = 10000   # readings per sensor
 A = 5    # alerts per device
 
-now = datetime.utcnow()
+generator = IoTDataGenerator(devices=D, sensors_per_device=S,
+                             readings_per_sensor=R, alerts_per_device=A)
 
 avg_times = {}
 
@@ -35,38 +35,19 @@ def insert():
     print("Beginning to insert data...")
     start = time.perf_counter()
 
-    for i in range(1, D+1):
-        print(f"-> Device {i}/{D}")
-        name = f"dev{i}"
-        loc  = fake.city()
-        st   = random.choice(["online","offline","unknown"])
-
-        device_id = uuid.uuid4()
-        _, t = timed(timescale_client.insert_device, device_id, name, loc, st)
-
-
-        for j in range(1, S+1):
-            print(f"\t-> Sensor {j}/{S}")
-            typ = random.choice(["temp","hum","press"])
-            sensor_id = uuid.uuid4()
-
-            _, t = timed(timescale_client.insert_sensor, sensor_id, device_id, typ)
-
-
-            for k in range(1, R+1):
-                tstamp = now - timedelta(minutes=k * random.random() * 5)
-                val    = random.random() * 100
-                reading_id = uuid.uuid4()
+    for row in as_rows(generator.devices(), ["id", "name", "location", "status"], uuid.UUID):
+        timescale_client.insert_device(*row)
 
-                _, t = timed(timescale_client.add_reading_to_batch, reading_id, sensor_id, val, tstamp)
+    for row in as_rows(generator.sensors(), ["id", "device_id", "type"], uuid.UUID):
+        timescale_client.insert_sensor(*row)
 
+    for chunk in generator.iter_readings(chunk_size=timescale_client.batch_size):
+        for row in as_rows(chunk, ["id", "sensor_id", "reading_value", "reading_time"], uuid.UUID):
+            timescale_client.add_reading_to_batch(*row)
+    timescale_client.flush_readings()
 
-        for _ in range(A):
-            tstamp = now - timedelta(hours=random.random()*24)
-            atype  = random.choice(["overheat","disconnect","low-battery"])
-            desc   = fake.sentence(nb_words=6)
-            alert_id = uuid.uuid4()
-            timescale_client.insert_alert(alert_id, device_id, atype, tstamp, desc)
+    for row in as_rows(generator.alerts(), ["id", "device_id", "alert_type", "alert_time", "description"], uuid.UUID):
+        timescale_client.insert_alert(*row)
 
     end = time.perf_counter()
     print(f"Total time for inserting data: {end - start:.2f} seconds\n")
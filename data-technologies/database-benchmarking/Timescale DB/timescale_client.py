@@ -1,19 +1,60 @@
+import os
+import sys
+import time
+import threading
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 import uuid
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from io import StringIO
+from io import BytesIO, StringIO
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from background_flusher import BackgroundFlusher
+from pg_binary_copy import encode_binary_copy
 
 class TimescaleClient:
     """
     A client for PostgreSQL with TimescaleDB extension enabled and hypertables.
     Optimized for maximum ingestion rates.
     """
+    # Hypertable layouts for sensor_readings, selected with profile=...
+    #   chunk_interval: time range per chunk
+    #   space_partitions: hash partitions on sensor_id (None = time only)
+    #   compress: columnstore compression, applied to every chunk after a load
+    SCHEMA_PROFILES = {
+        # The original layout: many small chunks, cheap to append to
+        "default": {"chunk_interval": "15 minutes", "space_partitions": 10, "compress": False},
+        # Fewer, larger chunks: less chunk creation and catalog work per batch
+        "ingest": {"chunk_interval": "1 day", "space_partitions": 10, "compress": False},
+        # Time-only week-long chunks and a (sensor_id, reading_time) index: few chunks to plan over
+        "query": {"chunk_interval": "7 days", "space_partitions": None, "compress": False},
+        # As "query", stored compressed per sensor and ordered by time
+        "compressed": {"chunk_interval": "7 days", "space_partitions": None, "compress": True},
+    }
     def __init__(self, db="iot", user="user", password="pass",
-                 host="localhost", port=5433, batch_size=5000):
-        self.conn = psycopg2.connect(
-            dbname=db, user=user, password=password, host=host, port=port
-        )
+                 host="localhost", port=5433, batch_size=5000,
+                 async_flush=False, flush_workers=1, flush_queue_size=2, copy_workers=1,
+                 copy_format="csv", rollups=False, profile="default", retention_days=None,
+                 reset_schema=False):
+        """
+        profile: one of SCHEMA_PROFILES.
+        retention_days: add a retention policy dropping older chunks.
+        reset_schema: drop existing tables first, so profiles can be compared on one server.
+        """
+        if copy_format not in ("csv", "binary"):
+            raise ValueError("copy_format must be 'csv' or 'binary'")
+        if profile not in self.SCHEMA_PROFILES:
+            raise ValueError(f"profile must be one of {sorted(self.SCHEMA_PROFILES)}")
+        self.profile = profile
+        self.retention_days = retention_days
+        self.reset_schema = reset_schema
+        self.compress_s = 0.0
+        self.copy_format = copy_format
+        self.conn_params = dict(dbname=db, user=user, password=password, host=host, port=port)
+        self.conn = psycopg2.connect(**self.conn_params)
         self.cur = self.conn.cursor()
         psycopg2.extras.register_uuid(self.cur)
 
@@ -21,6 +62,38 @@ class TimescaleClient:
         self.batch_size = batch_size  # Reduced default to 10,000 for experimentation
         self._readings_buffer = []
 
+        # Opt-in: hand full buffers to writer threads instead of blocking on COPY
+        self._flusher = None
+        if async_flush:
+            self._flusher = BackgroundFlusher(
+                self._reading_writer, workers=flush_workers,
+                max_pending=flush_queue_size, name="timescale-flusher")
+
+        # Opt-in: shard each flush by sensor_id and COPY the shards concurrently,
+        # one pooled connection per worker, so ingest follows the space partitions
+        self.copy_workers = copy_workers
+        self.copy_stats = [{"worker": i, "rows": 0, "copies": 0, "seconds": 0.0}
+                           for i in range(copy_workers)]
+        self._stats_lock = threading.Lock()
+        self._sensor_shard = {}
+        self._pool = None
+        self._copy_executor = None
+        if copy_workers > 1:
+            self._pool = psycopg2.pool.ThreadedConnectionPool(1, copy_workers, **self.conn_params)
+            self._copy_executor = ThreadPoolExecutor(copy_workers, thread_name_prefix="timescale-copy")
+
+        # Opt-in: continuous aggregates the query methods read from when present
+        self.rollups = rollups
+        self._has_rollups = None
+        self.rollup_stats = {"refreshes": 0, "refresh_s": 0.0}
+
+    def _reading_writer(self):
+        """Per-thread connection for the background flusher."""
+        if self.copy_workers > 1:
+            return self._copy_parallel, None
+        conn = psycopg2.connect(**self.conn_params)
+        return (lambda batch: self._copy_readings(conn, batch)), conn.close
+
     def create_schema(self):
         """
         Create the schema with optimized hypertable configuration.
@@ -28,6 +101,13 @@ class TimescaleClient:
         # Enable extension
         self.cur.execute("CREATE EXTENSION IF NOT EXISTS timescaledb;")
 
+        if self.reset_schema:
+            self.cur.execute("""
+            DROP MATERIALIZED VIEW IF EXISTS sensor_readings_daily CASCADE;
+            DROP MATERIALIZED VIEW IF EXISTS sensor_readings_hourly CASCADE;
+            DROP TABLE IF EXISTS sensor_readings, alerts, sensors, devices CASCADE;
+            """)
+
         # Create tables with composite PK on sensor_readings
         self.cur.execute("""
         CREATE TABLE IF NOT EXISTS devices(
@@ -60,22 +140,174 @@ class TimescaleClient:
         );
         """)
 
-        # Convert to hypertable with space partitioning on sensor_id
-        self.cur.execute(
-            "SELECT create_hypertable('sensor_readings', 'reading_time', 'sensor_id', 10, if_not_exists => TRUE);"
-        )
+        # Convert to hypertable; chunking, space partitioning and compression follow the profile
+        profile = self.SCHEMA_PROFILES[self.profile]
+        if profile["space_partitions"]:
+            self.cur.execute(
+                "SELECT create_hypertable('sensor_readings', 'reading_time', 'sensor_id', %s, "
+                "chunk_time_interval => %s::interval, if_not_exists => TRUE);",
+                (profile["space_partitions"], profile["chunk_interval"]))
+        else:
+            self.cur.execute(
+                "SELECT create_hypertable('sensor_readings', 'reading_time', "
+                "chunk_time_interval => %s::interval, if_not_exists => TRUE);",
+                (profile["chunk_interval"],))
+
+        if self.profile in ("query", "compressed"):
+            self.cur.execute(
+                "CREATE INDEX IF NOT EXISTS idx_readings_sensor_time ON sensor_readings(sensor_id, reading_time DESC);")
+
+        if profile["compress"]:
+            # Unique constraints must be covered by segmentby/orderby, hence id after reading_time
+            self.cur.execute("""
+            ALTER TABLE sensor_readings SET (
+              timescaledb.compress,
+              timescaledb.compress_segmentby = 'sensor_id',
+              timescaledb.compress_orderby = 'reading_time, id'
+            );""")
+            self.cur.execute(
+                "SELECT add_compression_policy('sensor_readings', INTERVAL '7 days', if_not_exists => TRUE);")
+
+        if self.retention_days:
+            self.cur.execute(
+                "SELECT add_retention_policy('sensor_readings', %s::interval, if_not_exists => TRUE);",
+                (f"{self.retention_days} days",))
+
+        self.conn.commit()
+
+        if self.rollups:
+            self.create_rollups()
+
+    def compress_chunks(self):
+        """Compress every chunk now instead of waiting for the policy (compressed profile only)."""
+        if not self.SCHEMA_PROFILES[self.profile]["compress"]:
+            return
+        start = time.perf_counter()
         self.cur.execute(
-            "SELECT set_chunk_time_interval('sensor_readings', INTERVAL '15 minutes');"  # Smaller chunks for high ingestion
+            "SELECT compress_chunk(c, if_not_compressed => TRUE) FROM show_chunks('sensor_readings') c;")
+        self.conn.commit()
+        self.compress_s += time.perf_counter() - start
+
+    def get_storage_stats(self):
+        """On-disk size and chunk counts of sensor_readings."""
+        self.cur.execute("""
+        SELECT
+          hypertable_size('sensor_readings'),
+          (SELECT COUNT(*) FROM timescaledb_information.chunks WHERE hypertable_name = 'sensor_readings'),
+          (SELECT COUNT(*) FROM timescaledb_information.chunks
+            WHERE hypertable_name = 'sensor_readings' AND is_compressed);
+        """)
+        total_bytes, chunks, compressed = self.cur.fetchone()
+        self.conn.commit()
+        return {"profile": self.profile, "total_bytes": total_bytes, "chunks": chunks,
+                "compressed_chunks": compressed, "compress_s": self.compress_s}
+
+    def _execute_autocommit(self, *statements):
+        """Continuous aggregate DDL and refreshes can't run inside a transaction block."""
+        self.conn.commit()
+        self.conn.autocommit = True
+        try:
+            for sql in statements:
+                self.cur.execute(sql)
+        finally:
+            self.conn.autocommit = False
+
+    def create_rollups(self):
+        """
+        Continuous aggregates over sensor_readings:
+          sensor_readings_hourly  per sensor per hour, from the raw hypertable
+          sensor_readings_daily   per sensor per day, rolled up from the hourly one
+          device_readings_daily   plain view summing the daily one per device
+        Each bucket keeps sum/count/min/max and first/last reading time, enough
+        to answer all three analytical queries. Both aggregates are real-time
+        (materialized_only = false), so rows newer than the last refresh are
+        still included from the raw table.
+        """
+        self._execute_autocommit(
+            """
+            CREATE MATERIALIZED VIEW IF NOT EXISTS sensor_readings_hourly
+            WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+            SELECT
+              time_bucket(INTERVAL '1 hour', reading_time) AS bucket,
+              sensor_id,
+              SUM(reading_value) AS value_sum,
+              COUNT(*) AS reading_count,
+              MIN(reading_value) AS min_value,
+              MAX(reading_value) AS max_value,
+              MIN(reading_time) AS first_time,
+              MAX(reading_time) AS last_time
+            FROM sensor_readings
+            GROUP BY bucket, sensor_id
+            WITH NO DATA;
+            """,
+            """
+            CREATE MATERIALIZED VIEW IF NOT EXISTS sensor_readings_daily
+            WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+            SELECT
+              time_bucket(INTERVAL '1 day', bucket) AS day,
+              sensor_id,
+              SUM(value_sum) AS value_sum,
+              SUM(reading_count) AS reading_count,
+              MIN(min_value) AS min_value,
+              MAX(max_value) AS max_value,
+              MIN(first_time) AS first_time,
+              MAX(last_time) AS last_time
+            FROM sensor_readings_hourly
+            GROUP BY day, sensor_id
+            WITH NO DATA;
+            """,
+            """
+            CREATE OR REPLACE VIEW device_readings_daily AS
+            SELECT s.device_id, r.day, SUM(r.value_sum) AS value_sum, SUM(r.reading_count) AS reading_count
+            FROM sensor_readings_daily r
+            JOIN sensors s ON s.id = r.sensor_id
+            GROUP BY s.device_id, r.day;
+            """,
+            # Keep recent buckets fresh; older ones are filled by refresh_rollups() after a bulk load
+            """
+            SELECT add_continuous_aggregate_policy('sensor_readings_hourly',
+              start_offset => INTERVAL '3 days', end_offset => INTERVAL '1 hour',
+              schedule_interval => INTERVAL '5 minutes', if_not_exists => TRUE);
+            """,
+            """
+            SELECT add_continuous_aggregate_policy('sensor_readings_daily',
+              start_offset => INTERVAL '30 days', end_offset => INTERVAL '1 day',
+              schedule_interval => INTERVAL '1 hour', if_not_exists => TRUE);
+            """,
         )
+        self._has_rollups = True
 
-        # Add index on sensor_id for query efficiency
-        # self.cur.execute("CREATE INDEX IF NOT EXISTS idx_sensor_id ON sensor_readings(sensor_id);")
+    def refresh_rollups(self):
+        """
+        Materialize every bucket now. The policies only cover recent windows,
+        so after backfilling history (as the benchmark does) run this once.
+        """
+        start = time.perf_counter()
+        self._execute_autocommit(
+            "CALL refresh_continuous_aggregate('sensor_readings_hourly', NULL, NULL);",
+            "CALL refresh_continuous_aggregate('sensor_readings_daily', NULL, NULL);",
+        )
+        self.rollup_stats["refreshes"] += 1
+        self.rollup_stats["refresh_s"] += time.perf_counter() - start
 
-        # Set up retention and compression policies
-        # self.cur.execute("SELECT add_drop_chunks_policy('sensor_readings', INTERVAL '30 days');")
-        # self.cur.execute("SELECT add_compression_policy('sensor_readings', INTERVAL '7 days');")
+    def has_rollups(self):
+        if self._has_rollups is None:
+            rows = self.execute_query(
+                "SELECT 1 FROM timescaledb_information.continuous_aggregates WHERE view_name = 'sensor_readings_daily';")
+            self._has_rollups = bool(rows)
+        return self._has_rollups
 
-        self.conn.commit()
+    def _use_rollup(self, source):
+        """
+        source: "raw", "rollup" or "auto". Auto reads the continuous
+        aggregates when they exist; every query window here starts on a day
+        boundary, so the daily buckets always cover it exactly.
+        """
+        if source not in ("auto", "raw", "rollup"):
+            raise ValueError("source must be 'auto', 'raw' or 'rollup'")
+        if source == "rollup" and not self.has_rollups():
+            raise ValueError("no continuous aggregates; create the client with rollups=True")
+        return source == "rollup" or (source == "auto" and self.has_rollups())
 
     def insert_device(self, id, name, location, status):
         self.cur.execute(
@@ -114,24 +346,153 @@ class TimescaleClient:
         if not self._readings_buffer:
             return
 
-        self.cur.execute("SET LOCAL synchronous_commit = OFF;")  # Disable synchronous commit for faster COPY
+        if self._flusher:
+            # swap buffers so the producer keeps filling while the batch is copied
+            batch, self._readings_buffer = self._readings_buffer, []
+            self._flusher.submit(batch)
+            return
+
+        if self.copy_workers > 1:
+            self._copy_parallel(self._readings_buffer)
+        else:
+            start = time.perf_counter()
+            self._copy_readings(self.conn, self._readings_buffer)
+            self._record_copy(0, len(self._readings_buffer), time.perf_counter() - start)
+        self._readings_buffer.clear()
+
+    def _shard_of(self, sensor_id):
+        shard = self._sensor_shard.get(sensor_id)
+        if shard is None:
+            key = sensor_id if isinstance(sensor_id, uuid.UUID) else uuid.UUID(str(sensor_id))
+            shard = self._sensor_shard[sensor_id] = key.int % self.copy_workers
+        return shard
+
+    def _copy_parallel(self, rows):
+        """
+        Split rows into copy_workers shards by sensor_id and COPY them
+        concurrently. A sensor always lands in the same shard, so each worker
+        keeps writing into the same space partitions.
+        """
+        shards = [[] for _ in range(self.copy_workers)]
+        for row in rows:
+            shards[self._shard_of(row[1])].append(row)
+
+        futures = [self._copy_executor.submit(self._copy_shard, i, shard)
+                   for i, shard in enumerate(shards) if shard]
+        for f in futures:
+            f.result()
+
+    def _copy_shard(self, worker, rows):
+        conn = self._pool.getconn()
+        try:
+            start = time.perf_counter()
+            self._copy_readings(conn, rows)
+            elapsed = time.perf_counter() - start
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.putconn(conn)
+        self._record_copy(worker, len(rows), elapsed)
+
+    def _record_copy(self, worker, rows, elapsed):
+        with self._stats_lock:
+            stats = self.copy_stats[worker]
+            stats["rows"] += rows
+            stats["copies"] += 1
+            stats["seconds"] += elapsed
+
+    def get_copy_stats(self):
+        """
+        Per-worker COPY totals with rows/s (time spent inside COPY, per worker).
+        """
+        with self._stats_lock:
+            return [
+                {**s, "rows_per_s": s["rows"] / s["seconds"] if s["seconds"] else None}
+                for s in self.copy_stats
+            ]
+
+    def _copy_readings(self, conn, rows):
+        """COPY (id, sensor_id, ts, value) rows over the given connection."""
+        if self.copy_format == "binary":
+            ids, sensor_ids, times, values = zip(*rows)
+            self._copy_binary(conn, {
+                "id": ids,
+                "sensor_id": sensor_ids,
+                "reading_time": np.array(times, dtype="datetime64[us]"),
+                "reading_value": np.array(values, dtype=np.float64),
+            })
+            return
+
+        cur = conn.cursor()
+        cur.execute("SET LOCAL synchronous_commit = OFF;")  # Disable synchronous commit for faster COPY
 
         # Build an in-memory CSV
         sio = StringIO()
-        for _id, sensor_id, ts, val in self._readings_buffer:
+        for _id, sensor_id, ts, val in rows:
             sio.write(f"{_id},{sensor_id},{ts.isoformat()},{val}\n")
         sio.seek(0)
 
         # Stream it into Postgres
-        self.cur.copy_expert(
+        cur.copy_expert(
             """
             COPY sensor_readings (id, sensor_id, reading_time, reading_value)
             FROM STDIN WITH (FORMAT csv)
             """,
             sio
         )
-        self.conn.commit()
-        self._readings_buffer.clear()
+        conn.commit()
+        cur.close()
+
+    def _copy_binary(self, conn, columns):
+        """
+        COPY a block of readings in PostgreSQL binary format: no text
+        formatting on the client and no parsing on the server.
+        Naive timestamps are taken as UTC.
+        """
+        payload = encode_binary_copy(
+            [columns["id"], columns["sensor_id"], columns["reading_time"], columns["reading_value"]],
+            ["uuid", "uuid", "timestamptz", "float8"],
+        )
+        cur = conn.cursor()
+        cur.execute("SET LOCAL synchronous_commit = OFF;")
+        cur.copy_expert(
+            """
+            COPY sensor_readings (id, sensor_id, reading_time, reading_value)
+            FROM STDIN WITH (FORMAT binary)
+            """,
+            BytesIO(payload)
+        )
+        conn.commit()
+        cur.close()
+
+    def copy_readings_columnar(self, columns):
+        """
+        Binary COPY a block of readings straight from column arrays, skipping
+        the row buffer: id and sensor_id as (n, 16) uint8 or UUID sequences,
+        reading_time as int64 epoch microseconds or datetime64, reading_value
+        as float64.
+        """
+        start = time.perf_counter()
+        self._copy_binary(self.conn, columns)
+        self._record_copy(0, len(columns["reading_value"]), time.perf_counter() - start)
+
+    def force_flush(self):
+        """
+        Flush remaining readings and wait for background writers to finish.
+        """
+        self.flush_readings()
+        if self._flusher:
+            self._flusher.drain()
+
+    def close(self):
+        self.flush_readings()
+        if self._flusher:
+            self._flusher.close()
+        if self._copy_executor:
+            self._copy_executor.shutdown()
+            self._pool.closeall()
+        self.conn.close()
 
     def insert_alert(self, id, device_id, atype, ts: datetime, desc):
         self.cur.execute(
@@ -160,10 +521,24 @@ class TimescaleClient:
             self.conn.rollback()
             raise e
 
-    def average_reading_per_device_per_day(self):
+    def average_reading_per_device_per_day(self, source="auto"):
         """
         Returns the average reading per device per day for the last 7 days, including device status.
         """
+        if self._use_rollup(source):
+            return self.execute_query("""
+            SELECT
+              d.id AS device_id,
+              d.name AS device_name,
+              d.status,
+              DATE(r.day) AS day,
+              r.value_sum / r.reading_count AS avg_reading
+            FROM devices d
+            JOIN device_readings_daily r ON r.device_id = d.id
+            WHERE r.day >= CURRENT_DATE - INTERVAL '7 days'
+            ORDER BY d.id, day;
+            """)
+
         query = """
         SELECT
           d.id AS device_id,
@@ -180,10 +555,46 @@ class TimescaleClient:
         """
         return self.execute_query(query)
 
-    def sensor_extremes_per_device(self):
+    def sensor_extremes_per_device(self, source="auto"):
         """
         Returns the sensors with max and min readings per device.
         """
+        if self._use_rollup(source):
+            # Find the winning sensor-day from the daily rollup, then fetch the
+            # reading itself with a one-day range scan of that sensor
+            return self.execute_query("""
+            WITH daily AS (
+              SELECT s.device_id, r.sensor_id, r.day, r.max_value, r.min_value
+              FROM sensor_readings_daily r
+              JOIN sensors s ON s.id = r.sensor_id
+            ),
+            winners AS (
+              SELECT device_id, sensor_id, day, max_value AS value, 'MAX' AS extreme_type
+              FROM daily
+              WHERE (device_id, max_value) IN (SELECT device_id, MAX(max_value) FROM daily GROUP BY device_id)
+              UNION ALL
+              SELECT device_id, sensor_id, day, min_value, 'MIN'
+              FROM daily
+              WHERE (device_id, min_value) IN (SELECT device_id, MIN(min_value) FROM daily GROUP BY device_id)
+            )
+            SELECT
+              d.id AS device_id,
+              d.name AS device_name,
+              s.id AS sensor_id,
+              s.type AS sensor_type,
+              sr.reading_value,
+              sr.reading_time,
+              w.extreme_type
+            FROM winners w
+            JOIN sensor_readings sr
+              ON sr.sensor_id = w.sensor_id
+             AND sr.reading_time >= w.day AND sr.reading_time < w.day + INTERVAL '1 day'
+             AND sr.reading_value = w.value
+            JOIN sensors s ON s.id = w.sensor_id
+            JOIN devices d ON d.id = w.device_id
+            ORDER BY device_id, reading_value DESC;
+            """)
+
         query = """
         SELECT
           d.id AS device_id,
@@ -231,10 +642,22 @@ class TimescaleClient:
         """
         return self.execute_query(query)
 
-    def average_time_between_readings_per_sensor(self):
+    def average_time_between_readings_per_sensor(self, source="auto"):
         """
         Returns average time in seconds between consecutive readings per sensor.
         """
+        if self._use_rollup(source):
+            # The mean of consecutive gaps telescopes to (last - first) / (count - 1)
+            return self.execute_query("""
+            SELECT
+              sensor_id,
+              EXTRACT(EPOCH FROM MAX(last_time) - MIN(first_time)) / NULLIF(SUM(reading_count) - 1, 0)
+                AS avg_seconds_between_readings
+            FROM sensor_readings_daily
+            GROUP BY sensor_id
+            ORDER BY sensor_id;
+            """)
+
         query = """
         SELECT
           sr.sensor_id,
@@ -242,9 +665,10 @@ class TimescaleClient:
         FROM (
           SELECT
             sensor_id,
-            EXTRACT(EPOCH FROM (reading_time - LAG(reading_time) OVER (ORDER BY reading_time))) AS time_diff
+            EXTRACT(EPOCH FROM (
+              reading_time - LAG(reading_time) OVER (PARTITION BY sensor_id ORDER BY reading_time)
+            )) AS time_diff
           FROM sensor_readings
-          WHERE sensor_id IN (SELECT DISTINCT sensor_id FROM sensor_readings LIMIT 100)
         ) sr
         WHERE time_diff IS NOT NULL
         GROUP BY sr.sensor_id
@@ -0,0 +1,113 @@
+"""
+Background, double-buffered flushing for the buffered reading inserts.
+
+Without it a client's flush_readings blocks the producing loop while a whole
+batch goes over the wire. With it the client swaps in an empty buffer and
+hands the full one to a bounded queue drained by writer threads, so data
+generation and network I/O overlap. When the queue is full, submit() blocks
+(backpressure) instead of letting batches pile up in memory.
+
+None of the database drivers used here are safe to share across threads, so
+each writer thread builds its own connection through make_writer().
+"""
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class BackgroundFlusher:
+    """
+    make_writer: called once in each writer thread; returns (write, close) where
+    write(batch) sends one batch and close() releases the thread's connection.
+    workers: number of writer threads.
+    max_pending: batches allowed to wait in the queue before submit() blocks.
+
+    Writer errors are re-raised in the producer on the next submit()/drain().
+    Threads start on the first submit(), so the writers can connect to a
+    database that create_schema() has only just created.
+    """
+
+    def __init__(self, make_writer, workers=1, max_pending=2, name="flusher"):
+        self.make_writer = make_writer
+        self.workers = workers
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._threads = []
+        self._errors = []
+        self._lock = threading.Lock()
+        self.stats = {"batches": 0, "rows": 0, "write_s": 0.0, "blocked_s": 0.0}
+
+    def _start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _run(self):
+        try:
+            write, close = self.make_writer()
+        except Exception as e:
+            write, close = None, None
+            self._record_error(e)
+
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is _STOP:
+                    break
+                if write is None:
+                    continue  # drop; the connection error is already recorded
+                start = time.perf_counter()
+                write(batch)
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.stats["batches"] += 1
+                    self.stats["rows"] += len(batch)
+                    self.stats["write_s"] += elapsed
+            except Exception as e:
+                self._record_error(e)
+            finally:
+                self._queue.task_done()
+
+        if close is not None:
+            close()
+
+    def _record_error(self, e):
+        with self._lock:
+            self._errors.append(e)
+
+    def _raise_errors(self):
+        with self._lock:
+            if not self._errors:
+                return
+            errors, self._errors = self._errors, []
+        raise RuntimeError(f"{self.name}: {len(errors)} background write(s) failed") from errors[0]
+
+    def submit(self, batch):
+        """Queue a batch for writing; blocks while the queue is full."""
+        self._raise_errors()
+        if not self._threads:
+            self._start()
+        start = time.perf_counter()
+        self._queue.put(batch)
+        self.stats["blocked_s"] += time.perf_counter() - start
+
+    def drain(self):
+        """Wait until every submitted batch has been written."""
+        if self._threads:
+            self._queue.join()
+        self._raise_errors()
+
+    def close(self):
+        """Drain the queue and stop the writer threads."""
+        if not self._threads:
+            return
+        self._queue.join()
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        self._raise_errors()
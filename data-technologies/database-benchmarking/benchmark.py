@@ -0,0 +1,189 @@
+"""
+Unified benchmark runner for the IoT workload.
+
+Drives every engine through the common protocol in iot_workload.py against the
+same seeded dataset from iot_data.py and emits one comparable results table:
+ingest rows/s, p50/p95/p99 latency per query, on-disk size (where the
+engine reports it) and peak client RSS.
+
+Each engine runs in its own spawned process so peak RSS is per engine.
+Engine specs take optional client options, so the same engine can be run
+more than once with different settings:
+
+    python benchmark.py clickhouse timescale:batch_size=50000 mongo \\
+        --readings 10000 --repeat 5 --json results.json --csv results.csv
+"""
+import argparse
+import ast
+import csv
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from iot_data import IoTDataGenerator
+from iot_workload import QUERY_NAMES, WORKLOADS, latency_summary, make_workload, result_rows, timed
+
+CSV_FIELDS = [
+    "engine", "label", "rows", "ingest_s", "rows_per_s", "query",
+    "runs", "p50_s", "p95_s", "p99_s", "speedup_vs_raw", "result_rows", "disk_mb", "peak_rss_mb", "error",
+]
+
+
+def parse_spec(spec):
+    """'timescale:batch_size=50000,port=5433' -> ('timescale', {...})"""
+    name, _, opts = spec.partition(":")
+    options = {}
+    for item in filter(None, opts.split(",")):
+        key, _, value = item.partition("=")
+        try:
+            options[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            options[key] = value
+    return name, options
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_engine(spec, config):
+    """Run one engine end to end. Executed in a child process."""
+    name, options = parse_spec(spec)
+    result = {"engine": name, "label": spec, "options": options, "rows": 0,
+              "ingest_s": None, "rows_per_s": None, "disk_mb": None, "queries": {}, "error": None}
+    workload = None
+    try:
+        workload = make_workload(name, **options)
+        if not config["skip_ingest"]:
+            generator = IoTDataGenerator(
+                devices=config["devices"], sensors_per_device=config["sensors"],
+                readings_per_sensor=config["readings"], alerts_per_device=config["alerts"],
+                seed=config["seed"], now=config["now_us"])
+            workload.create_schema()
+            rows, elapsed = timed(workload.ingest, generator)
+            result.update(rows=rows, ingest_s=elapsed, rows_per_s=rows / elapsed if elapsed else None)
+            print(f"[{spec}] ingested {rows} readings in {elapsed:.2f}s ({result['rows_per_s']:,.0f} rows/s)")
+
+        for query, fn in workload.queries().items():
+            if config["queries"] and query not in config["queries"]:
+                continue
+            entry = {}
+            try:
+                for _ in range(config["warmup"]):
+                    fn()
+                latencies = []
+                for _ in range(config["repeat"]):
+                    res, elapsed = timed(fn)
+                    latencies.append(elapsed)
+                entry.update(latency_summary(latencies), result_rows=result_rows(res))
+                print(f"[{spec}] {query}: p50 {entry['p50_s']:.3f}s p99 {entry['p99_s']:.3f}s")
+            except NotImplementedError:
+                entry["error"] = "unsupported"
+            except Exception as e:
+                entry["error"] = repr(e)
+                print(f"[{spec}] {query} failed: {e}")
+            result["queries"][query] = entry
+
+        # Rollup/downsampled reads against the same query over the raw table
+        for query, entry in result["queries"].items():
+            raw = result["queries"].get(f"{query}[raw]", {})
+            if entry.get("p50_s") and raw.get("p50_s"):
+                entry["speedup_vs_raw"] = raw["p50_s"] / entry["p50_s"]
+                print(f"[{spec}] {query}: {entry['speedup_vs_raw']:.1f}x speedup over {query}[raw] (p50)")
+    except Exception as e:
+        result["error"] = repr(e)
+        traceback.print_exc()
+    finally:
+        if workload is not None:
+            try:
+                result["stats"] = workload.stats()
+                size = workload.disk_bytes()
+                result["disk_mb"] = size / (1024 * 1024) if size is not None else None
+            except Exception as e:
+                result["stats"] = {"error": repr(e)}
+            workload.close()
+        result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def flatten(results):
+    """One CSV row per (engine, query)."""
+    rows = []
+    for r in results:
+        base = {k: r.get(k) for k in ("engine", "label", "rows", "ingest_s", "rows_per_s", "disk_mb", "peak_rss_mb")}
+        queries = r["queries"] or {None: {}}
+        for query, q in queries.items():
+            rows.append({**base, "query": query, **q, "error": q.get("error") or r["error"]})
+    return rows
+
+
+def fmt(value, spec):
+    return format(value, spec) if isinstance(value, (int, float)) else "-"
+
+
+def print_table(results):
+    print(f"\n{'engine':24} {'rows/s':>12} {'query':32} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} "
+          f"{'disk MB':>8} {'rss MB':>8}")
+    print("-" * 115)
+    for row in flatten(results):
+        print(f"{row['label']:24} {fmt(row['rows_per_s'], ',.0f'):>12} {str(row['query'] or '-'):32} "
+              f"{fmt(row.get('p50_s'), '.3f'):>8} {fmt(row.get('p95_s'), '.3f'):>8} "
+              f"{fmt(row.get('p99_s'), '.3f'):>8} {fmt(row['disk_mb'], '.0f'):>8} {fmt(row['peak_rss_mb'], '.0f'):>8}"
+              + (f"  ({row['error']})" if row["error"] else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("engines", nargs="+", metavar="ENGINE[:key=value,...]",
+                        help=f"engines to run, one of {sorted(WORKLOADS)}")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--sensors", type=int, default=10, help="sensors per device")
+    parser.add_argument("--readings", type=int, default=100_000, help="readings per sensor")
+    parser.add_argument("--alerts", type=int, default=5, help="alerts per device")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-ingest", action="store_true", help="only run the queries")
+    parser.add_argument("--queries", nargs="*", default=None,
+                        help=f"restrict to these queries (default: all of {', '.join(QUERY_NAMES)})")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per query")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs per query")
+    parser.add_argument("--json", dest="json_path", help="write results as JSON")
+    parser.add_argument("--csv", dest="csv_path", help="write results as CSV")
+    args = parser.parse_args(argv)
+
+    generator = IoTDataGenerator(seed=args.seed)
+    config = {
+        "devices": args.devices, "sensors": args.sensors, "readings": args.readings,
+        "alerts": args.alerts, "seed": args.seed, "now_us": generator.now_us,
+        "skip_ingest": args.skip_ingest, "queries": args.queries,
+        "repeat": args.repeat, "warmup": args.warmup,
+    }
+
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for spec in args.engines:
+        print(f"=== {spec} ===")
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            results.append(pool.submit(run_engine, spec, config).result())
+
+    print_table(results)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"Wrote {os.path.abspath(args.json_path)}")
+    if args.csv_path:
+        with open(args.csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(flatten(results))
+        print(f"Wrote {os.path.abspath(args.csv_path)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Seeded, vectorized generator for the IoT benchmark dataset.
+
+Every benchmark driver loads the same four tables (devices, sensors,
+sensor_readings, alerts). Building 10M readings one Python object at a time
+(uuid4, random.random, timedelta) makes the generator the bottleneck, so this
+module produces the dataset as NumPy column blocks instead:
+
+- UUIDs are (n, 16) uint8 arrays of random bytes with the v4 bits set.
+- Timestamps are int64 microseconds since the Unix epoch (UTC).
+- Reading values are float64 arrays.
+
+Readings are generated in fixed blocks keyed by (seed, sensor, block), so the
+data is identical whatever chunk size a driver asks for and whichever subset
+of sensors a worker generates.
+"""
+from datetime import datetime, timezone
+import uuid
+
+import numpy as np
+
+DEVICE_STATUSES = np.array(["online", "offline", "unknown"])
+SENSOR_TYPES = np.array(["temp", "hum", "press"])
+ALERT_TYPES = np.array(["overheat", "disconnect", "low-battery"])
+CITIES = np.array([
+    "Amsterdam", "Berlin", "Cairo", "Dubai", "Lagos", "Lima", "London",
+    "Madrid", "Mumbai", "Nairobi", "Oslo", "Paris", "Seoul", "Sydney",
+    "Tokyo", "Toronto",
+])
+WORDS = np.array([
+    "sensor", "reported", "value", "outside", "expected", "range", "device",
+    "lost", "connection", "battery", "below", "threshold", "temperature",
+    "spike", "detected", "after", "restart", "check", "unit", "now",
+])
+
+US_PER_SECOND = 1_000_000
+US_PER_DAY = 86_400 * US_PER_SECOND
+
+# Rows per internal reading block. Changing it changes the generated data.
+BLOCK_SIZE = 1 << 16
+
+# Independent random streams, mixed into the seed.
+_DEVICE_STREAM, _SENSOR_STREAM, _ALERT_STREAM, _READING_STREAM = range(4)
+
+_HEX = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+
+
+def random_uuids(rng, n):
+    """Return n random version-4 UUIDs as an (n, 16) uint8 array."""
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    return raw
+
+
+def uuid_strings(raw):
+    """Format an (n, 16) uint8 UUID array as canonical 36-char strings."""
+    raw = np.asarray(raw, dtype=np.uint8).reshape(-1, 16)
+    hexed = np.empty((len(raw), 32), dtype=np.uint8)
+    hexed[:, 0::2] = _HEX[raw >> 4]
+    hexed[:, 1::2] = _HEX[raw & 0x0F]
+
+    out = np.full((len(raw), 36), ord("-"), dtype=np.uint8)
+    out[:, 0:8] = hexed[:, 0:8]
+    out[:, 9:13] = hexed[:, 8:12]
+    out[:, 14:18] = hexed[:, 12:16]
+    out[:, 19:23] = hexed[:, 16:20]
+    out[:, 24:36] = hexed[:, 20:32]
+    return out.view("S36").ravel().astype("U36")
+
+
+def uuid_objects(raw):
+    """Convert an (n, 16) uint8 UUID array to a list of uuid.UUID."""
+    buf = np.ascontiguousarray(raw, dtype=np.uint8).tobytes()
+    return [uuid.UUID(bytes=buf[i:i + 16]) for i in range(0, len(buf), 16)]
+
+
+def to_datetime64(epoch_us):
+    """View int64 epoch microseconds as datetime64[us]."""
+    return np.asarray(epoch_us, dtype=np.int64).astype("datetime64[us]")
+
+
+def to_datetimes(epoch_us):
+    """Convert int64 epoch microseconds to a list of naive UTC datetimes."""
+    return to_datetime64(epoch_us).tolist()
+
+
+def to_epoch_us(ts):
+    """Convert a datetime (naive = UTC) to int64 epoch microseconds."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    delta = ts - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return (delta.days * 86_400 + delta.seconds) * US_PER_SECOND + delta.microseconds
+
+
+def concat_chunks(chunks):
+    """Concatenate column blocks that share the same keys."""
+    if len(chunks) == 1:
+        return chunks[0]
+    return {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+
+
+def slice_chunk(chunk, start, stop=None):
+    """Slice every column of a block (views, no copy)."""
+    return {k: v[start:stop] for k, v in chunk.items()}
+
+
+def chunk_len(chunk):
+    return len(chunk["reading_time"])
+
+
+def as_rows(block, columns, uuid_type=str):
+    """
+    Zip the named columns of a block into Python tuples for drivers that still
+    insert row by row. UUID columns become str (or uuid.UUID when
+    uuid_type=uuid.UUID) and *_time columns become naive UTC datetimes.
+    """
+    converted = []
+    for name in columns:
+        col = block[name]
+        if col.ndim == 2:
+            col = uuid_objects(col) if uuid_type is uuid.UUID else uuid_strings(col).tolist()
+        elif name.endswith("_time"):
+            col = to_datetimes(col)
+        else:
+            col = col.tolist()
+        converted.append(col)
+    return zip(*converted)
+
+
+class IoTDataGenerator:
+    """
+    Deterministic IoT dataset: D devices, S sensors per device, R readings per
+    sensor and A alerts per device.
+
+    Timestamps follow the distribution the original drivers used:
+    now - randint(0, max_age_days) days - k * random() * 5 minutes for the
+    k-th reading of a sensor. Pass `now` explicitly (datetime or epoch
+    microseconds) to pin the dataset; by default it is the current UTC hour.
+    """
+
+    def __init__(self, devices=10, sensors_per_device=10, readings_per_sensor=100_000,
+                 alerts_per_device=5, seed=42, now=None, max_age_days=10):
+        self.num_devices = devices
+        self.sensors_per_device = sensors_per_device
+        self.readings_per_sensor = readings_per_sensor
+        self.alerts_per_device = alerts_per_device
+        self.seed = seed
+        self.max_age_days = max_age_days
+
+        if now is None:
+            now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        self.now_us = now if isinstance(now, (int, np.integer)) else to_epoch_us(now)
+
+        self._devices = self._build_devices()
+        self._sensors = self._build_sensors()
+
+    @property
+    def num_sensors(self):
+        return self.num_devices * self.sensors_per_device
+
+    @property
+    def num_readings(self):
+        return self.num_sensors * self.readings_per_sensor
+
+    @property
+    def now(self):
+        return to_datetimes(np.array([self.now_us]))[0]
+
+    def _rng(self, *stream):
+        return np.random.default_rng([self.seed, *stream])
+
+    # -----------------------
+    # Dimension tables
+    # -----------------------
+    def _build_devices(self):
+        rng = self._rng(_DEVICE_STREAM)
+        n = self.num_devices
+        return {
+            "id": random_uuids(rng, n),
+            "name": np.array([f"dev{i}" for i in range(1, n + 1)]),
+            "location": CITIES[rng.integers(0, len(CITIES), n)],
+            "status": DEVICE_STATUSES[rng.integers(0, len(DEVICE_STATUSES), n)],
+        }
+
+    def _build_sensors(self):
+        rng = self._rng(_SENSOR_STREAM)
+        n = self.num_sensors
+        device_index = np.repeat(np.arange(self.num_devices), self.sensors_per_device)
+        return {
+            "id": random_uuids(rng, n),
+            "device_id": self._devices["id"][device_index],
+            "device_index": device_index,
+            "type": SENSOR_TYPES[rng.integers(0, len(SENSOR_TYPES), n)],
+        }
+
+    def devices(self):
+        """Devices as columns: id, name, location, status."""
+        return dict(self._devices)
+
+    def sensors(self):
+        """Sensors as columns: id, device_id, device_index, type."""
+        return dict(self._sensors)
+
+    def alerts(self):
+        """Alerts as columns: id, device_id, alert_time, alert_type, description."""
+        rng = self._rng(_ALERT_STREAM)
+        n = self.num_devices * self.alerts_per_device
+        device_index = np.repeat(np.arange(self.num_devices), self.alerts_per_device)
+        offsets = (rng.random(n) * 24 * 3600 * US_PER_SECOND).astype(np.int64)
+        words = WORDS[rng.integers(0, len(WORDS), (n, 6))]
+        return {
+            "id": random_uuids(rng, n),
+            "device_id": self._devices["id"][device_index],
+            "alert_time": self.now_us - offsets,
+            "alert_type": ALERT_TYPES[rng.integers(0, len(ALERT_TYPES), n)],
+            "description": np.array([" ".join(w).capitalize() + "." for w in words]),
+        }
+
+    # -----------------------
+    # Readings (streamed)
+    # -----------------------
+    def _reading_block(self, sensor, block):
+        start = block * BLOCK_SIZE
+        stop = min(start + BLOCK_SIZE, self.readings_per_sensor)
+        n = stop - start
+        rng = self._rng(_READING_STREAM, sensor, block)
+
+        k = np.arange(start + 1, stop + 1, dtype=np.float64)
+        days = rng.integers(0, self.max_age_days + 1, n)
+        minutes = k * rng.random(n) * 5
+        reading_time = (self.now_us - days * US_PER_DAY
+                        - (minutes * 60 * US_PER_SECOND).astype(np.int64))
+
+        sensor_index = np.full(n, sensor, dtype=np.int32)
+        return {
+            "id": random_uuids(rng, n),
+            "sensor_index": sensor_index,
+            "sensor_id": np.broadcast_to(self._sensors["id"][sensor], (n, 16)),
+            "device_id": np.broadcast_to(self._sensors["device_id"][sensor], (n, 16)),
+            "reading_time": reading_time,
+            "reading_value": rng.random(n) * 100,
+        }
+
+    def iter_readings(self, chunk_size=100_000, sensors=None):
+        """
+        Yield readings as column blocks of at most chunk_size rows:
+        id, sensor_index, sensor_id, device_id, reading_time, reading_value.
+
+        sensors restricts generation to the given sensor indexes, so parallel
+        workers can each produce a disjoint slice of the same dataset.
+        """
+        if sensors is None:
+            sensors = range(self.num_sensors)
+        blocks_per_sensor = -(-self.readings_per_sensor // BLOCK_SIZE)
+
+        pending, size = [], 0
+        for sensor in sensors:
+            for block in range(blocks_per_sensor):
+                pending.append(self._reading_block(sensor, block))
+                size += chunk_len(pending[-1])
+                while size >= chunk_size:
+                    merged = concat_chunks(pending)
+                    yield slice_chunk(merged, 0, chunk_size)
+                    pending = [slice_chunk(merged, chunk_size)]
+                    size -= chunk_size
+        if size:
+            yield concat_chunks(pending)
@@ -0,0 +1,577 @@
+"""
+Common IoT workload interface over the per-engine benchmark clients.
+
+Every engine folder ships its own client with its own method names
+(`average_reading_per_device_per_day` in TimescaleClient,
+`get_avg_reading_per_device_per_day` elsewhere) and its own ingest calls. The
+workloads below adapt each client to one protocol so the runner in
+benchmark.py can drive them identically:
+
+    create_schema() -> ingest(generator) -> queries() -> close()
+
+Engine folders contain spaces and are not packages, so client modules are
+imported by putting their folder on sys.path.
+"""
+import asyncio
+import importlib
+import os
+import sys
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from iot_data import as_rows, chunk_len, uuid_strings
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUERY_NAMES = (
+    "avg_reading_per_device_per_day",
+    "sensor_extremes_per_device",
+    "avg_time_between_readings",
+)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    res = fn(*args, **kwargs)
+    end = time.perf_counter()
+    return res, (end - start)
+
+
+def latency_summary(latencies):
+    """p50/p95/p99 of a list of latencies in seconds."""
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"runs": len(latencies), "p50_s": float(p50), "p95_s": float(p95), "p99_s": float(p99)}
+
+
+def result_rows(result):
+    """Row count of whatever a client query returned (DataFrame, list, cursor)."""
+    if result is None:
+        return 0
+    if hasattr(result, "shape"):
+        return int(result.shape[0])
+    if hasattr(result, "__len__"):
+        return len(result)
+    return sum(1 for _ in result)
+
+
+def import_client(folder, module):
+    path = os.path.join(BASE_DIR, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(module)
+
+
+class IoTWorkload:
+    """
+    Base workload. Subclasses wrap one engine client and implement the
+    schema, ingest and query hooks; unsupported queries raise
+    NotImplementedError and are reported as such by the runner.
+    """
+    name = None
+    # Column names for queries whose client returns bare tuples (DB-API fetchall)
+    result_columns = {}
+
+    def __init__(self, chunk_size=100_000):
+        self.chunk_size = chunk_size
+
+    def create_schema(self):
+        raise NotImplementedError
+
+    def ingest(self, generator):
+        """Load the full dataset and return the number of readings written."""
+        self.ingest_metadata(generator)
+        rows = 0
+        for chunk in generator.iter_readings(chunk_size=self.chunk_size):
+            self.ingest_readings(chunk)
+            rows += chunk_len(chunk)
+        self.finish_ingest()
+        return rows
+
+    def ingest_metadata(self, generator):
+        raise NotImplementedError
+
+    def ingest_readings(self, chunk):
+        raise NotImplementedError
+
+    def finish_ingest(self):
+        pass
+
+    def queries(self):
+        """Named query callables the runner times. Variants may add entries."""
+        return {
+            "avg_reading_per_device_per_day": self.avg_reading_per_device_per_day,
+            "sensor_extremes_per_device": self.sensor_extremes_per_device,
+            "avg_time_between_readings": self.avg_time_between_readings,
+        }
+
+    def avg_reading_per_device_per_day(self):
+        raise NotImplementedError
+
+    def sensor_extremes_per_device(self):
+        raise NotImplementedError
+
+    def avg_time_between_readings(self):
+        raise NotImplementedError
+
+    def disk_bytes(self):
+        """On-disk size of the readings, where the engine can report it."""
+        return None
+
+    def stats(self):
+        """Engine-specific ingest/storage figures added to the JSON results."""
+        return {}
+
+    def close(self):
+        pass
+
+
+class MongoWorkload(IoTWorkload):
+    """schema_mode="timeseries" and buckets=True select the denormalized layouts (see Mongo/README.md)."""
+    name = "mongo"
+
+    def __init__(self, chunk_size=10_000, **client_kwargs):
+        super().__init__(chunk_size)
+        MongoDBClient = import_client("Mongo", "mongo_client").MongoDBClient
+        self.client = MongoDBClient(**client_kwargs)
+
+    @staticmethod
+    def _docs(block, columns):
+        return [dict(zip(columns, row)) for row in as_rows(block, columns, uuid.UUID)]
+
+    def create_schema(self):
+        self.client.create_schema()
+
+    def ingest_metadata(self, generator):
+        self.client.insert_device_bulk(self._docs(generator.devices(), ["id", "name", "location", "status"]))
+        self.client.insert_sensor_bulk(self._docs(generator.sensors(), ["id", "device_id", "type"]))
+        self.client.insert_alert_bulk(
+            self._docs(generator.alerts(), ["id", "device_id", "alert_type", "alert_time", "description"]))
+
+    def ingest_readings(self, chunk):
+        self.client.insert_reading_bulk(
+            self._docs(chunk, ["id", "sensor_id", "device_id", "reading_value", "reading_time"]))
+
+    def avg_reading_per_device_per_day(self):
+        return self.client.get_avg_reading_per_device_per_day()
+
+    def sensor_extremes_per_device(self):
+        return self.client.get_sensor_extremes_per_device()
+
+    def avg_time_between_readings(self):
+        return self.client.get_avg_time_between_readings()
+
+    def queries(self):
+        """
+        The default schema also times the single-$group extremes strategy;
+        with hourly buckets, the pipelines over the raw readings as well.
+        """
+        queries = super().queries()
+        if self.client.schema_mode == "default":
+            queries["sensor_extremes_per_device[group]"] = \
+                lambda: self.client.get_sensor_extremes_per_device(source="raw", strategy="group")
+        if self.client.buckets:
+            queries.update({
+                "avg_reading_per_device_per_day[raw]":
+                    lambda: self.client.get_avg_reading_per_device_per_day(source="raw"),
+                "sensor_extremes_per_device[raw]":
+                    lambda: self.client.get_sensor_extremes_per_device(source="raw"),
+                "avg_time_between_readings[raw]":
+                    lambda: self.client.get_avg_time_between_readings(source="raw"),
+            })
+        return queries
+
+    def close(self):
+        self.client.client.close()
+
+
+class ClickHouseWorkload(IoTWorkload):
+    """
+    columnar=False falls back to the per-row buffered insert path.
+    rollups=False leaves out the AggregatingMergeTree rollups and their views.
+    http=True also runs the queries through the async HTTP client, one at a
+    time and all at once.
+    """
+    name = "clickhouse"
+
+    def __init__(self, chunk_size=100_000, batch_size=100_000, columnar=True, http=False, **client_kwargs):
+        super().__init__(chunk_size)
+        ClickHouseClient = import_client("Clickhouse", "clickhouse_client").ClickHouseClient
+        self.client = ClickHouseClient(batch_size=batch_size, **client_kwargs)
+        self.columnar = columnar
+        self.http = None
+        if http:
+            http_client = import_client("Clickhouse", "clickhouse_http_client")
+            self.http = http_client.AsyncClickHouseHTTPClient()
+            self.loop = asyncio.new_event_loop()
+
+    def create_schema(self):
+        self.client.create_schema()
+
+    def ingest_metadata(self, generator):
+        for row in as_rows(generator.devices(), ["id", "name", "location", "status"]):
+            self.client.insert_device(*row)
+        for row in as_rows(generator.sensors(), ["id", "device_id", "type"]):
+            self.client.insert_sensor(*row)
+        for row in as_rows(generator.alerts(), ["id", "device_id", "alert_type", "alert_time", "description"]):
+            self.client.insert_alert(*row)
+
+    def ingest_readings(self, chunk):
+        if self.columnar:
+            self.client.insert_readings_columnar({
+                "id": uuid_strings(chunk["id"]),
+                "sensor_id": uuid_strings(chunk["sensor_id"]),
+                "device_id": uuid_strings(chunk["device_id"]),
+                "reading_value": chunk["reading_value"],
+                "reading_time": chunk["reading_time"],
+            })
+            return
+        for row in as_rows(chunk, ["id", "sensor_id", "device_id", "reading_value", "reading_time"]):
+            self.client.insert_reading(*row)
+
+    def finish_ingest(self):
+        self.client.force_flush()
+
+    def avg_reading_per_device_per_day(self):
+        return self.client.get_avg_reading_per_device_per_day()
+
+    def sensor_extremes_per_device(self):
+        return self.client.get_sensor_extremes_per_device()
+
+    def avg_time_between_readings(self):
+        return self.client.get_avg_time_between_readings()
+
+    def queries(self):
+        """
+        Rollup reads next to raw scans, and the window-function queries next
+        to the argMax/aggregate versions, with and without the projection.
+        """
+        queries = super().queries()
+        queries.update({
+            "sensor_extremes_per_device[argmax]":
+                lambda: self.client.get_sensor_extremes_per_device(strategy="argmax", source="raw"),
+            "avg_time_between_readings[aggregate]":
+                lambda: self.client.get_avg_time_between_readings(strategy="aggregate"),
+        })
+        if self.client.projections:
+            queries.update({
+                "sensor_extremes_per_device[argmax,no_projection]":
+                    lambda: self.client.get_sensor_extremes_per_device(
+                        strategy="argmax", use_projection=False, source="raw"),
+                "avg_time_between_readings[aggregate,no_projection]":
+                    lambda: self.client.get_avg_time_between_readings(strategy="aggregate", use_projection=False),
+            })
+        if self.client.rollups:
+            queries.update({
+                "avg_reading_per_device_per_day[raw]":
+                    lambda: self.client.get_avg_reading_per_device_per_day(source="raw"),
+                "sensor_extremes_per_device[raw]":
+                    lambda: self.client.get_sensor_extremes_per_device(source="raw"),
+            })
+        if self.http:
+            sql = self.client.analytical_queries()
+            for name, (query, settings) in sql.items():
+                queries[f"{name}[http]"] = \
+                    lambda query=query, settings=settings: self.loop.run_until_complete(
+                        self.http.query_df(query, settings))
+            queries["all_queries[http,concurrent]"] = lambda: self.loop.run_until_complete(self.http.query_many(sql))
+        return queries
+
+    def stats(self):
+        stats = {"rollups": self.client.get_rollup_stats()}
+        if self.http:
+            stats["http"] = self.http.get_stats()
+        return stats
+
+    def close(self):
+        self.client.close()
+        if self.http:
+            self.loop.run_until_complete(self.http.close())
+            self.loop.close()
+
+
+class InfluxWorkload(IoTWorkload):
+    """
+    line_protocol=False falls back to building one Point per reading.
+    downsample=True adds the rollup buckets/tasks and backfills them after ingest.
+    """
+    name = "influx"
+
+    def __init__(self, chunk_size=100_000, batch_size=100_000, line_protocol=True, **client_kwargs):
+        super().__init__(chunk_size)
+        InfluxDBClient2 = import_client("Influx DB 2", "influx_db_client").InfluxDBClient2
+        self.client = InfluxDBClient2(batch_size=batch_size, **client_kwargs)
+        self.line_protocol = line_protocol
+
+    def create_schema(self):
+        self.client.create_buckets(
+            retention_days_readings=0, retention_days_meta=0, retention_days_alerts=0)
+
+    def ingest_metadata(self, generator):
+        for row in as_rows(generator.devices(), ["id", "name", "location", "status"]):
+            self.client.insert_device(*row)
+        for row in as_rows(generator.sensors(), ["id", "device_id", "type"]):
+            self.client.insert_sensor(*row)
+        for row in as_rows(generator.alerts(), ["id", "device_id", "alert_type", "alert_time", "description"]):
+            self.client.insert_alert(*row)
+
+    def ingest_readings(self, chunk):
+        if self.line_protocol:
+            self.client.insert_readings_lines(chunk)
+            return
+        for row in as_rows(chunk, ["id", "sensor_id", "device_id", "reading_value", "reading_time"]):
+            self.client.insert_reading(*row)
+
+    def finish_ingest(self):
+        self.client.force_flush()
+        if self.client.downsample:
+            self.client.backfill_downsampling()
+
+    def avg_reading_per_device_per_day(self):
+        return self.client.get_avg_reading_per_device_per_day()
+
+    def sensor_extremes_per_device(self):
+        return self.client.get_sensor_extremes_per_device()
+
+    def avg_time_between_readings(self):
+        return self.client.get_avg_time_between_readings()
+
+    def queries(self):
+        queries = super().queries()
+        queries["sensor_extremes_per_device[stream]"] = self.client.get_sensor_extremes_per_device_streaming
+        if self.client.downsample:
+            queries.update({
+                "avg_reading_per_device_per_day[raw]":
+                    lambda: self.client.get_avg_reading_per_device_per_day(source="raw"),
+                "sensor_extremes_per_device[raw]":
+                    lambda: self.client.get_sensor_extremes_per_device(source="raw"),
+                "avg_time_between_readings[raw]":
+                    lambda: self.client.get_avg_time_between_readings(source="raw"),
+            })
+        return queries
+
+    def stats(self):
+        return {"writes": self.client.get_write_stats()}
+
+    def close(self):
+        self.client.close()
+
+
+class TimescaleWorkload(IoTWorkload):
+    """With copy_format='binary', reading chunks are COPYed straight from the generator arrays."""
+    name = "timescale"
+    result_columns = {
+        "avg_reading_per_device_per_day": ["device_id", "device_name", "status", "day", "avg_reading"],
+        "sensor_extremes_per_device": ["device_id", "device_name", "sensor_id", "sensor_type",
+                                       "reading_value", "reading_time", "extreme_type"],
+        "avg_time_between_readings": ["sensor_id", "avg_seconds_between_readings"],
+    }
+
+    def __init__(self, chunk_size=100_000, batch_size=100_000, **client_kwargs):
+        super().__init__(chunk_size)
+        TimescaleClient = import_client("Timescale DB", "timescale_client").TimescaleClient
+        self.client = TimescaleClient(batch_size=batch_size, **client_kwargs)
+
+    def create_schema(self):
+        self.client.create_schema()
+
+    def ingest_metadata(self, generator):
+        for row in as_rows(generator.devices(), ["id", "name", "location", "status"], uuid.UUID):
+            self.client.insert_device(*row)
+        for row in as_rows(generator.sensors(), ["id", "device_id", "type"], uuid.UUID):
+            self.client.insert_sensor(*row)
+        for row in as_rows(generator.alerts(), ["id", "device_id", "alert_type", "alert_time", "description"], uuid.UUID):
+            self.client.insert_alert(*row)
+
+    def ingest_readings(self, chunk):
+        if self.client.copy_format == "binary" and self.client.copy_workers == 1:
+            self.client.copy_readings_columnar(chunk)
+            return
+        for row in as_rows(chunk, ["id", "sensor_id", "reading_value", "reading_time"], uuid.UUID):
+            self.client.add_reading_to_batch(*row)
+
+    def finish_ingest(self):
+        self.client.force_flush()
+        if self.client.rollups:
+            self.client.refresh_rollups()
+        self.client.compress_chunks()
+
+    def avg_reading_per_device_per_day(self):
+        return self.client.average_reading_per_device_per_day()
+
+    def sensor_extremes_per_device(self):
+        return self.client.sensor_extremes_per_device()
+
+    def avg_time_between_readings(self):
+        return self.client.average_time_between_readings_per_sensor()
+
+    def queries(self):
+        """With continuous aggregates present, also time the raw-table scans for comparison."""
+        queries = super().queries()
+        if self.client.has_rollups():
+            queries.update({
+                "avg_reading_per_device_per_day[raw]":
+                    lambda: self.client.average_reading_per_device_per_day(source="raw"),
+                "sensor_extremes_per_device[raw]":
+                    lambda: self.client.sensor_extremes_per_device(source="raw"),
+                "avg_time_between_readings[raw]":
+                    lambda: self.client.average_time_between_readings_per_sensor(source="raw"),
+            })
+        return queries
+
+    def disk_bytes(self):
+        return self.client.get_storage_stats()["total_bytes"]
+
+    def stats(self):
+        return {"copy_workers": self.client.get_copy_stats(), "rollups": self.client.rollup_stats,
+                "storage": self.client.get_storage_stats()}
+
+    def close(self):
+        self.client.close()
+
+
+class CassandraWorkload(IoTWorkload):
+    """
+    Cassandra has no server-side joins or cross-partition GROUP BY. With the
+    default schema the queries are a paged full scan through the streaming
+    aggregator; schema_mode="bucketed" answers them from per-sensor-day
+    partitions merged client-side.
+    Pass concurrency=... / batch_by_partition=True to tune the async ingest.
+    """
+    name = "cassandra"
+
+    def __init__(self, chunk_size=100_000, **client_kwargs):
+        super().__init__(chunk_size)
+        CassandraClient = import_client("Cassandra", "cassandra_client").CassandraClient
+        self.client = CassandraClient(**client_kwargs)
+
+    def create_schema(self):
+        self.client.create_schema()
+
+    def ingest_metadata(self, generator):
+        for row in as_rows(generator.devices(), ["id", "name", "location", "status"], uuid.UUID):
+            self.client.insert_device(*row)
+        for row in as_rows(generator.sensors(), ["id", "device_id", "type"], uuid.UUID):
+            self.client.insert_sensor(*row)
+        for row in as_rows(generator.alerts(), ["id", "device_id", "alert_type", "alert_time", "description"], uuid.UUID):
+            self.client.insert_alert(*row)
+
+    def ingest_readings(self, chunk):
+        self.client.insert_readings(list(as_rows(chunk, ["id", "sensor_id", "reading_time", "reading_value"], uuid.UUID)))
+
+    def avg_reading_per_device_per_day(self):
+        return self.client.get_avg_reading_per_device_per_day()
+
+    def sensor_extremes_per_device(self):
+        return self.client.get_sensor_extremes_per_device()
+
+    def avg_time_between_readings(self):
+        return self.client.get_avg_time_between_readings()
+
+    def stats(self):
+        return {"ingest": self.client.get_ingest_stats()}
+
+    def close(self):
+        self.client.cluster.shutdown()
+
+
+class DorisWorkload(IoTWorkload):
+    """
+    stream_load=True sends each chunk as a Stream Load (stream_load_concurrency at once) instead of INSERTs.
+    schema= picks one of DorisClient.SCHEMA_VARIANTS; pass reset_schema=True when comparing them on one server.
+    """
+    name = "doris"
+    result_columns = {
+        "avg_reading_per_device_per_day": ["device_id", "day", "avg_value"],
+        "sensor_extremes_per_device": ["device_id", "sensor_id", "max_value", "min_value"],
+        "avg_time_between_readings": ["sensor_id", "avg_seconds"],
+    }
+
+    def __init__(self, chunk_size=100_000, batch_size=10_000, stream_load=False, stream_load_concurrency=4,
+                 **client_kwargs):
+        super().__init__(chunk_size)
+        DorisClient = import_client("Apache Doris", "doris_client").DorisClient
+        self.client = DorisClient(batch_size=batch_size, **client_kwargs)
+        self.loader = self.daily_loader = None
+        if stream_load:
+            DorisStreamLoader = import_client("Apache Doris", "doris_stream_loader").DorisStreamLoader
+            params = self.client.conn_params
+            auth = {"fe_host": params["host"], "user": params["user"], "password": params["password"]}
+            on_loaded = None
+            if self.client.schema == "rollup":
+                # Folded only once the readings are committed, on the same writer thread
+                self.daily_loader = DorisStreamLoader(table="sensor_readings_daily", columns=DorisClient.DAILY_COLUMNS,
+                                                      concurrency=1, label_prefix="iot_daily", **auth)
+                on_loaded = self._load_daily
+            self.loader = DorisStreamLoader(columns=self.client.reading_columns, concurrency=stream_load_concurrency,
+                                            on_loaded=on_loaded, **auth)
+
+    def _load_daily(self, label, chunk):
+        """Stream-load the daily rows of a committed chunk; the derived label keeps retries idempotent."""
+        self.daily_loader.load(self.client.daily_frame(pd.DataFrame({
+            "device_id": uuid_strings(chunk["device_id"]),
+            "sensor_id": uuid_strings(chunk["sensor_id"]),
+            "reading_time": chunk["reading_time"].astype("datetime64[us]"),
+            "reading_value": chunk["reading_value"],
+        })), label=f"{label}_daily")
+
+    def create_schema(self):
+        self.client.create_schema()
+
+    def ingest_metadata(self, generator):
+        for row in as_rows(generator.devices(), ["id", "name", "location", "status"]):
+            self.client.insert_device(*row)
+        for row in as_rows(generator.sensors(), ["id", "device_id", "type"]):
+            self.client.insert_sensor(*row)
+        for row in as_rows(generator.alerts(), ["id", "device_id", "alert_time", "alert_type", "description"]):
+            self.client.insert_alert(*row)
+
+    def ingest_readings(self, chunk):
+        if self.loader:
+            self.loader.submit(chunk)
+            return
+        for row in as_rows(chunk, self.client.reading_columns):
+            self.client.bulk_insert_reading(*row)
+
+    def finish_ingest(self):
+        if self.loader:
+            self.loader.drain()
+        self.client.force_flush()
+        self.client.conn.commit()
+
+    def avg_reading_per_device_per_day(self):
+        return self.client.get_avg_reading_per_device_per_day()
+
+    def sensor_extremes_per_device(self):
+        return self.client.get_sensor_extremes_per_device()
+
+    def avg_time_between_readings(self):
+        return self.client.get_avg_time_between_readings()
+
+    def stats(self):
+        stats = {"stream_load": self.loader.get_stats()} if self.loader else {}
+        if self.daily_loader:
+            stats["stream_load_daily"] = self.daily_loader.get_stats()
+        return stats
+
+    def close(self):
+        for loader in (self.loader, self.daily_loader):
+            if loader:
+                loader.close()
+        self.client.close()
+
+
+WORKLOADS = {
+    w.name: w for w in (
+        MongoWorkload, ClickHouseWorkload, InfluxWorkload,
+        TimescaleWorkload, CassandraWorkload, DorisWorkload,
+    )
+}
+
+
+def make_workload(name, **options):
+    if name not in WORKLOADS:
+        raise ValueError(f"Unknown engine {name!r}, expected one of {sorted(WORKLOADS)}")
+    return WORKLOADS[name](**options)
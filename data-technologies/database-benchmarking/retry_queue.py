@@ -0,0 +1,191 @@
+"""
+Bounded retry pipeline for batch writes that may fail.
+
+Without it a client that keeps a failed batch in its buffer and keeps
+appending to it grows without bound during an outage, then retries one giant
+write. Here every flushed batch is handed over as a finished payload and the
+buffer is emptied either way:
+
+- A failed batch waits in a bounded in-memory queue. New writes are not even
+  attempted until an exponential backoff (with jitter) expires, so a down
+  server is not hammered and the producer never sleeps.
+- When more than max_batches are waiting, the oldest ones spill to an
+  append-only file (length-prefixed records). Without a spill file, or once
+  it reaches max_spill_bytes, they are dropped and counted.
+- After the next successful write, the in-memory queue is replayed first and
+  then the spill file, each oldest batch first. The spilled batches are
+  older than the queued ones, so overall batches are not resent in the
+  order they failed.
+- The spill file starts with the queue's target (e.g. the bucket it writes
+  to). A file left over by an earlier run is replayed only if the target
+  matches; a file written for another target raises instead of leaking old
+  batches into a different destination.
+
+Replays can send a batch twice, so this is only safe for idempotent writes
+(e.g. InfluxDB points, where the same series and timestamp overwrite).
+"""
+import collections
+import os
+import random
+import struct
+import time
+
+_RECORD = struct.Struct("<II")  # points, payload bytes
+_MAGIC = b"RQSPILL1"
+_TARGET = struct.Struct("<I")  # target bytes, after _MAGIC
+
+
+class RetryQueue:
+    """
+    write: write(payload) sends one batch (bytes) and raises on failure.
+    max_batches: failed batches kept in memory before spilling.
+    spill_path: append-only overflow file, or None to drop overflow.
+    spill_target: identifies where the batches go; stored in the spill file
+    and checked before a leftover file is replayed.
+    base_delay/max_delay: backoff bounds in seconds, doubled per failure.
+    """
+
+    def __init__(self, write, max_batches=8, spill_path=None, max_spill_bytes=1 << 30,
+                 base_delay=0.5, max_delay=30.0, name="retry", spill_target=""):
+        self.write = write
+        self.max_batches = max_batches
+        self.spill_path = spill_path
+        self.spill_target = spill_target or ""
+        self.max_spill_bytes = max_spill_bytes
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.name = name
+        self._pending = collections.deque()  # (payload, points)
+        self._spill_offset = 0  # replayed up to here
+        self._delay = 0.0
+        self._retry_at = 0.0
+        self.last_error = None
+        self.stats = {"written": 0, "failures": 0, "retried": 0, "spilled": 0, "replayed": 0, "dropped": 0}
+        if self._spill_size():
+            self._spill_offset = self._read_header()
+
+    def _header(self):
+        target = self.spill_target.encode()
+        return _MAGIC + _TARGET.pack(len(target)) + target
+
+    def _read_header(self):
+        """Check a leftover spill file was written for this target; returns where its records start."""
+        with open(self.spill_path, "rb") as f:
+            magic = f.read(len(_MAGIC))
+            size = f.read(_TARGET.size)
+            if magic != _MAGIC or len(size) < _TARGET.size:
+                raise ValueError(f"{self.spill_path} is not a spill file; move it away or pass another spill_path")
+            target = f.read(_TARGET.unpack(size)[0]).decode()
+            if target != self.spill_target:
+                raise ValueError(f"{self.spill_path} holds batches for {target!r}, not {self.spill_target!r}; "
+                                 f"move it away or pass another spill_path")
+            return f.tell()
+
+    def _spill_size(self):
+        if self.spill_path is None or not os.path.exists(self.spill_path):
+            return 0
+        return os.path.getsize(self.spill_path)
+
+    @property
+    def backlog(self):
+        """True while failed batches are waiting in memory or on disk."""
+        return bool(self._pending) or self._spill_size() > self._spill_offset
+
+    def submit(self, payload, points):
+        """Send one batch, or queue it if the server is failing. Never raises."""
+        if self.backlog:
+            if time.monotonic() < self._retry_at:
+                self._enqueue(payload, points)
+                return False
+            if not self._replay():
+                self._enqueue(payload, points)
+                return False
+        if self._send(payload, points):
+            return True
+        self._enqueue(payload, points)
+        return False
+
+    def _send(self, payload, points, retry=False):
+        try:
+            self.write(payload)
+        except Exception as e:
+            self.last_error = e
+            self.stats["failures"] += 1
+            self._delay = min(self.max_delay, max(self.base_delay, 2 * self._delay))
+            self._retry_at = time.monotonic() + self._delay * random.uniform(0.5, 1.0)
+            print(f"{self.name}: write of {points} points failed, retrying in {self._delay:.1f}s: {e}")
+            return False
+        self._delay = 0.0
+        self.stats["written"] += points
+        if retry:
+            self.stats["retried"] += points
+        return True
+
+    def _enqueue(self, payload, points):
+        self._pending.append((payload, points))
+        while len(self._pending) > self.max_batches:
+            self._spill(*self._pending.popleft())
+
+    def _spill(self, payload, points):
+        if self.spill_path is None or self._spill_size() + len(payload) > self.max_spill_bytes:
+            self.stats["dropped"] += points
+            return
+        with open(self.spill_path, "ab") as f:
+            if not f.tell():
+                header = self._header()
+                f.write(header)
+                self._spill_offset = len(header)
+            f.write(_RECORD.pack(points, len(payload)))
+            f.write(payload)
+        self.stats["spilled"] += points
+
+    def _spilled_records(self):
+        """Yield (end offset, payload, points) from the replay position; a torn tail record ends the file."""
+        with open(self.spill_path, "rb") as f:
+            f.seek(self._spill_offset)
+            while True:
+                header = f.read(_RECORD.size)
+                if len(header) < _RECORD.size:
+                    return
+                points, size = _RECORD.unpack(header)
+                payload = f.read(size)
+                if len(payload) < size:
+                    return
+                yield f.tell(), payload, points
+
+    def _replay(self):
+        """Retry queued batches, then spilled ones; stops at the first failure."""
+        while self._pending:
+            payload, points = self._pending[0]
+            if not self._send(payload, points, retry=True):
+                return False
+            self._pending.popleft()
+
+        if self._spill_size() > self._spill_offset:
+            for end, payload, points in self._spilled_records():
+                if not self._send(payload, points, retry=True):
+                    return False
+                self._spill_offset = end
+                self.stats["replayed"] += points
+            # Fully replayed: start the file over
+            os.remove(self.spill_path)
+            self._spill_offset = 0
+        return True
+
+    def drain(self, timeout=60.0):
+        """Block, backing off, until the backlog is written or timeout expires. Returns True if empty."""
+        deadline = time.monotonic() + timeout
+        while self.backlog:
+            wait = self._retry_at - time.monotonic()
+            if wait > 0:
+                if time.monotonic() + wait > deadline:
+                    return False
+                time.sleep(wait)
+            if not self._replay() and time.monotonic() >= deadline:
+                return False
+        return True
+
+    def get_stats(self):
+        return dict(self.stats, pending_batches=len(self._pending),
+                    spill_bytes=max(0, self._spill_size() - self._spill_offset),
+                    last_error=repr(self.last_error) if self.last_error else None)
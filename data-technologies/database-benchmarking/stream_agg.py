@@ -0,0 +1,225 @@
+"""
+Client-side streaming aggregation for the three IoT analytical queries.
+
+Some engines can't answer the queries server-side (Cassandra without the
+bucketed schema) or only awkwardly (Influx joining per-device extremes back
+to sensors). StreamingAggregator consumes readings from any cursor, iterator
+or generator in chunks and keeps only per-group state, so memory is bounded by
+sensors + device-days rather than by the number of readings:
+
+    daily mean per device       sum / count per (device, UTC day)
+    extremes per device         max / min (+ time) per sensor, reduced per device
+    mean gap per sensor         (last - first) / (count - 1), which equals the
+                                mean of consecutive gaps and is order independent
+
+Each chunk is reduced with one lexsort plus NumPy reduceat/bincount kernels.
+Fed with IoTDataGenerator.iter_readings() it is also the correctness oracle
+for verify.py.
+"""
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from iot_data import US_PER_DAY, US_PER_SECOND
+
+
+def _keys(col):
+    """Sortable per-row ids: 16-byte voids for (n, 16) uint8 so only unique ids get converted."""
+    if isinstance(col, np.ndarray) and col.ndim == 2:
+        return np.ascontiguousarray(col, dtype=np.uint8).view("V16").ravel()
+    col = np.asarray(col)
+    return col if col.dtype.kind == "U" else col.astype(str)
+
+
+def _epoch_us(col):
+    """int64 epoch microseconds from epoch-us ints, datetime64 or (tz-aware) datetimes."""
+    col = np.asarray(col)
+    if col.dtype.kind in "iu":
+        return col.astype(np.int64, copy=False)
+    if col.dtype.kind != "M":
+        col = pd.to_datetime(col, utc=True).tz_convert(None).values
+    return col.astype("datetime64[us]").view(np.int64)
+
+
+def canonical_id(key):
+    """Canonical lower-case UUID string for raw bytes, uuid.UUID or str ids."""
+    if isinstance(key, (bytes, np.void)):
+        return str(uuid.UUID(bytes=bytes(key)))
+    try:
+        return str(uuid.UUID(str(key)))
+    except ValueError:
+        return str(key)
+
+
+class StreamingAggregator:
+    """
+    sensor_devices: optional {sensor_id: device_id} for sources that don't
+    carry device_id per reading. Ids may be raw (n, 16) uint8 arrays,
+    uuid.UUID or str; results always use canonical UUID strings.
+
+    update() takes one chunk: a dict of arrays or a DataFrame with sensor_id,
+    reading_time, reading_value and (unless sensor_devices is given)
+    device_id. consume() drives update() over a whole source.
+    """
+
+    # Per-sensor state arrays and their initial values
+    _STATE = {
+        "_sensor_device": (-1, np.int64),
+        "_count": (0, np.int64),
+        "_first": (np.iinfo(np.int64).max, np.int64),
+        "_last": (np.iinfo(np.int64).min, np.int64),
+        "_max": (-np.inf, np.float64),
+        "_max_time": (0, np.int64),
+        "_min": (np.inf, np.float64),
+        "_min_time": (0, np.int64),
+    }
+
+    def __init__(self, sensor_devices=None):
+        self._sensor_codes, self._sensor_keys = {}, []
+        self._device_codes, self._device_keys = {}, []
+        for name, (fill, dtype) in self._STATE.items():
+            setattr(self, name, np.full(64, fill, dtype=dtype))
+        self._daily = {}  # (device code << 32 | epoch day) -> [sum, count]
+        self.rows = 0
+        if sensor_devices:
+            sensors = list(sensor_devices)
+            codes = self._codes(self._sensor_codes, self._sensor_keys, _keys([str(s) for s in sensors]))
+            self._grow(len(self._sensor_keys))
+            self._sensor_device[codes] = self._codes(
+                self._device_codes, self._device_keys, _keys([str(sensor_devices[s]) for s in sensors]))
+
+    def _grow(self, n):
+        """Make room for n sensors, doubling the state arrays."""
+        have = len(self._count)
+        if n <= have:
+            return
+        pad = max(n, 2 * have) - have
+        for name, (fill, dtype) in self._STATE.items():
+            setattr(self, name, np.concatenate([getattr(self, name), np.full(pad, fill, dtype=dtype)]))
+
+    @staticmethod
+    def _codes(table, keys, col):
+        """Dense integer codes for a column of ids, registering unseen ids as canonical UUID strings."""
+        uniques, inverse = np.unique(col, return_inverse=True)
+        lookup = np.empty(len(uniques), dtype=np.int64)
+        for i, key in enumerate(uniques.tolist()):
+            key = canonical_id(key)
+            code = table.get(key)
+            if code is None:
+                code = table[key] = len(keys)
+                keys.append(key)
+            lookup[i] = code
+        return lookup[inverse.ravel()]
+
+    def update(self, chunk):
+        times = _epoch_us(chunk["reading_time"])
+        n = len(times)
+        if not n:
+            return
+        values = np.asarray(chunk["reading_value"], dtype=np.float64)
+        sensors = self._codes(self._sensor_codes, self._sensor_keys, _keys(chunk["sensor_id"]))
+        self._grow(len(self._sensor_keys))
+        if "device_id" in chunk:
+            devices = self._codes(self._device_codes, self._device_keys, _keys(chunk["device_id"]))
+            self._sensor_device[sensors] = devices
+        else:
+            devices = self._sensor_device[sensors]
+            if (devices < 0).any():
+                raise ValueError("chunk has no device_id and a sensor is missing from sensor_devices")
+
+        # Per sensor: sort by (sensor, value) so each group's min/max sit at its ends
+        order = np.lexsort((values, sensors))
+        s_sorted = sensors[order]
+        starts = np.flatnonzero(np.r_[True, s_sorted[1:] != s_sorted[:-1]])
+        ends = np.r_[starts[1:], n] - 1
+        group = s_sorted[starts]
+        t_sorted = times[order]
+
+        self._count[group] += np.diff(np.r_[starts, n])
+        self._first[group] = np.minimum(self._first[group], np.minimum.reduceat(t_sorted, starts))
+        self._last[group] = np.maximum(self._last[group], np.maximum.reduceat(t_sorted, starts))
+
+        hi, lo = order[ends], order[starts]
+        better = values[hi] > self._max[group]
+        self._max[group[better]] = values[hi][better]
+        self._max_time[group[better]] = times[hi][better]
+        better = values[lo] < self._min[group]
+        self._min[group[better]] = values[lo][better]
+        self._min_time[group[better]] = times[lo][better]
+
+        # Per device-day sum/count
+        day_keys = (devices << 32) | (times // US_PER_DAY)
+        uniques, inverse = np.unique(day_keys, return_inverse=True)
+        inverse = inverse.ravel()
+        sums = np.bincount(inverse, weights=values)
+        counts = np.bincount(inverse)
+        for key, s, c in zip(uniques.tolist(), sums.tolist(), counts.tolist()):
+            acc = self._daily.setdefault(key, [0.0, 0])
+            acc[0] += s
+            acc[1] += c
+        self.rows += n
+
+    def consume(self, source, columns=None, chunk_size=100_000):
+        """
+        Feed a whole source. Without columns, source yields chunks (dicts of
+        arrays or DataFrames). With columns, it yields row tuples (e.g. a DB
+        cursor) which are batched into chunks of chunk_size rows.
+        """
+        if columns is None:
+            for chunk in source:
+                self.update(chunk)
+            return self
+        batch = []
+        for row in source:
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                self.update(dict(zip(columns, (list(c) for c in zip(*batch)))))
+                batch = []
+        if batch:
+            self.update(dict(zip(columns, (list(c) for c in zip(*batch)))))
+        return self
+
+    # Results, as DataFrames with the column names the engine clients use
+    def avg_reading_per_device_per_day(self, since=None):
+        """since: optional first day (date or 'YYYY-MM-DD') to keep."""
+        keys = np.fromiter(self._daily, dtype=np.int64, count=len(self._daily))
+        acc = np.array(list(self._daily.values()), dtype=np.float64).reshape(-1, 2)
+        days = (keys & 0xFFFFFFFF).astype("datetime64[D]")
+        df = pd.DataFrame({
+            "device_id": [self._device_keys[d] for d in (keys >> 32).tolist()],
+            "day": days,
+            "avg_reading": acc[:, 0] / acc[:, 1],
+        })
+        if since is not None:
+            df = df[df["day"] >= np.datetime64(since, "D")]
+        return df.sort_values(["device_id", "day"], ignore_index=True)
+
+    def sensor_extremes_per_device(self):
+        seen = np.flatnonzero(self._count[:len(self._sensor_keys)] > 0)
+        rows = []
+        for device in np.unique(self._sensor_device[seen]).tolist():
+            sensors = seen[self._sensor_device[seen] == device]
+            hi = sensors[np.argmax(self._max[sensors])]
+            lo = sensors[np.argmin(self._min[sensors])]
+            rows.append((device, hi, self._max[hi], self._max_time[hi], "MAX"))
+            rows.append((device, lo, self._min[lo], self._min_time[lo], "MIN"))
+        df = pd.DataFrame({
+            "device_id": [self._device_keys[r[0]] for r in rows],
+            "sensor_id": [self._sensor_keys[r[1]] for r in rows],
+            "reading_value": np.array([r[2] for r in rows], dtype=np.float64),
+            "reading_time": np.array([r[3] for r in rows], dtype=np.int64).astype("datetime64[us]"),
+            "extreme_type": [r[4] for r in rows],
+        })
+        return df.sort_values(["device_id", "reading_value"], ascending=[True, False], ignore_index=True)
+
+    def avg_time_between_readings(self):
+        n = len(self._sensor_keys)
+        count = self._count[:n]
+        keep = np.flatnonzero(count > 1)
+        gaps = (self._last[keep] - self._first[keep]) / (count[keep] - 1) / US_PER_SECOND
+        df = pd.DataFrame({
+            "sensor_id": [self._sensor_keys[i] for i in keep.tolist()],
+            "avg_seconds": gaps,
+        })
+        return df.sort_values("sensor_id", ignore_index=True)
@@ -0,0 +1,260 @@
+"""
+Result-equivalence harness for the IoT workload.
+
+The three test queries are written separately for every engine and do not
+all ask the same question. Benchmarking them against each other is only fair
+if they return the same answer, so this script loads the same seeded dataset
+into each engine, runs every query and diffs the result against the
+reference computed client-side by stream_agg.py:
+
+    python verify.py clickhouse timescale doris --readings 1000
+    python verify.py timescale --skip-ingest --now 2025-06-01T12:00:00 --json verify.json
+    python verify.py influx:downsample=True --variants   # rollup path and [raw] alike
+
+Engine results are normalised to canonical frames (UUID strings, UTC days and
+timestamps, float values, one naming per column) before the diff. Keys are
+compared exactly; values within --rtol and the time tolerances, since several
+engines store milliseconds or whole seconds. The exit status is 1 if any
+query disagrees, so the script can gate changes to the query code.
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from benchmark import parse_spec
+from iot_data import IoTDataGenerator
+from iot_workload import QUERY_NAMES, WORKLOADS, make_workload
+from stream_agg import StreamingAggregator, canonical_id
+
+# Engine column names -> canonical names
+ALIASES = {
+    "avg_value": "avg_reading",
+    "avg_seconds_between_readings": "avg_seconds",
+    "rank_type": "extreme_type",
+    "extreme": "extreme_type",
+}
+
+# (keys, compared values) of each canonical frame
+SHAPES = {
+    "avg_reading_per_device_per_day": (["device_id", "day"], ["avg_reading"]),
+    "sensor_extremes_per_device": (["device_id", "extreme_type"], ["reading_value", "sensor_id", "reading_time"]),
+    "avg_time_between_readings": (["sensor_id"], ["avg_seconds"]),
+}
+
+# Known differences in how an engine's query is written, shown when its check fails
+KNOWN_DRIFT = {
+    ("doris", "avg_reading_per_device_per_day"): "no 7-day window: returns every day",
+    ("doris", "sensor_extremes_per_device"): "returns MAX/MIN per sensor, not the per-device extremes",
+}
+
+
+def to_frame(result, columns=None):
+    """DataFrame from whatever a client query returned (DataFrame, dicts, tuples)."""
+    if isinstance(result, pd.DataFrame):
+        return result.copy()
+    rows = list(result)
+    if rows and isinstance(rows[0], dict):
+        return pd.DataFrame(rows)
+    return pd.DataFrame(rows, columns=columns)
+
+
+def utc(col):
+    return pd.to_datetime(col, utc=True).dt.tz_convert(None)
+
+
+def normalize(query, df):
+    """Canonical frame for one query, plus notes on shape differences."""
+    notes = []
+    df = df.rename(columns=ALIASES)
+    if query == "sensor_extremes_per_device" and "extreme_type" not in df and "max_value" in df:
+        notes.append(f"one row per sensor ({len(df)} rows) with max_value/min_value columns")
+        df = pd.concat([
+            df.assign(extreme_type="MAX", reading_value=df["max_value"]),
+            df.assign(extreme_type="MIN", reading_value=df["min_value"]),
+        ], ignore_index=True)
+
+    keys, values = SHAPES[query]
+    missing = [c for c in keys if c not in df]
+    if missing:
+        raise ValueError(f"result has no {missing} column(s); got {list(df.columns)}")
+    for col in [c for c in values if c not in df]:
+        notes.append(f"no {col} column")
+    df = df[[c for c in keys + values if c in df]].copy()
+
+    for col in ("device_id", "sensor_id"):
+        if col in df:
+            df[col] = [canonical_id(v) for v in df[col]]
+    if "day" in df:
+        df["day"] = utc(df["day"].astype(str)).dt.normalize()
+    if "reading_time" in df:
+        df["reading_time"] = utc(df["reading_time"])
+    for col in ("avg_reading", "reading_value", "avg_seconds"):
+        if col in df:
+            df[col] = df[col].astype(float)
+    return df, notes
+
+
+def diff_frames(query, expected, got, rtol, time_tol_s, gap_tol_s):
+    """Outer-join on the query's keys and count missing, extra and differing rows."""
+    keys, values = SHAPES[query]
+    merged = expected.merge(got, on=keys, how="outer", suffixes=("_expected", "_got"), indicator=True)
+    both = merged[merged["_merge"] == "both"]
+    report = {
+        "expected_rows": len(expected),
+        "rows": len(got),
+        "missing": int((merged["_merge"] == "left_only").sum()),
+        "extra": int((merged["_merge"] == "right_only").sum()),
+        "mismatched": 0,
+        "max_error": {},
+        "samples": [],
+    }
+
+    bad = np.zeros(len(both), dtype=bool)
+    for col in values:
+        if f"{col}_got" not in both:
+            continue
+        exp, act = both[f"{col}_expected"], both[f"{col}_got"]
+        if col == "reading_time":
+            err = (act - exp).dt.total_seconds().abs().to_numpy()
+            wrong = err > time_tol_s
+        elif col == "sensor_id":
+            err = None
+            wrong = (exp != act).to_numpy()
+        else:
+            err = (act - exp).abs().to_numpy()
+            atol = gap_tol_s if col == "avg_seconds" else 0.0
+            wrong = ~np.isclose(act.to_numpy(), exp.to_numpy(), rtol=rtol, atol=atol)
+        if err is not None and len(err):
+            report["max_error"][col] = float(np.nanmax(err))
+        bad |= wrong
+
+    report["mismatched"] = int(bad.sum())
+    samples = pd.concat([merged[merged["_merge"] != "both"].head(3), both[bad].head(3)])
+    report["samples"] = json.loads(samples.drop(columns="_merge").to_json(orient="records", date_format="iso"))
+    report["status"] = "ok" if not (report["missing"] or report["extra"] or report["mismatched"]) else "mismatch"
+    return report
+
+
+def reference(generator, days):
+    """
+    Oracle answers from the generator itself. The daily-average window starts
+    `days` days before today's UTC date, not the dataset's reference time:
+    every engine filters on its own clock (today() - 7, now()).
+    """
+    agg = StreamingAggregator().consume(generator.iter_readings())
+    today = datetime.now(timezone.utc).date()
+    if generator.now.date() != today:
+        print(f"Note: the dataset reference time ({generator.now.date()}) is not today ({today}); the engines "
+              f"and the reference both keep days from {today - timedelta(days=days)} on")
+    since = today - timedelta(days=days)
+    return {
+        "avg_reading_per_device_per_day": agg.avg_reading_per_device_per_day(since=since),
+        "sensor_extremes_per_device": agg.sensor_extremes_per_device(),
+        "avg_time_between_readings": agg.avg_time_between_readings(),
+    }
+
+
+def verify_engine(spec, generator, expected, args):
+    name, options = parse_spec(spec)
+    results = {}
+    workload = make_workload(name, **options)
+    try:
+        if not args.skip_ingest:
+            workload.create_schema()
+            workload.ingest(generator)
+        queries = workload.queries()
+        checked = [query for query in QUERY_NAMES if not args.queries or query in args.queries]
+        if args.variants:
+            # e.g. avg_reading_per_device_per_day[raw], checked against the same reference
+            checked = [label for query in checked for label in queries
+                       if label == query or label.startswith(f"{query}[")]
+        for label in checked:
+            query = label.split("[", 1)[0]
+            try:
+                raw = queries[label]()
+                got, notes = normalize(query, to_frame(raw, workload.result_columns.get(query)))
+                exp = normalize(query, expected[query])[0]
+                report = diff_frames(query, exp, got, args.rtol, args.time_tol, args.gap_tol)
+                report["notes"] = notes
+            except NotImplementedError:
+                report = {"status": "unsupported"}
+            except Exception as e:
+                report = {"status": "error", "error": repr(e)}
+            if report["status"] == "mismatch" and (name, query) in KNOWN_DRIFT:
+                report["known_drift"] = KNOWN_DRIFT[name, query]
+            results[label] = report
+    finally:
+        workload.close()
+    return results
+
+
+def print_report(spec, results):
+    for query, r in results.items():
+        line = f"[{spec}] {query:34} {r['status'].upper():11}"
+        if r["status"] in ("ok", "mismatch"):
+            line += (f" rows {r['rows']}/{r['expected_rows']} missing {r['missing']} "
+                     f"extra {r['extra']} differing {r['mismatched']}")
+        elif r["status"] == "error":
+            line += f" {r['error']}"
+        print(line)
+        for note in r.get("notes", []):
+            print(f"    note: {note}")
+        if r.get("known_drift"):
+            print(f"    drift: {r['known_drift']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("engines", nargs="+", metavar="ENGINE[:key=value,...]",
+                        help=f"engines to verify, one of {sorted(WORKLOADS)}")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--sensors", type=int, default=10, help="sensors per device")
+    parser.add_argument("--readings", type=int, default=1_000, help="readings per sensor")
+    parser.add_argument("--alerts", type=int, default=5, help="alerts per device")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--now", help="dataset reference time (ISO, UTC); required to match an earlier ingest")
+    parser.add_argument("--days", type=int, default=7, help="window of the daily-average query")
+    parser.add_argument("--skip-ingest", action="store_true", help="verify data that is already loaded")
+    parser.add_argument("--queries", nargs="*", default=None)
+    parser.add_argument("--variants", action="store_true",
+                        help="also check each query's variants, e.g. [raw] next to the rollup path")
+    parser.add_argument("--rtol", type=float, default=1e-6, help="relative tolerance for values")
+    parser.add_argument("--time-tol", type=float, default=1.0, help="seconds allowed on reading_time")
+    parser.add_argument("--gap-tol", type=float, default=1.0, help="seconds allowed on the mean gap")
+    parser.add_argument("--json", dest="json_path", help="write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    generator = IoTDataGenerator(
+        devices=args.devices, sensors_per_device=args.sensors, readings_per_sensor=args.readings,
+        alerts_per_device=args.alerts, seed=args.seed,
+        now=datetime.fromisoformat(args.now) if args.now else None)
+    print(f"Dataset reference time: {generator.now.isoformat()} "
+          f"(pass --now {generator.now.isoformat()} to re-verify with --skip-ingest)")
+    expected = reference(generator, args.days)
+
+    report = {}
+    for spec in args.engines:
+        try:
+            report[spec] = verify_engine(spec, generator, expected, args)
+        except Exception as e:
+            report[spec] = {"error": {"status": "error", "error": repr(e)}}
+        print_report(spec, report[spec])
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"Wrote {args.json_path}")
+
+    failed = [spec for spec, queries in report.items()
+              if any(r["status"] not in ("ok", "unsupported") for r in queries.values())]
+    if failed:
+        print(f"\nResults differ from the reference for: {', '.join(failed)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())